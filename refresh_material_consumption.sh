@@ -0,0 +1,5 @@
+#!/bin/bash
+source /home/www/.virtualenvs/garage/bin/activate
+cd /home/www/garage_backend/src
+python manage.py refresh_material_consumption
+deactivate
@@ -0,0 +1,40 @@
+import re
+
+from django.db import connection
+from django.db import transaction
+from django.test.utils import CaptureQueriesContext
+
+SEQ_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+
+
+class RollbackQueries(Exception):
+    pass
+
+
+def capture_select_queries(func) -> list:
+    """Выполняет функцию и возвращает SQL всех SELECT запросов, изменения в БД откатываются"""
+    try:
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as context:
+                func()
+            raise RollbackQueries
+    except RollbackQueries:
+        pass
+
+    return [query["sql"] for query in context.captured_queries if query["sql"].lstrip().upper().startswith("SELECT")]
+
+
+def explain_query(sql: str, seqscan: bool = True) -> str:
+    """План запроса EXPLAIN (ANALYZE, BUFFERS) в текстовом виде"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if not seqscan:
+                # Планировщик выберет индекс, если он есть: находит отсутствующие индексы на маленькой базе
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def get_seq_scans(plan: str, tables) -> list:
+    """Таблицы из списка tables, которые читаются последовательным сканированием"""
+    return [table for table in SEQ_SCAN_RE.findall(plan) if table in tables]
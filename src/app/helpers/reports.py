@@ -1,7 +1,11 @@
 import os
 from copy import copy
+from functools import lru_cache
+from io import BytesIO
 from typing import Optional
 
+from openpyxl import Workbook
+from openpyxl import load_workbook
 from openpyxl.styles import Alignment
 from openpyxl.styles import Border
 from openpyxl.styles import Font
@@ -31,6 +35,22 @@ def get_module_path(module):
     return os.path.abspath(os.path.dirname(module))
 
 
+@lru_cache(maxsize=None)
+def read_template(template_path: str) -> bytes:
+    """Файл шаблона отчёта, прочитанный один раз на процесс"""
+    with open(template_path, "rb") as file:
+        return file.read()
+
+
+def get_template_workbook(template_path: str) -> Workbook:
+    """
+    Новая книга из шаблона отчёта, закэшированного в памяти процесса, без чтения файла на каждый отчёт.
+    Книга openpyxl не копируется deepcopy (списки стилей и размеры строк теряют состояние),
+    поэтому кэшируется содержимое файла, а книга для каждого отчёта разбирается из него
+    """
+    return load_workbook(BytesIO(read_template(template_path)))
+
+
 def set_cell(
     cell, value, number_format=None, font=None, alignment=None, wrap_text: Optional[bool] = True, allow_null=False
 ):
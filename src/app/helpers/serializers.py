@@ -1,10 +1,109 @@
+from django.db.models import Count
+from django.db.models import Exists
+from django.db.models import IntegerField
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+
+from rest_framework.serializers import PrimaryKeyRelatedField
+from rest_framework.serializers import ReadOnlyField
+
 from authentication.utils import get_current_user
 
 
-class CurrentUserDefault(object):   
+class CurrentUserDefault(object):
     requires_context = True
 
     def __call__(self, serializer_field):
         request = serializer_field.context["request"]
         user = get_current_user(request)
-        return user
\ No newline at end of file
+        return user
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который берёт объекты из общего кэша контекста, заполненного
+    ListSerializer строк (set_bulk_related_objects), вместо запроса на каждую строку
+    """
+
+    def to_internal_value(self, data):
+        objects = self.context.get("bulk_related_objects", {}).get(self.field_name, {})
+        if str(data).isdigit() and int(data) in objects:
+            return objects[int(data)]
+        return super().to_internal_value(data)
+
+
+def set_bulk_related_objects(context: dict, **objects):
+    """Добавляет в кэш BulkPrimaryKeyRelatedField объекты {pk: объект} по именам полей"""
+    context.setdefault("bulk_related_objects", {}).update(objects)
+
+
+def get_lines_pk(lines: list, field_name: str):
+    return {int(line[field_name]) for line in lines if str(line.get(field_name)).isdigit()}
+
+
+class RelatedAnnotationField(ReadOnlyField):
+    """
+    Поле по обратной связи related_name (ForeignKey или ManyToManyField на модель сериализатора).
+    EagerLoadingMixin добавляет его аннотацией к queryset списка, и весь список читается одним запросом.
+    Без аннотации (сериализатор вне такого view) значение считается отдельным запросом для объекта
+    """
+
+    def __init__(self, related_name: str, **kwargs):
+        self.related_name = related_name
+        super().__init__(**kwargs)
+
+    def get_related_queryset(self, model):
+        relation = model._meta.get_field(self.related_name)
+        return relation.related_model.objects.filter(**{relation.field.name: OuterRef("pk")}).order_by()
+
+    def get_annotation(self, model):
+        raise NotImplementedError
+
+    def get_value(self, instance):
+        raise NotImplementedError
+
+    def get_attribute(self, instance):
+        if hasattr(instance, self.field_name):
+            return getattr(instance, self.field_name)
+        return self.get_value(instance)
+
+
+class RelatedExistsField(RelatedAnnotationField):
+    """Есть ли связанные записи, например delete_forbidden"""
+
+    def get_annotation(self, model):
+        return Exists(self.get_related_queryset(model))
+
+    def get_value(self, instance):
+        return getattr(instance, self.related_name).exists()
+
+
+class RelatedCountField(RelatedAnnotationField):
+    """Количество связанных записей, считается подзапросом, поэтому не влияет на GROUP BY списка"""
+
+    def get_annotation(self, model):
+        relation = model._meta.get_field(self.related_name)
+        count = (
+            self.get_related_queryset(model)
+            .values(relation.field.name)
+            .annotate(related_count=Count("pk"))
+            .values("related_count")
+        )
+        return Coalesce(Subquery(count, output_field=IntegerField()), Value(0))
+
+    def get_value(self, instance):
+        return getattr(instance, self.related_name).count()
+
+
+def annotate_related_fields(queryset, serializer_class):
+    """Аннотации для полей RelatedAnnotationField сериализатора"""
+    annotations = {
+        field_name: field.get_annotation(queryset.model)
+        for field_name, field in getattr(serializer_class, "_declared_fields", {}).items()
+        if isinstance(field, RelatedAnnotationField)
+    }
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset
@@ -1,11 +1,15 @@
 import json
+import threading
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
+THREADS_COUNT = 12
+
 
 def get_test_user():
     user_model = get_user_model()
@@ -37,3 +41,29 @@ class DecimalEncoder(json.JSONEncoder):
         if isinstance(obj, Decimal):
             return float(obj)
         return json.JSONEncoder.default(self, obj)
+
+
+def run_concurrently(func, count: int = THREADS_COUNT) -> list:
+    """
+    Запускает func(number) в count потоках одновременно (для TransactionTestCase),
+    у каждого потока своё соединение с БД. Возвращает результаты или исключения потоков
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(number):
+        try:
+            barrier.wait()
+            results[number] = func(number)
+        except Exception as e:
+            results[number] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
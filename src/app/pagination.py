@@ -1,10 +1,151 @@
+import json
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from datetime import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.utils.urls import remove_query_param
 from rest_framework.utils.urls import replace_query_param
 
 
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder отбрасывает микросекунды, а курсору нужно точное значение
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination:
+    """
+    Постраничный вывод по ключу сортировки (keyset): следующая страница выбирается условием
+    "после последней строки" вместо OFFSET и без COUNT(*), время не зависит от номера страницы.
+    Ключ - поля сортировки queryset (sortField/sortOrder или Meta.ordering) и pk
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор"
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    @staticmethod
+    def get_ordering(queryset) -> list:
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if any(not isinstance(field, str) for field in ordering):
+            raise ValidationError(
+                {"pagination": ("Постраничный вывод по курсору поддерживает сортировку только по полям")}
+            )
+
+        ordering = [field for field in ordering if field != "?"]
+        if not {"pk", "-pk", "id", "-id"} & set(ordering):
+            ordering.append("pk")
+        return ordering
+
+    @staticmethod
+    def get_after_lookup(field: str, descending: bool, value):
+        # NULL в PostgreSQL при сортировке по возрастанию идут последними, по убыванию - первыми
+        if value is None:
+            return Q(**{f"{field}__isnull": False}) if descending else Q(pk__in=[])
+        if descending:
+            return Q(**{f"{field}__lt": value})
+        return Q(**{f"{field}__gt": value}) | Q(**{f"{field}__isnull": True})
+
+    @staticmethod
+    def get_equal_lookup(field: str, value):
+        if value is None:
+            return Q(**{f"{field}__isnull": True})
+        return Q(**{field: value})
+
+    def get_keyset_filter(self, keys: list, values: list):
+        """(a, b, c) после (x, y, z): a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)"""
+        keyset_filter = Q(pk__in=[])
+        equal = Q()
+        for (key, descending), value in zip(keys, values):
+            keyset_filter |= equal & self.get_after_lookup(key, descending, value)
+            equal &= self.get_equal_lookup(key, value)
+        return keyset_filter
+
+    def encode_cursor(self, values: list) -> str:
+        return urlsafe_b64encode(json.dumps(values, cls=CursorEncoder).encode()).decode()
+
+    def decode_cursor(self, cursor: str, keys: list) -> list:
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        ordering = self.get_ordering(queryset)
+
+        # Условие строится по аннотациям, чтобы не добавлять JOIN для полей связанных моделей
+        keys = [(f"keyset_{number}", field.startswith("-")) for number, field in enumerate(ordering)]
+        queryset = queryset.annotate(
+            **{key: F(field.lstrip("-")) for (key, _), field in zip(keys, ordering)}
+        ).order_by(*ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(keys, self.decode_cursor(cursor, keys)))
+            except (DjangoValidationError, TypeError, ValueError):
+                # Значения изменённого курсора не приводятся к типам полей сортировки
+                raise NotFound(self.invalid_cursor_message)
+
+        # Лишняя строка показывает, есть ли следующая страница
+        rows = list(queryset[: self.page_size + 1])
+        page = rows[: self.page_size]
+
+        self.next_cursor = None
+        if len(rows) > self.page_size:
+            self.next_cursor = self.encode_cursor([getattr(page[-1], key) for key, _ in keys])
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.get_full_path(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "links": {"next": self.get_next_link(), "previous": None},
+                "cursor": self.next_cursor,
+                "page_size": self.page_size,
+                "results": data,
+            }
+        )
+
+
 class BasePagination(PageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы,
+    с параметром pagination=cursor - по курсору (KeysetPagination) для длинных списков
+    """
+
+    pagination_query_param = "pagination"
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.pagination_query_param) == "cursor":
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request)
+
+        return super().paginate_queryset(queryset, request, view)
+
     def get_next_link(self):
         if not self.page.has_next():
             return None
@@ -34,6 +175,9 @@ class BasePagination(PageNumberPagination):
         return self.page.previous_page_number()
 
     def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+
         return Response(
             {
                 "links": {"next": self.get_next_link(), "previous": self.get_previous_link()},
@@ -121,6 +121,9 @@ DATETIME_FORMAT = " ".join((DATE_FORMAT, TIME_FORMAT))
 SERIALIZER_DATE_PARAMS = dict(format="%d.%m.%Y", input_formats=["%d.%m.%Y", "iso-8601"])
 SERIALIZER_DATETIME_PARAMS = dict(format="%d.%m.%Y %H:%M", input_formats=["%d.%m.%Y %H:%M", "iso-8601"])
 
+# Нумерация заказ-нарядов заново с начала каждого года
+ORDER_NUMBER_PER_YEAR = env("ORDER_NUMBER_PER_YEAR", cast=bool, default=False)
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
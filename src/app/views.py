@@ -1,3 +1,6 @@
+from app.helpers.serializers import annotate_related_fields
+
+
 class EagerLoadingMixin:
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -7,4 +10,7 @@ class EagerLoadingMixin:
         ):
             queryset = serializer_class.setup_eager_loading(queryset)
 
+        # Поля RelatedExistsField, RelatedCountField считаются в том же запросе
+        queryset = annotate_related_fields(queryset, serializer_class)
+
         return queryset
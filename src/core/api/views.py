@@ -4,6 +4,7 @@ from django.db.models import CharField
 from django.db.models import Q
 from django.db.models import Value as V
 from django.db.models.functions import Concat
+from django.db.transaction import atomic
 from django.shortcuts import get_object_or_404
 
 from rest_framework.generics import GenericAPIView
@@ -67,7 +68,12 @@ class CarListView(GenericAPIView):
 
 
 class CarDetailView(RetrieveModelMixin, UpdateModelMixin, GenericAPIView):
-    """ТС (без удаления, изменить можно только поле - name)"""
+    """
+    ТС (без удаления, изменить можно только поле - name)
+
+    Params: change_tags_in_material(bool) - переименовать тег ТС в совместимости материалов,
+    dry_run(bool) - ничего не менять, вернуть количество материалов, которые изменятся
+    """
 
     serializer_class = CarDetailSerializer
     queryset = Car.objects.all()
@@ -82,11 +88,16 @@ class CarDetailView(RetrieveModelMixin, UpdateModelMixin, GenericAPIView):
     def get(self, request, *args, **kwargs):
         return self.retrieve(self, request, *args, **kwargs)
 
+    @atomic
     def patch(self, request, *args, **kwargs):
         pk = self.kwargs.get("pk")
         car = get_object_or_404(self.queryset, pk=pk)
         old_name = car.name
 
+        if self.request.query_params.get("dry_run") == "true":
+            name = request.data.get("name", old_name)
+            return Response({"materials_count": update_car_tag_material(old_name, name, dry_run=True)})
+
         updated_car = self.partial_update(request, *args, **kwargs)
 
         change_tags_in_material = self.request.query_params.get("change_tags_in_material")
@@ -3,6 +3,10 @@ from django.urls import reverse
 from rest_framework import status
 
 from app.helpers.testing import AuthorizationAPITestCase
+from warehouse.models import Material
+from warehouse.tests.factory import MaterialCategoryFactory
+from warehouse.tests.factory import MaterialFactory
+from warehouse.tests.factory import UnitFactory
 
 from ...api.serializers import CarDetailSerializer
 from ...api.serializers import CarShortSerializer
@@ -123,6 +127,33 @@ class CarApiTestCase(AuthorizationAPITestCase):
         self.assertNotEqual(car_result.kod_driver, payload["kod_driver"])
         self.assertNotEqual(car_result.date_decommissioned, payload["date_decommissioned"])
 
+    def test_update_change_tags_in_material(self):
+        car = CarFactory(name="ГАЗель")
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material1 = MaterialFactory(name="Фильтр", unit=unit, category=category, compatbility=["ГАЗель", "КАМАЗ"])
+        material2 = MaterialFactory(name="Свеча", unit=unit, category=category, compatbility=["ГАЗель", "ГАЗель Next"])
+        material3 = MaterialFactory(name="Колесо", unit=unit, category=category, compatbility=["КАМАЗ"])
+
+        url = reverse("car-detail", kwargs={"pk": car.pk})
+
+        response = self.client.patch(f"{url}?dry_run=true", data={"name": "ГАЗель Next"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(response.data, {"materials_count": 2})
+        self.assertEqual(Car.objects.get(pk=car.pk).name, "ГАЗель")
+        self.assertEqual(Material.objects.get(pk=material1.pk).compatbility, ["ГАЗель", "КАМАЗ"])
+
+        response = self.client.patch(f"{url}?change_tags_in_material=true", data={"name": "ГАЗель Next"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(Car.objects.get(pk=car.pk).name, "ГАЗель Next")
+
+        material1 = Material.objects.get(pk=material1.pk)
+        self.assertEqual(material1.compatbility, ["ГАЗель Next", "КАМАЗ"])
+        self.assertEqual(material1.compatbility_search, Material.get_compatbility_search(material1.compatbility))
+        self.assertEqual(Material.objects.get(pk=material2.pk).compatbility, ["ГАЗель Next"])
+        self.assertEqual(Material.objects.get(pk=material2.pk).compatbility_search, "ГАЗЕЛЬ NEXT")
+        self.assertEqual(Material.objects.get(pk=material3.pk).compatbility, ["КАМАЗ"])
+
     def test_delete_forbidden(self):
         car = CarFactory()
 
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Order
+from .models import OrderNumberCounter
 from .models import OrderWork
 from .models import OrderWorkMechanic
 from .models import Post
@@ -29,6 +30,10 @@ class WorkAdmin(admin.ModelAdmin):
     pass
 
 
+class OrderNumberCounterAdmin(admin.ModelAdmin):
+    pass
+
+
 class OrderWorkAdmin(admin.ModelAdmin):
     pass
 
@@ -40,6 +45,7 @@ class OrderWorkMechanicAdmin(admin.ModelAdmin):
 admin.site.register(Reason, ReasonAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Order, OrderAdmin)
+admin.site.register(OrderNumberCounter, OrderNumberCounterAdmin)
 admin.site.register(WorkCategory, WorkCategoryAdmin)
 admin.site.register(Work, WorkAdmin)
 admin.site.register(OrderWork, OrderWorkAdmin)
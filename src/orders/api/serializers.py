@@ -1,17 +1,34 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.transaction import atomic
 
-from drf_writable_nested.serializers import WritableNestedModelSerializer
 from rest_framework.serializers import DateTimeField
 from rest_framework.serializers import HiddenField
+from rest_framework.serializers import ListSerializer
 from rest_framework.serializers import ModelSerializer
 from rest_framework.serializers import SerializerMethodField
+from rest_framework.serializers import ValidationError
 
+from app.helpers.serializers import BulkPrimaryKeyRelatedField
 from app.helpers.serializers import CurrentUserDefault
+from app.helpers.serializers import RelatedCountField
+from app.helpers.serializers import RelatedExistsField
+from app.helpers.serializers import get_lines_pk
+from app.helpers.serializers import set_bulk_related_objects
+from core.constants import DRIVER
+from core.constants import MECHANIC
+from core.models import Employee
 from warehouse.api.serializers import TurnoverOrderNestedWriteSerializer
 from warehouse.constants import EXPENSE
+from warehouse.helpers.material_balance import set_default_expense_prices
+from warehouse.helpers.material_reservation import check_remains_at_dates
+from warehouse.helpers.material_reservation import get_expense_quantities
+from warehouse.helpers.material_reservation import reserve_materials
+from warehouse.helpers.turnover_bulk_create import bulk_create_turnovers
+from warehouse.models import Turnover
 
 from ..constants import ORDER_STATUS
-from ..helpers.validators_order import validator_mechanics_order_work
+from ..helpers.order_works_write import save_order_works
 from ..helpers.validators_order import validator_order_works
 from ..models import Order
 from ..models import OrderWork
@@ -33,14 +50,11 @@ class ReasonSerializer(ModelSerializer):
 
 
 class ReasonListSerializer(ReasonSerializer):
-    delete_forbidden = SerializerMethodField()
+    delete_forbidden = RelatedExistsField("orders")
 
     class Meta(ReasonSerializer.Meta):
         fields = ReasonSerializer.Meta.fields + ("delete_forbidden",)
 
-    def get_delete_forbidden(self, obj):
-        return obj.orders.all().exists()
-
 
 class PostSerializer(ModelSerializer):
     class Meta:
@@ -52,14 +66,11 @@ class PostSerializer(ModelSerializer):
 
 
 class PostListSerializer(PostSerializer):
-    delete_forbidden = SerializerMethodField()
+    delete_forbidden = RelatedExistsField("orders")
 
     class Meta(PostSerializer.Meta):
         fields = PostSerializer.Meta.fields + ("delete_forbidden",)
 
-    def get_delete_forbidden(self, obj):
-        return obj.orders.all().exists()
-
 
 class OrderListSerializer(ModelSerializer):
     date_begin = DateTimeField(**settings.SERIALIZER_DATE_PARAMS)
@@ -86,6 +97,10 @@ class OrderListSerializer(ModelSerializer):
         )
         read_only_fields = ("number",)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related("car", "post").prefetch_related("reasons")
+
     def get_status_name(self, obj):
         return dict((x, y) for x, y in ORDER_STATUS).get(obj.status)
 
@@ -105,10 +120,12 @@ class OrderListSerializer(ModelSerializer):
         return ""
 
     def get_reason_name(self, obj):
-        return ', '.join([x.name for x in obj.reasons.all()])
+        return ", ".join([x.name for x in obj.reasons.all()])
 
 
 class OrderWorkMechanickSerializer(ModelSerializer):
+    # Тип работника из кэша проверяется в validator_order_works, без кэша - запросом
+    mechanic = BulkPrimaryKeyRelatedField(queryset=Employee.objects.filter(type__in=(MECHANIC, DRIVER)))
     mechanic_short_fio = SerializerMethodField()
 
     class Meta:
@@ -119,12 +136,39 @@ class OrderWorkMechanickSerializer(ModelSerializer):
             "mechanic_short_fio",
             "time_minutes",
         )
+        extra_kwargs = {
+            "pk": {"read_only": False, "required": False, "allow_null": True},
+        }
 
     def get_mechanic_short_fio(self, obj):
         return obj.mechanic.short_fio
 
 
-class OrderWorkSerializer(WritableNestedModelSerializer):
+class OrderWorkBulkListSerializer(ListSerializer):
+    """Загружает работы и слесарей всех строк двумя запросами перед проверкой строк"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            lines = [line for line in data if isinstance(line, dict)]
+            mechanics = [
+                mechanic
+                for line in lines
+                if isinstance(line.get("mechanics"), list)
+                for mechanic in line["mechanics"]
+                if isinstance(mechanic, dict)
+            ]
+            set_bulk_related_objects(
+                self.context,
+                work=Work.objects.in_bulk(get_lines_pk(lines, "work")),
+                mechanic=Employee.objects.in_bulk(get_lines_pk(mechanics, "mechanic")),
+            )
+        return super().to_internal_value(data)
+
+
+class OrderWorkSerializer(ModelSerializer):
+    """Работа заказ-наряда, записывается в OrderDetailSerializer (helpers.order_works_write)"""
+
+    work = BulkPrimaryKeyRelatedField(queryset=Work.objects.all())
     mechanics = OrderWorkMechanickSerializer(many=True)
     work_name = SerializerMethodField()
     work_category = SerializerMethodField()
@@ -141,15 +185,19 @@ class OrderWorkSerializer(WritableNestedModelSerializer):
             "note",
             "mechanics",
         )
+        extra_kwargs = {
+            "pk": {"read_only": False, "required": False, "allow_null": True},
+        }
+        list_serializer_class = OrderWorkBulkListSerializer
 
     def get_work_name(self, obj):
         return obj.work.name
 
     def get_work_category(self, obj):
-        return obj.work.category.pk
+        return obj.work.category_id
 
 
-class OrderDetailSerializer(WritableNestedModelSerializer):
+class OrderDetailSerializer(ModelSerializer):
     user = HiddenField(default=CurrentUserDefault())
     created = DateTimeField(**settings.SERIALIZER_DATETIME_PARAMS, read_only=True)
     updated = DateTimeField(**settings.SERIALIZER_DATETIME_PARAMS, read_only=True)
@@ -200,10 +248,9 @@ class OrderDetailSerializer(WritableNestedModelSerializer):
         if order_works:
             validator_order_works(order_works)
 
-            for order_work in order_works:
-                mechanics = order_work.get("mechanics")
-                if mechanics:
-                    validator_mechanics_order_work(mechanics, order_work.get("work").pk)
+        turnovers_from_order = data.get("turnovers_from_order")
+        if turnovers_from_order:
+            set_default_expense_prices(turnovers_from_order)
 
         return data
 
@@ -215,23 +262,71 @@ class OrderDetailSerializer(WritableNestedModelSerializer):
         validated_data = super().run_validation(data=data)
         return validated_data
 
+    @atomic
+    def create(self, validated_data):
+        reasons = validated_data.pop("reasons", [])
+        order_works = validated_data.pop("order_works", [])
+        turnovers_from_order = validated_data.pop("turnovers_from_order", [])
+
+        # Остатки списываемых материалов блокируются до записи заказ-наряда и проверяются вместе
+        reserve_materials(get_expense_quantities(turnovers_from_order))
+        check_remains_at_dates(turnovers_from_order)
+
+        order = self.Meta.model.objects.create(**validated_data)
+        order.reasons.set(reasons)
+        save_order_works(order, order_works, is_new=True)
+        self.create_turnovers(order, turnovers_from_order)
+
+        return order
+
+    @atomic
     def update(self, instance, validated_data):
         """
         Списанные материлы можно только добавить, редактировать их нельзя,
         удалить можно только удалив оборот (turnover), если заказ-наряд не выполнен
         """
-        turnovers_from_order = validated_data.pop("turnovers_from_order")
+        reasons = validated_data.pop("reasons", None)
+        order_works = validated_data.pop("order_works", None)
+        # Сохраняем только вновь добавленные материалы
+        turnovers_from_order = [
+            turnover_material
+            for turnover_material in validated_data.pop("turnovers_from_order", [])
+            if turnover_material.get("pk") is None
+        ]
+        reserve_materials(get_expense_quantities(turnovers_from_order))
+        check_remains_at_dates(turnovers_from_order)
 
-        instance = super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+
+        instance.save()
+
+        if reasons is not None:
+            instance.reasons.set(reasons)
+        if order_works is not None:
+            save_order_works(instance, order_works)
 
-        # Сохраняем только вновь добавленные материалы
         for turnover_material in turnovers_from_order:
-            if "pk" not in turnover_material or turnover_material["pk"] is None:
-                turnover_material["user"] = instance.user
-                instance.turnovers_from_order.create(**turnover_material)
+            turnover_material["user"] = instance.user
+        self.create_turnovers(instance, turnovers_from_order)
 
         return instance
 
+    def create_turnovers(self, order, turnovers_from_order):
+        """Списанные материалы записываются одним пакетом, остатки уже заблокированы и проверены"""
+        turnovers = []
+        for turnover_material in turnovers_from_order:
+            turnover_material.pop("pk", None)
+            turnover_material["order"] = order
+            turnovers.append(Turnover(**turnover_material))
+
+        if turnovers:
+            try:
+                bulk_create_turnovers(turnovers, check_remains=False)
+            except DjangoValidationError as e:
+                # Проверка оборотов при записи - ошибка данных запроса (400), а не сервера
+                raise ValidationError({"turnovers_from_order": e.message_dict})
+
 
 class WorkCategorySerializer(ModelSerializer):
     class Meta:
@@ -243,14 +338,11 @@ class WorkCategorySerializer(ModelSerializer):
 
 
 class WorkCategoryListSerializer(WorkCategorySerializer):
-    work_count = SerializerMethodField()
+    work_count = RelatedCountField("works")
 
     class Meta(WorkCategorySerializer.Meta):
         fields = WorkCategorySerializer.Meta.fields + ("work_count",)
 
-    def get_work_count(self, obj):
-        return Work.objects.filter(category=obj).count()
-
 
 class WorkSerializer(ModelSerializer):
     class Meta:
@@ -263,10 +355,7 @@ class WorkSerializer(ModelSerializer):
 
 
 class WorkListSerializer(WorkSerializer):
-    delete_forbidden = SerializerMethodField()
+    delete_forbidden = RelatedExistsField("order_works")
 
     class Meta(WorkSerializer.Meta):
         fields = WorkSerializer.Meta.fields + ("delete_forbidden",)
-
-    def get_delete_forbidden(self, obj):
-        return obj.order_works.all().exists()
@@ -1,3 +1,4 @@
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import status
@@ -11,7 +12,9 @@ from rest_framework.response import Response
 
 from app.helpers.database import get_period_filter_lookup
 from app.views import EagerLoadingMixin
+from warehouse.helpers.material_reservation import InsufficientStockError
 
+from ..constants import ORDER_PRINT_MAX_COUNT
 from ..helpers.order_general_search import order_general_search
 from ..models import Order
 from ..models import Post
@@ -19,6 +22,7 @@ from ..models import Reason
 from ..models import Work
 from ..models import WorkCategory
 from ..reports.order_excel import OrderExcelCreator
+from ..reports.order_excel import OrdersBatchExcelCreator
 from .serializers import OrderDetailSerializer
 from .serializers import OrderListSerializer
 from .serializers import PostListSerializer
@@ -31,7 +35,7 @@ from .serializers import WorkListSerializer
 from .serializers import WorkSerializer
 
 
-class ReasonListView(CreateModelMixin, GenericAPIView):
+class ReasonListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """Список причин"""
 
     serializer_class = ReasonSerializer
@@ -83,7 +87,7 @@ class ReasonDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin,
         return self.destroy(request, *args, **kwargs)
 
 
-class PostListView(CreateModelMixin, GenericAPIView):
+class PostListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """Список постов"""
 
     queryset = Post.objects.all()
@@ -130,7 +134,9 @@ class OrderListView(EagerLoadingMixin, ListAPIView, CreateModelMixin):
     Список заказ-нарядов
 
     Filters: reasons(list(int)), status(int), date_begin(date_str), date_end(date_str)
-    Search's: general_search (number, car__state_number, car__name, note)
+    Search's: general_search (number, car__state_number, car__name, reasons__name, note) по поисковому документу,
+    без sortField сортировка по релевантности
+    Pagination: page или pagination=cursor, cursor (без COUNT, для прокрутки длинных списков)
     """
 
     queryset = Order.objects.all()
@@ -185,7 +191,10 @@ class OrderListView(EagerLoadingMixin, ListAPIView, CreateModelMixin):
         return queryset
 
     def post(self, request, *args, **kwargs):
-        return self.create(request, *args, **kwargs)
+        try:
+            return self.create(request, *args, **kwargs)
+        except InsufficientStockError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_409_CONFLICT)
 
 
 class OrderDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, GenericAPIView):
@@ -205,29 +214,111 @@ class OrderDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, G
         return self.retrieve(self, request, *args, **kwargs)
 
     def put(self, request, *args, **kwargs):
-        return self.partial_update(request, *args, **kwargs)
+        try:
+            return self.partial_update(request, *args, **kwargs)
+        except InsufficientStockError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_409_CONFLICT)
 
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
 
 class OrderExportExcelView(GenericAPIView):
-    """Экспорт в Excel заказ-наряда"""
+    """
+    Экспорт в Excel заказ-наряда
+
+    Params: pk(int), без pk - пустой бланк; download=true - файл в ответе из памяти,
+    иначе ссылка на временный файл в media/temp
+    """
+
     queryset = Order.objects.all()
 
-    def get(self, request, *args, **kwargs):     
+    def get(self, request, *args, **kwargs):
         try:
             order = None
             pk = self.request.query_params.get("pk")
-            if pk:    
-                order = self.get_queryset().get(pk=pk)
+            if pk:
+                order = OrderExcelCreator.setup_eager_loading(self.get_queryset()).get(pk=pk)
+
+            creator = OrderExcelCreator(order)
+            if self.request.query_params.get("download") == "true":
+                return FileResponse(creator.to_buffer(), as_attachment=True, filename=creator.get_filename())
 
-            return Response({"file": request.build_absolute_uri(OrderExcelCreator(order)())}, status=status.HTTP_200_OK)            
+            return Response({"file": request.build_absolute_uri(creator())}, status=status.HTTP_200_OK)
+        except Exception:
+            return Response({"errors": {"file": ("Ошибка формирования файла!")}}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderBatchExportExcelView(GenericAPIView):
+    """
+    Печать нескольких заказ-нарядов одним файлом
+
+    Params: orders(list(int) через запятую) или фильтры statuses(list(int)), post(int), date_begin(date_str),
+    date_end(date_str); output=zip - ZIP архив с книгой на заказ-наряд, иначе одна книга с листом на заказ-наряд
+    """
+
+    queryset = Order.objects.all()
+
+    def get_queryset(self):
+        queryset = OrderExcelCreator.setup_eager_loading(super().get_queryset())
+
+        orders = self.request.query_params.get("orders")
+        if orders:
+            queryset = queryset.filter(pk__in=[int(order_pk) for order_pk in orders.split(",")])
+
+        statuses = self.request.query_params.get("statuses")
+        if statuses:
+            queryset = queryset.filter(status__in=[int(status) for status in statuses.split(",")])
+
+        post = self.request.query_params.get("post")
+        if post:
+            queryset = queryset.filter(post=post)
+
+        date_begin = self.request.query_params.get("date_begin")
+        date_end = self.request.query_params.get("date_end")
+        if date_begin or date_end:
+            queryset = queryset.filter(get_period_filter_lookup("date_begin", date_begin, date_end, True))
+
+        return queryset.order_by("number")
+
+    def get(self, request, *args, **kwargs):
+        params = ("orders", "statuses", "post", "date_begin", "date_end")
+        if not any(self.request.query_params.get(param) for param in params):
+            return Response(
+                {"errors": {"orders": ("Укажите заказ-наряды или фильтр")}}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        orders = self.request.query_params.get("orders")
+        if orders and not all(order_pk.strip().isdigit() for order_pk in orders.split(",")):
+            return Response(
+                {"errors": {"orders": ("Список заказ-нарядов должен содержать id через запятую")}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            orders = list(self.get_queryset()[: ORDER_PRINT_MAX_COUNT + 1])
+            if not orders:
+                return Response(
+                    {"errors": {"orders": ("Заказ-наряды не найдены")}}, status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(orders) > ORDER_PRINT_MAX_COUNT:
+                return Response(
+                    {"errors": {"orders": (f"Не более {ORDER_PRINT_MAX_COUNT} заказ-нарядов за раз")}},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            creator = OrdersBatchExcelCreator(orders)
+            if self.request.query_params.get("output") == "zip":
+                return FileResponse(creator.to_zip_buffer(), as_attachment=True, filename=creator.get_filename("zip"))
+
+            return FileResponse(
+                creator.to_workbook_buffer(), as_attachment=True, filename=creator.get_filename("xlsx")
+            )
         except Exception:
             return Response({"errors": {"file": ("Ошибка формирования файла!")}}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class WorkCategoryListView(CreateModelMixin, GenericAPIView):
+class WorkCategoryListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """Список категорий работ"""
 
     queryset = WorkCategory.objects.all()
@@ -269,7 +360,7 @@ class WorkCategoryDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelM
         return self.destroy(request, *args, **kwargs)
 
 
-class WorkListView(CreateModelMixin, GenericAPIView):
+class WorkListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """
     Список работ
 
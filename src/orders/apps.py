@@ -6,3 +6,6 @@ class OrdersConfig(AppConfig):
     name = "orders"
     verbose_name = "Заказ-наряд"
     verbose_name_plural = "Заказ-наряды"
+
+    def ready(self):
+        from orders import receivers
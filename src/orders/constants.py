@@ -8,3 +8,16 @@ REQUEST = 1
 WORK = 2
 COMPLETED = 3
 ORDER_STATUS = ((REQUEST, "Заяка"), (WORK, "В работе"), (COMPLETED, "Выполнен"))
+
+# При нумерации по годам (ORDER_NUMBER_PER_YEAR) номер - год * ORDER_NUMBER_YEAR_FACTOR + номер в году,
+# например 202600015 - 15-й заказ-наряд 2026 года
+ORDER_NUMBER_YEAR_FACTOR = 100000
+
+# Конфигурация полнотекстового поиска заказ-нарядов: стемминг русских слов примечания и причин
+ORDER_SEARCH_CONFIG = "russian"
+
+# Пакетная печать заказ-нарядов: не больше ORDER_PRINT_MAX_COUNT за запрос,
+# ZIP архив от ORDER_PRINT_PARALLEL_MIN_COUNT заказ-нарядов печатается в ORDER_PRINT_PROCESSES процессах
+ORDER_PRINT_MAX_COUNT = 500
+ORDER_PRINT_PARALLEL_MIN_COUNT = 20
+ORDER_PRINT_PROCESSES = 4
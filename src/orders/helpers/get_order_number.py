@@ -1,7 +1,44 @@
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from ..constants import ORDER_NUMBER_YEAR_FACTOR
+
+
+def get_order_number_year() -> int:
+    """Год счётчика номеров: текущий при нумерации по годам, 0 - при сквозной"""
+    if settings.ORDER_NUMBER_PER_YEAR:
+        return timezone.localdate().year
+    return 0
+
+
 def get_order_number() -> int:
+    """
+    Следующий номер заказ-наряда из счётчика OrderNumberCounter.
+    UPDATE блокирует строку счётчика до конца транзакции: параллельные записи получают номера по очереди,
+    а номер откаченной записи выдаётся следующей, поэтому пропусков нет. Вызывается в транзакции записи.
+    Строка счётчика создаётся при первом номере года и продолжает уже выданные номера этого диапазона
+    """
     from ..models import Order
+    from ..models import OrderNumberCounter
+
+    year = get_order_number_year()
+    number_base = year * ORDER_NUMBER_YEAR_FACTOR
+    counter_table = OrderNumberCounter._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {counter_table} SET value = value + 1 WHERE year = %s RETURNING value", [year])
+        row = cursor.fetchone()
+
+        if row is None:
+            number_end = number_base + ORDER_NUMBER_YEAR_FACTOR if year else 2**31
+            cursor.execute(
+                f"INSERT INTO {counter_table} (year, value) "
+                f"SELECT %s, COALESCE(MAX(number) - %s, 0) + 1 FROM {Order._meta.db_table} "
+                f"WHERE number > %s AND number < %s "
+                f"ON CONFLICT (year) DO UPDATE SET value = {counter_table}.value + 1 RETURNING value",
+                [year, number_base, number_base, number_end],
+            )
+            row = cursor.fetchone()
 
-    last_order = Order.objects.order_by("-number").first()
-    if last_order:
-        return last_order.number + 1
-    return 1
+    return number_base + row[0]
@@ -1,18 +1,33 @@
+from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchRank
+from django.db.models import Case
+from django.db.models import F
+from django.db.models import FloatField
 from django.db.models import Q
 from django.db.models import Value
-from django.db.models.functions import Replace
+from django.db.models import When
+from django.db.models.functions import Cast
+
+from ..constants import ORDER_SEARCH_CONFIG
 
 
 def order_general_search(queryset, search: str):
-    return queryset.annotate(
-        state_number_without_whitespace=Replace("car__state_number", Value(" "), Value(""))
-    ).filter(
-        (
-            Q(number=search if search.isdigit() else None)
-            | Q(car__state_number__icontains=search)
-            | Q(state_number_without_whitespace__icontains=search)
-            | Q(car__name__icontains=search)
-            | Q(reasons__name__icontains=search)
-            | Q(note__icontains=search)
-        )
-    )
+    """
+    Поиск заказ-нарядов по поисковому документу (helpers.order_search_document) без соединения с ТС и причинами,
+    поэтому заказ-наряды не дублируются. Условия используют GIN индексы: полнотекстовый по search_vector
+    и по подстроке (pg_trgm) в search_document. Релевантность (search_rank) - ранг полнотекстового поиска,
+    совпадение номера выше остальных
+    """
+    search = search.strip()
+    query = SearchQuery(search, config=ORDER_SEARCH_CONFIG, search_type="websearch")
+
+    lookup = Q(search_vector=query) | Q(search_document__contains=search.upper())
+    # ts_rank возвращает real: при постраничном выводе по курсору значение из курсора (double precision)
+    # не совпадает с real, строки с одинаковой релевантностью повторяются или пропускаются
+    search_rank = Cast(SearchRank(F("search_vector"), query), FloatField())
+
+    if search.isdigit():
+        lookup |= Q(number=search)
+        search_rank += Case(When(number=search, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+
+    return queryset.filter(lookup).annotate(search_rank=search_rank).order_by("-search_rank", "-number")
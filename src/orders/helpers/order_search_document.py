@@ -0,0 +1,37 @@
+from django.db import connection
+
+from core.models import Car
+
+from ..constants import ORDER_SEARCH_CONFIG
+from ..models import Order
+from ..models import Reason
+
+
+def refresh_orders_search_document(orders_pk):
+    """
+    Пересчитывает поисковый документ заказ-нарядов одним UPDATE: номер, гос. номер как есть и без пробелов,
+    наименование ТС, причины и примечание в верхнем регистре построчно (search_document, индекс pg_trgm)
+    и tsvector по нему (search_vector)
+    """
+    orders_pk = list(orders_pk)
+    if not orders_pk:
+        return
+
+    order_table = Order._meta.db_table
+    order_reasons_table = Order.reasons.through._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {order_table} AS o SET search_document = d.document, "
+            f"search_vector = to_tsvector('{ORDER_SEARCH_CONFIG}', d.document) "
+            f"FROM ("
+            f"SELECT o.id, UPPER(CONCAT_WS(E'\\n', o.number, c.state_number, REPLACE(c.state_number, ' ', ''), "
+            f"c.name, ("
+            f"SELECT STRING_AGG(r.name, E'\\n' ORDER BY r.name) FROM {order_reasons_table} AS orr "
+            f"JOIN {Reason._meta.db_table} AS r ON r.id = orr.reason_id WHERE orr.order_id = o.id"
+            f"), NULLIF(o.note, ''))) AS document "
+            f"FROM {order_table} AS o LEFT JOIN {Car._meta.db_table} AS c ON c.id = o.car_id "
+            f"WHERE o.id = ANY(%s)"
+            f") AS d WHERE o.id = d.id",
+            [orders_pk],
+        )
@@ -0,0 +1,94 @@
+from ..models import OrderWork
+from ..models import OrderWorkMechanic
+
+ORDER_WORK_FIELDS = ("work", "quantity", "time_minutes", "note")
+ORDER_WORK_MECHANIC_FIELDS = ("mechanic", "time_minutes")
+
+
+def set_changed_fields(obj, data: dict) -> bool:
+    """Записывает в obj отличающиеся значения data, возвращает True, если что-то изменилось"""
+    changed = False
+    for field_name, value in data.items():
+        field = obj._meta.get_field(field_name)
+        new_value = value.pk if field.is_relation and value is not None else value
+        if getattr(obj, field.attname) != new_value:
+            setattr(obj, field_name, value)
+            changed = True
+    return changed
+
+
+def save_order_works(order, order_works: list, is_new: bool = False):
+    """
+    Записывает работы заказ-наряда и их слесарей по разнице с текущими строками.
+    Текущие строки загружаются двумя запросами, изменения применяются bulk_create, bulk_update
+    и одним delete на модель. Строка с pk текущей строки обновляется (если изменилась), без pk добавляется,
+    отсутствующие в order_works удаляются. Без ключа mechanics (частичное обновление) слесари работы не меняются.
+    order_works - validated_data вложенного сериализатора
+    """
+    works = {} if is_new else {order_work.pk: order_work for order_work in order.order_works.all()}
+    mechanics = {}
+    if works:
+        mechanics = {
+            mechanic.pk: mechanic for mechanic in OrderWorkMechanic.objects.filter(order_work__in=list(works))
+        }
+
+    works_to_create = []
+    works_to_update = []
+    works_mechanics = []
+    kept_works_pk = set()
+    for data in order_works:
+        data = dict(data)
+        mechanics_data = data.pop("mechanics", None)
+        order_work = works.get(data.pop("pk", None))
+
+        if order_work is None or order_work.pk in kept_works_pk:
+            order_work = OrderWork(order=order, **data)
+            works_to_create.append(order_work)
+        else:
+            kept_works_pk.add(order_work.pk)
+            if set_changed_fields(order_work, data):
+                works_to_update.append(order_work)
+
+        works_mechanics.append((order_work, mechanics_data))
+
+    deleted_works_pk = set(works) - kept_works_pk
+    if deleted_works_pk:
+        OrderWork.objects.filter(pk__in=deleted_works_pk).delete()
+
+    OrderWork.objects.bulk_create(works_to_create)
+    if works_to_update:
+        OrderWork.objects.bulk_update(works_to_update, ORDER_WORK_FIELDS)
+
+    mechanics_to_create = []
+    mechanics_to_update = []
+    kept_mechanics_pk = set()
+    for order_work, mechanics_data in works_mechanics:
+        if mechanics_data is None:
+            kept_mechanics_pk.update(
+                pk for pk, mechanic in mechanics.items() if mechanic.order_work_id == order_work.pk
+            )
+            continue
+
+        for data in mechanics_data:
+            data = dict(data)
+            mechanic = mechanics.get(data.pop("pk", None))
+
+            if mechanic is None or mechanic.order_work_id != order_work.pk or mechanic.pk in kept_mechanics_pk:
+                mechanics_to_create.append(OrderWorkMechanic(order_work=order_work, **data))
+            else:
+                kept_mechanics_pk.add(mechanic.pk)
+                if set_changed_fields(mechanic, data):
+                    mechanics_to_update.append(mechanic)
+
+    # Слесари удалённых работ удалены вместе с работами
+    deleted_mechanics_pk = [
+        pk
+        for pk, mechanic in mechanics.items()
+        if pk not in kept_mechanics_pk and mechanic.order_work_id not in deleted_works_pk
+    ]
+    if deleted_mechanics_pk:
+        OrderWorkMechanic.objects.filter(pk__in=deleted_mechanics_pk).delete()
+
+    OrderWorkMechanic.objects.bulk_create(mechanics_to_create)
+    if mechanics_to_update:
+        OrderWorkMechanic.objects.bulk_update(mechanics_to_update, ORDER_WORK_MECHANIC_FIELDS)
@@ -2,9 +2,8 @@ from collections import Counter
 
 from rest_framework.serializers import ValidationError
 
-from core.models import Employee
-
-from ..models import Work
+from core.constants import DRIVER
+from core.constants import MECHANIC
 
 
 def find_duplicate(arr):
@@ -12,23 +11,27 @@ def find_duplicate(arr):
 
 
 def validator_order_works(order_works):
-    works_pk = []
+    """
+    Проверяет работы заказ-наряда за один проход по validated_data без запросов к базе:
+    работы и слесари - уже загруженные полями объекты. Возвращает все ошибки сразу:
+    повторы работ, повторы слесарей в работе и работников, которые не могут выполнять работы
+    """
+    errors = [f'Работа "{work.name}" повторяется' for work in find_duplicate(x["work"] for x in order_works)]
+
+    not_mechanics = []
     for order_work in order_works:
-        works_pk.append(order_work.get("work").pk)
+        work = order_work["work"]
+        mechanics = [x["mechanic"] for x in order_work.get("mechanics") or []]
 
-    duplicate = find_duplicate(works_pk)
-    if duplicate:
-        work = Work.objects.get(pk=duplicate[0])
-        raise ValidationError({"error": (f'Работа "{work.name}" повторяется')})
+        for mechanic in find_duplicate(mechanics):
+            errors.append(f'Слесарь {mechanic.short_fio} повторяется в работе "{work.name}"')
 
+        for mechanic in mechanics:
+            if mechanic.type not in (MECHANIC, DRIVER) and mechanic not in not_mechanics:
+                not_mechanics.append(mechanic)
 
-def validator_mechanics_order_work(mechanics, work_pk):
-    mechanics_pk = []
-    for mechanic in mechanics:
-        mechanics_pk.append(mechanic.get("mechanic").pk)
+    for mechanic in not_mechanics:
+        errors.append(f"{mechanic.short_fio} ({mechanic.type_name}) не может выполнять работы")
 
-    duplicate = find_duplicate(mechanics_pk)
-    if duplicate:
-        mechanic = Employee.objects.get(pk=duplicate[0])
-        work = Work.objects.get(pk=work_pk)
-        raise ValidationError({"error": (f'Слесарь {mechanic.short_fio} повторяется в работе "{work.name}"')})
+    if errors:
+        raise ValidationError({"error": errors})
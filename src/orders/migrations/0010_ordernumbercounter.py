@@ -0,0 +1,36 @@
+# Generated by Django 4.0 on 2026-10-18 15:11
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_order_number_counter(apps, schema_editor):
+    """Счётчик сквозной нумерации (year=0) начинается с текущего максимального номера заказ-наряда"""
+    Order = apps.get_model('orders', 'Order')
+    OrderNumberCounter = apps.get_model('orders', 'OrderNumberCounter')
+
+    last_number = Order.objects.aggregate(number=Max('number'))['number']
+    OrderNumberCounter.objects.create(year=0, value=last_number or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_alter_order_driver'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(unique=True, verbose_name='Год')),
+                ('value', models.IntegerField(default=0, verbose_name='Последний номер')),
+            ],
+            options={
+                'verbose_name': 'Счётчик номеров заказ-нарядов',
+                'verbose_name_plural': 'Счётчики номеров заказ-нарядов',
+            },
+        ),
+        migrations.RunPython(seed_order_number_counter, migrations.RunPython.noop),
+    ]
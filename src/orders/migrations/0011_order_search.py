@@ -0,0 +1,47 @@
+# Generated by Django 4.0 on 2026-10-18 15:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# Заполнение поискового документа, как в helpers.order_search_document
+FILL_ORDER_SEARCH_SQL = """
+UPDATE orders_order AS o SET search_document = d.document, search_vector = to_tsvector('russian', d.document)
+FROM (
+    SELECT o.id, UPPER(CONCAT_WS(E'\\n', o.number, c.state_number, REPLACE(c.state_number, ' ', ''), c.name, (
+        SELECT STRING_AGG(r.name, E'\\n' ORDER BY r.name) FROM orders_order_reasons AS orr
+        JOIN orders_reason AS r ON r.id = orr.reason_id WHERE orr.order_id = o.id
+    ), NULLIF(o.note, ''))) AS document
+    FROM orders_order AS o LEFT JOIN core_car AS c ON c.id = o.car_id
+) AS d WHERE o.id = d.id
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_ordernumbercounter'),
+        # Расширение pg_trgm
+        ('warehouse', '0006_material_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Документ для поиска'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Вектор для поиска'),
+        ),
+        migrations.RunSQL(FILL_ORDER_SEARCH_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='order_search_document_trgm', opclasses=('gin_trgm_ops',)),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='order_search_vector'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db import transaction
 from django.db.models import Q
 
 from app.models import TimestampModel
@@ -40,6 +43,23 @@ class Post(models.Model):
         ordering = ("name",)
 
 
+class OrderNumberCounter(models.Model):
+    """
+    Последний выданный номер заказ-наряда: year=0 - сквозная нумерация, иначе номер внутри года.
+    Строка блокируется при выдаче номера до конца транзакции записи заказ-наряда
+    """
+
+    year = models.IntegerField(verbose_name="Год", unique=True)
+    value = models.IntegerField(verbose_name="Последний номер", default=0)
+
+    def __str__(self):
+        return f"{self.year or 'Сквозная нумерация'} - {self.value}"
+
+    class Meta:
+        verbose_name = "Счётчик номеров заказ-нарядов"
+        verbose_name_plural = "Счётчики номеров заказ-нарядов"
+
+
 class Order(TimestampModel):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, verbose_name="Пользователь", on_delete=models.PROTECT, related_name="orders"
@@ -79,6 +99,9 @@ class Order(TimestampModel):
     )
     odometer = models.IntegerField(verbose_name="Пробег", blank=True, null=True)
     note = models.TextField(verbose_name="Примечание", blank=True)
+    # Поисковый документ обновляется в receivers (helpers.order_search_document)
+    search_document = models.TextField(verbose_name="Документ для поиска", blank=True, default="", editable=False)
+    search_vector = SearchVectorField(verbose_name="Вектор для поиска", null=True, editable=False)
 
     def __str__(self):
         return f"{self.number} - {self.date_begin.strftime('%d.%m.%Y')} - {self.car}"
@@ -87,11 +110,18 @@ class Order(TimestampModel):
         verbose_name = "Заказ-наряд"
         verbose_name_plural = "Заказ-наряды"
         ordering = ("-number",)
+        indexes = [
+            # Поиск по подстроке через pg_trgm и полнотекстовый поиск (helpers.order_general_search)
+            GinIndex(fields=("search_document",), opclasses=("gin_trgm_ops",), name="order_search_document_trgm"),
+            GinIndex(fields=("search_vector",), name="order_search_vector"),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.number is None:
-            self.number = get_order_number()
-        super().save(*args, **kwargs)
+        # Номер выдаётся в транзакции записи: при откате он не теряется, параллельные записи ждут
+        with transaction.atomic():
+            if self.number is None:
+                self.number = get_order_number()
+            super().save(*args, **kwargs)
 
 
 class WorkCategory(models.Model):
@@ -0,0 +1,81 @@
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from core.models import Car
+
+from .helpers.order_search_document import refresh_orders_search_document
+from .models import Order
+from .models import Reason
+
+# Поля ТС и причины, которые входят в поисковый документ заказ-наряда
+CAR_SEARCH_FIELDS = ("state_number", "name")
+REASON_SEARCH_FIELDS = ("name",)
+
+
+def remember_search_fields(instance, fields):
+    instance._previous_search_fields = None
+    if instance.pk:
+        instance._previous_search_fields = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+
+
+def is_search_fields_changed(instance, fields) -> bool:
+    previous = getattr(instance, "_previous_search_fields", None)
+    return previous is None or any(previous[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=Order)
+def refresh_search_after_order_save(sender, instance, *args, **kwargs):
+    refresh_orders_search_document([instance.pk])
+
+
+@receiver(m2m_changed, sender=Order.reasons.through)
+def refresh_search_after_reasons_change(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            refresh_orders_search_document([instance.pk])
+        return
+
+    # Изменён список заказ-нарядов причины: при очистке он известен только до неё
+    if action == "pre_clear":
+        instance._search_orders_pk = list(instance.orders.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove"):
+        refresh_orders_search_document(pk_set)
+    elif action == "post_clear":
+        refresh_orders_search_document(getattr(instance, "_search_orders_pk", []))
+
+
+@receiver(pre_save, sender=Reason)
+def remember_reason_before_save(sender, instance, *args, **kwargs):
+    remember_search_fields(instance, REASON_SEARCH_FIELDS)
+
+
+@receiver(post_save, sender=Reason)
+def refresh_search_after_reason_save(sender, instance, created, *args, **kwargs):
+    if not created and is_search_fields_changed(instance, REASON_SEARCH_FIELDS):
+        refresh_orders_search_document(instance.orders.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Reason)
+def remember_reason_orders_before_delete(sender, instance, *args, **kwargs):
+    instance._search_orders_pk = list(instance.orders.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Reason)
+def refresh_search_after_reason_delete(sender, instance, *args, **kwargs):
+    refresh_orders_search_document(getattr(instance, "_search_orders_pk", []))
+
+
+@receiver(pre_save, sender=Car)
+def remember_car_before_save(sender, instance, *args, **kwargs):
+    remember_search_fields(instance, CAR_SEARCH_FIELDS)
+
+
+# Синхронизация ТС сохраняет каждую машину, документы перезаписываются только при изменении номера или названия
+@receiver(post_save, sender=Car)
+def refresh_search_after_car_save(sender, instance, created, *args, **kwargs):
+    if not created and is_search_fields_changed(instance, CAR_SEARCH_FIELDS):
+        refresh_orders_search_document(instance.orders.values_list("pk", flat=True))
@@ -1,46 +1,62 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from io import BytesIO
+from multiprocessing import get_context
+from zipfile import ZIP_STORED
+from zipfile import ZipFile
 
+import django
 from django.conf import settings
+from django.db.models import Prefetch
 
-from openpyxl import load_workbook
+from openpyxl import Workbook
 from openpyxl.styles import Font
 from openpyxl.worksheet.worksheet import Worksheet
 
 from app.helpers.reports import ALIGNMENT_CENTER
 from app.helpers.reports import ALIGNMENT_LEFT
 from app.helpers.reports import get_module_path
+from app.helpers.reports import get_template_workbook
 from app.helpers.reports import set_border
 from app.helpers.reports import set_cell
+from warehouse.models import Turnover
 
 from ..constants import COMPLETED
+from ..constants import ORDER_PRINT_PARALLEL_MIN_COUNT
+from ..constants import ORDER_PRINT_PROCESSES
 from ..helpers.time_minutes_formated import time_minutes_formated
 from ..models import Order
+from ..models import OrderWork
+from ..models import OrderWorkMechanic
+
+TEMPLATE_PATH = f"{get_module_path(__file__)}/templates/order_template.xlsx"
 
 
 class OrderExcelCreator:
     def __init__(self, order: Order) -> None:
-        self.__template_name = "order_template.xlsx"
         self.__order = order
 
-    def __call__(self):
-        wb = load_workbook(f"{get_module_path(__file__)}/templates/{self.__template_name}")
-        ws = wb.active
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Всё, что печатается в заказ-наряде, постоянным числом запросов при любом количестве заказ-нарядов"""
+        return queryset.select_related("car", "post", "driver", "responsible").prefetch_related(
+            "reasons",
+            Prefetch(
+                "order_works",
+                queryset=OrderWork.objects.select_related("work").prefetch_related(
+                    Prefetch("mechanics", queryset=OrderWorkMechanic.objects.select_related("mechanic"))
+                ),
+            ),
+            Prefetch("turnovers_from_order", queryset=Turnover.objects.select_related("material", "warehouse")),
+        )
 
-        self.__print_main_data(ws)
-
-        row_number = 12
-        row_number = self.__print_works(ws, row_number)
-        row_number += 1
-        row_number = self.__print_materials(ws, row_number)
-        row_number += 1
-        self.__print_signatures(ws, row_number)
+    def __call__(self):
+        """Сохраняет заказ-наряд в MEDIA_ROOT/temp, возвращает ссылку на файл"""
+        wb = self.create_workbook()
 
         path = f"{settings.MEDIA_ROOT}/temp"
-        today = datetime.today()
-
-        order_number = "__" if not self.__order else self.__order.number
-        filename = f"Заказ-наряд №{order_number} {today.strftime('%d%m%Y%H%M%S')}.xlsx"
+        filename = self.get_filename()
 
         if not os.path.exists(path):
             os.makedirs(path)
@@ -50,6 +66,35 @@ class OrderExcelCreator:
 
         return f"{settings.MEDIA_URL}temp/{filename}"
 
+    def to_buffer(self) -> BytesIO:
+        """Заказ-наряд в памяти, для ответа файлом без временного файла на диске"""
+        buffer = BytesIO()
+        self.create_workbook().save(buffer)
+        buffer.seek(0)
+        return buffer
+
+    def get_filename(self) -> str:
+        today = datetime.today()
+        order_number = "__" if not self.__order else self.__order.number
+        return f"Заказ-наряд №{order_number} {today.strftime('%d%m%Y%H%M%S')}.xlsx"
+
+    def create_workbook(self) -> Workbook:
+        # Файл шаблона читается с диска один раз на процесс
+        wb = get_template_workbook(TEMPLATE_PATH)
+        self.print_order(wb.active)
+        return wb
+
+    def print_order(self, ws: Worksheet):
+        """Печатает заказ-наряд на лист ws - лист шаблона или его копию"""
+        self.__print_main_data(ws)
+
+        row_number = 12
+        row_number = self.__print_works(ws, row_number)
+        row_number += 1
+        row_number = self.__print_materials(ws, row_number)
+        row_number += 1
+        self.__print_signatures(ws, row_number)
+
     def __print_main_data(self, ws: Worksheet):
         order = self.__order
 
@@ -264,3 +309,67 @@ class OrderExcelCreator:
                     mechanics.append(short_fio)
 
         return mechanics
+
+
+def render_order(order: Order) -> bytes:
+    """Файл заказ-наряда, функция модуля для передачи в пул процессов"""
+    return OrderExcelCreator(order).to_buffer().getvalue()
+
+
+class OrdersBatchExcelCreator:
+    """
+    Печать нескольких заказ-нарядов одним файлом: книга с листом на каждый заказ-наряд или ZIP архив книг.
+    Заказ-наряды загружаются заранее с OrderExcelCreator.setup_eager_loading, печать к базе не обращается
+    """
+
+    def __init__(self, orders: list) -> None:
+        self.__orders = orders
+
+    def get_filename(self, extension: str) -> str:
+        today = datetime.today()
+        return f"Заказ-наряды {today.strftime('%d%m%Y%H%M%S')}.{extension}"
+
+    def to_workbook_buffer(self) -> BytesIO:
+        """
+        Одна книга, листы - копии листа шаблона. Листы одной книги не переносятся между процессами,
+        поэтому книга печатается в текущем процессе
+        """
+        wb = get_template_workbook(TEMPLATE_PATH)
+        template_ws = wb.active
+
+        for order in self.__orders:
+            ws = wb.copy_worksheet(template_ws)
+            ws.title = f"№{order.number}"
+            OrderExcelCreator(order).print_order(ws)
+
+        wb.remove(template_ws)
+        wb.active = 0
+
+        buffer = BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+    def to_zip_buffer(self) -> BytesIO:
+        """ZIP архив с книгой на каждый заказ-наряд, книги большого пакета печатаются в пуле процессов"""
+        buffer = BytesIO()
+        # xlsx уже сжат, повторное сжатие только тратит время
+        with ZipFile(buffer, "w", ZIP_STORED) as zip_file:
+            for order, file in zip(self.__orders, self.__render_orders()):
+                zip_file.writestr(f"Заказ-наряд №{order.number}.xlsx", file)
+
+        buffer.seek(0)
+        return buffer
+
+    def __render_orders(self) -> list:
+        if len(self.__orders) < ORDER_PRINT_PARALLEL_MIN_COUNT:
+            return [render_order(order) for order in self.__orders]
+
+        # spawn, а не fork: процессы не наследуют открытые соединения с базой и состояние потоков веб-сервера,
+        # Django настраивается в каждом процессе заново. Заказ-наряды передаются вместе с загруженными связями
+        processes = min(ORDER_PRINT_PROCESSES, os.cpu_count() or 1, len(self.__orders))
+        chunksize = max(1, len(self.__orders) // (processes * 4))
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=get_context("spawn"), initializer=django.setup
+        ) as executor:
+            return list(executor.map(render_order, self.__orders, chunksize=chunksize))
@@ -1,19 +1,31 @@
 import copy
 import json
-
+import os
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from zipfile import ZipFile
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from openpyxl import load_workbook
 from rest_framework import status
 
 from app.helpers.database import convert_to_localtime
 from app.helpers.database import get_period_filter_lookup
 from app.helpers.testing import AuthorizationAPITestCase
 from app.helpers.testing import get_test_user
+from app.pagination import BasePagination
 from core.tests.factory import CarFactory
 from core.tests.factory import EmployeeFactory
 from orders.helpers.order_general_search import order_general_search
 from warehouse.constants import COMING
 from warehouse.constants import EXPENSE
+from warehouse.models import MaterialBalance
+from warehouse.models import Turnover
 from warehouse.tests.factory import EntranceFactory
 from warehouse.tests.factory import MaterialCategoryFactory
 from warehouse.tests.factory import MaterialFactory
@@ -26,7 +38,10 @@ from ...api.serializers import OrderListSerializer
 from ...api.serializers import OrderWorkSerializer
 from ...constants import COMPLETED
 from ...constants import REQUEST
+from ...constants import WORK
 from ...models import Order
+from ...models import OrderWork
+from ...models import OrderWorkMechanic
 from ..factory import OrderFactory
 from ..factory import OrderWorkFactory
 from ..factory import OrderWorkMechanicFactory
@@ -217,6 +232,69 @@ class OrderApiTestCase(AuthorizationAPITestCase):
         }
         self.assertEqual(serializer_data, response_note_search.data)
 
+    def test_get_list_cursor(self):
+        user = get_test_user()
+
+        reasons = [ReasonFactory(), ReasonFactory(type=2, name="Ремонт электрооборудования")]
+        post = PostFactory()
+        car = CarFactory()
+        driver = EmployeeFactory(type=1, position="Водитель")
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        for number in range(5):
+            order = OrderFactory(
+                user=user,
+                status=REQUEST,
+                post=post,
+                car=car,
+                driver=driver,
+                responsible=responsible,
+                date_begin=f"2022-01-0{number % 2 + 1} 12:00",
+            )
+            order.reasons.add(reasons[number % 2])
+
+        url = reverse("order-list")
+        for params, ordering in (
+            ({}, ("-number", "pk")),
+            ({"sortField": "date_begin", "sortOrder": "descend"}, ("-date_begin", "pk")),
+            ({"sortField": "reason", "sortOrder": "ascend"}, ("reasons__name", "pk")),
+            # Одинаковая релевантность у всех: страницы идут по номеру без повторов и пропусков
+            ({"general_search": "тестовый"}, ("-number", "pk")),
+        ):
+            params = {"pagination": "cursor", **params}
+            orders_pk = []
+            with patch.object(BasePagination, "page_size", 2):
+                while True:
+                    response = self.client.get(url, params)
+                    self.assertEqual(status.HTTP_200_OK, response.status_code)
+                    orders_pk += [order["pk"] for order in response.data["results"]]
+                    if not response.data["cursor"]:
+                        break
+                    params["cursor"] = response.data["cursor"]
+
+            self.assertEqual(list(Order.objects.order_by(*ordering).values_list("pk", flat=True)), orders_pk)
+
+    def test_get_list_queries_count(self):
+        user = get_test_user()
+
+        reasons = [ReasonFactory(), ReasonFactory(type=2, name="Ремонт электрооборудования")]
+        posts = [PostFactory(), PostFactory(name="Пост 2")]
+        cars = [CarFactory(), CarFactory(gos_nom_in_putewka=2, name="КАМАЗ", state_number="Б 666 ББ")]
+        for number in range(10):
+            order = OrderFactory(user=user, post=posts[number % 2], car=cars[number % 2] if number % 3 else None)
+            order.reasons.add(*reasons[: number % 3])
+
+        # Машина, пост и причины загружаются заранее: число запросов не зависит от размера страницы
+        url = reverse("order-list")
+        queries_count = None
+        for page_size in (1, 5, 10):
+            with patch.object(BasePagination, "page_size", page_size), CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(len(response.data["results"]), page_size)
+            if queries_count is None:
+                queries_count = len(context)
+            self.assertEqual(len(context), queries_count, page_size)
+
     def test_create(self):
         reason = ReasonFactory()
         post = PostFactory()
@@ -364,6 +442,57 @@ class OrderApiTestCase(AuthorizationAPITestCase):
         self.assertEqual(status.HTTP_201_CREATED, response.status_code)
         self.assertTrue(Order.objects.get(note=payload_with_materials["note"]))
 
+    def test_create_validation_errors(self):
+        work_category = WorkCategoryFactory()
+        works = [WorkFactory(category=work_category, name=f"Работа {number}") for number in range(10)]
+        mechanic = EmployeeFactory(number_in_kadry=1, type=2, position="Слесарь")
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник", last_name="Петров")
+
+        order_works = [
+            {
+                "work": work.pk,
+                "quantity": 1,
+                "time_minutes": 60,
+                "note": "",
+                "mechanics": [{"mechanic": mechanic.pk, "time_minutes": 60}],
+            }
+            for work in works
+        ]
+        order_works.append({**order_works[0], "mechanics": []})
+        order_works[1]["mechanics"] = [{"mechanic": mechanic.pk, "time_minutes": 30}] * 2
+        order_works[2]["mechanics"] = [{"mechanic": responsible.pk, "time_minutes": 30}]
+
+        payload = {
+            "status": REQUEST,
+            "reasons": [ReasonFactory().pk],
+            "date_begin": "19.09.2022 12:00",
+            "car": CarFactory().pk,
+            "note": "",
+            "order_works": order_works,
+            "turnovers_from_order": [],
+        }
+
+        url = reverse("order-list")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(Order.objects.exists())
+
+        # Все ошибки возвращаются сразу
+        self.assertEqual(
+            response.data["error"],
+            [
+                'Работа "Работа 0" повторяется',
+                f'Слесарь {mechanic.short_fio} повторяется в работе "Работа 1"',
+                f"{responsible.short_fio} ({responsible.type_name}) не может выполнять работы",
+            ],
+        )
+
+        # Работы и слесари всех строк загружаются одним запросом каждые
+        selects = [query["sql"] for query in context.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertEqual(len([sql for sql in selects if 'FROM "orders_work"' in sql]), 1)
+        self.assertEqual(len([sql for sql in selects if 'FROM "core_employee"' in sql]), 1)
+
     def test_get(self):
         user = get_test_user()
 
@@ -399,6 +528,112 @@ class OrderApiTestCase(AuthorizationAPITestCase):
         serializer_data = OrderDetailSerializer(Order.objects.get(pk=order.pk)).data
         self.assertEqual(serializer_data, response.data)
 
+    def test_export_excel(self):
+        user = get_test_user()
+
+        reason = ReasonFactory()
+        order = OrderFactory(user=user, post=PostFactory(), car=CarFactory(), note="Поломка")
+        order.reasons.add(reason)
+        order_work = OrderWorkFactory(order=order, work=WorkFactory(category=WorkCategoryFactory()))
+        mechanic = EmployeeFactory(number_in_kadry=3, type=2, position="Слесарь")
+        OrderWorkMechanicFactory(order_work=order_work, mechanic=mechanic)
+
+        url = reverse("order-excel")
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.get(url, {"pk": order.pk, "download": "true"})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertIn("attachment", response["Content-Disposition"])
+            ws = load_workbook(BytesIO(b"".join(response.streaming_content))).active
+            self.assertEqual(ws["F1"].value, order.number)
+            self.assertEqual(ws["G4"].value, reason.name)
+            self.assertEqual(ws["A13"].value, order_work.work.name)
+            # Файл формируется в памяти, временный файл не создаётся
+            self.assertFalse(os.path.exists(os.path.join(media_root, "temp")))
+
+            # Копия шаблона из кэша не содержит данных предыдущего заказ-наряда
+            response = self.client.get(url, {"download": "true"})
+            ws = load_workbook(BytesIO(b"".join(response.streaming_content))).active
+            self.assertEqual(ws["F1"].value, "____")
+            self.assertIsNone(ws["G4"].value)
+
+            response = self.client.get(url, {"pk": order.pk})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertIn("/temp/", response.data["file"])
+            self.assertEqual(len(os.listdir(os.path.join(media_root, "temp"))), 1)
+
+    def test_export_excel_batch(self):
+        user = get_test_user()
+
+        post = PostFactory()
+        reason = ReasonFactory()
+        work = WorkFactory(category=WorkCategoryFactory())
+        material = MaterialFactory(unit=UnitFactory(), category=MaterialCategoryFactory())
+        warehouse = WarehouseFactory()
+        entrance = EntranceFactory(user=user, responsible=EmployeeFactory(number_in_kadry=100))
+        TurnoverFactory(
+            user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance, quantity=10, sum=100
+        )
+
+        orders = []
+        for index in range(3):
+            order = OrderFactory(
+                user=user,
+                post=post,
+                car=CarFactory(gos_nom_in_putewka=index + 1, state_number=f"А {index}00 АА"),
+                driver=EmployeeFactory(number_in_kadry=index * 2 + 1),
+                responsible=EmployeeFactory(number_in_kadry=index * 2 + 2, type=2, position="Слесарь"),
+            )
+            order.reasons.add(reason)
+            order_work = OrderWorkFactory(order=order, work=work)
+            OrderWorkMechanicFactory(order_work=order_work, mechanic=order.responsible)
+            TurnoverFactory(user=user, type=EXPENSE, material=material, warehouse=warehouse, order=order)
+            orders.append(order)
+        OrderFactory(user=user, date_begin="2022-02-01 12:00")
+
+        url = reverse("order-excel-batch")
+
+        def get_queries_count(orders_pk: str) -> int:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {"orders": orders_pk})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            return len(context.captured_queries)
+
+        # Число запросов не зависит от количества заказ-нарядов
+        self.assertEqual(
+            get_queries_count(str(orders[0].pk)), get_queries_count(",".join(str(order.pk) for order in orders))
+        )
+
+        response = self.client.get(url, {"post": post.pk, "date_begin": "01.01.2022", "date_end": "01.01.2022"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn(".xlsx", response["Content-Disposition"])
+        wb = load_workbook(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(wb.sheetnames, [f"№{order.number}" for order in orders])
+        for order in orders:
+            ws = wb[f"№{order.number}"]
+            self.assertEqual(ws["F1"].value, order.number)
+            self.assertEqual(ws["A13"].value, work.name)
+            self.assertEqual(ws["A7"].value, order.car.state_number)
+            self.assertEqual(ws["A10"].value, post.name)
+
+        # Большой пакет печатается в пуле процессов
+        with patch("orders.reports.order_excel.ORDER_PRINT_PARALLEL_MIN_COUNT", 2):
+            response = self.client.get(url, {"statuses": str(REQUEST), "post": post.pk, "output": "zip"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn(".zip", response["Content-Disposition"])
+        with ZipFile(BytesIO(b"".join(response.streaming_content))) as zip_file:
+            self.assertEqual(zip_file.namelist(), [f"Заказ-наряд №{order.number}.xlsx" for order in orders])
+            for order, name in zip(orders, zip_file.namelist()):
+                ws = load_workbook(BytesIO(zip_file.read(name))).active
+                self.assertEqual(ws["F1"].value, order.number)
+                self.assertEqual(ws["A13"].value, work.name)
+
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get(url, {"orders": "1,a"})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get(url, {"orders": str(orders[-1].pk + 100)})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
     def test_update(self):
         user = get_test_user()
 
@@ -495,6 +730,274 @@ class OrderApiTestCase(AuthorizationAPITestCase):
         self.assertEqual(order_result.order_works.all().count(), 1)
         self.assertEqual(order_result.turnovers_from_order.all().count(), 1)
 
+    def test_update_order_works(self):
+        user = get_test_user()
+
+        order = OrderFactory(user=user, car=CarFactory())
+        work_category = WorkCategoryFactory()
+        works = [WorkFactory(category=work_category, name=f"Работа {number}") for number in range(22)]
+        mechanics = [
+            EmployeeFactory(number_in_kadry=number, type=2, position="Слесарь", last_name=f"Слесарь {number}")
+            for number in range(1, 4)
+        ]
+
+        order_work_kept = OrderWorkFactory(order=order, work=works[0], time_minutes=30)
+        mechanic_kept = OrderWorkMechanicFactory(order_work=order_work_kept, mechanic=mechanics[0], time_minutes=30)
+        mechanic_deleted = OrderWorkMechanicFactory(order_work=order_work_kept, mechanic=mechanics[1])
+        order_work_deleted = OrderWorkFactory(order=order, work=works[1])
+        OrderWorkMechanicFactory(order_work=order_work_deleted, mechanic=mechanics[0])
+
+        # Работа и слесарь с pk изменяются, остальные текущие строки удаляются, 20 работ и 40 слесарей добавляются
+        order_works = [
+            {
+                "pk": order_work_kept.pk,
+                "work": works[0].pk,
+                "quantity": 1,
+                "time_minutes": 60,
+                "note": "",
+                "mechanics": [
+                    {"pk": mechanic_kept.pk, "mechanic": mechanics[0].pk, "time_minutes": 60},
+                    {"pk": None, "mechanic": mechanics[2].pk, "time_minutes": 15},
+                ],
+            }
+        ]
+        for work in works[2:]:
+            order_works.append(
+                {
+                    "pk": None,
+                    "work": work.pk,
+                    "quantity": 1,
+                    "time_minutes": 20,
+                    "note": "",
+                    "mechanics": [
+                        {"pk": None, "mechanic": mechanics[0].pk, "time_minutes": 10},
+                        {"pk": None, "mechanic": mechanics[1].pk, "time_minutes": 10},
+                    ],
+                }
+            )
+
+        url = reverse("order-detail", kwargs={"pk": order.pk})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(
+                url, data=json.dumps({"order_works": order_works}), content_type="application/json"
+            )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # Запись работ и слесарей не зависит от числа строк
+        order_works_writes = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE")) and '"orders_orderwork' in query["sql"]
+        ]
+        self.assertLessEqual(len(order_works_writes), 7, order_works_writes)
+
+        order_work_kept.refresh_from_db()
+        mechanic_kept.refresh_from_db()
+        self.assertEqual(order_work_kept.time_minutes, 60)
+        self.assertEqual(mechanic_kept.time_minutes, 60)
+        self.assertEqual(order.order_works.count(), 21)
+        self.assertEqual(OrderWorkMechanic.objects.filter(order_work__order=order).count(), 42)
+        self.assertFalse(OrderWork.objects.filter(pk=order_work_deleted.pk).exists())
+        self.assertFalse(OrderWorkMechanic.objects.filter(pk=mechanic_deleted.pk).exists())
+        self.assertEqual(
+            sorted(order_work_kept.mechanics.values_list("mechanic", "time_minutes")),
+            [(mechanics[0].pk, 60), (mechanics[2].pk, 15)],
+        )
+
+        # Без order_works работы не меняются, без mechanics не меняются слесари работы
+        response = self.client.put(url, data=json.dumps({"note": "Без работ"}), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(order.order_works.count(), 21)
+
+        order_works = [{key: value for key, value in order_works[0].items() if key != "mechanics"}]
+        response = self.client.put(url, data=json.dumps({"order_works": order_works}), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(order.order_works.get().mechanics.count(), 2)
+
+    def test_update_default_expense_price(self):
+        user = get_test_user()
+
+        reason = ReasonFactory()
+        post = PostFactory()
+        car = CarFactory()
+        driver = EmployeeFactory(type=1, position="Водитель")
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+
+        order = OrderFactory(user=user, post=post, car=car, driver=driver, responsible=responsible)
+        order.reasons.add(reason)
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material = MaterialFactory(unit=unit, category=category)
+        warehouse = WarehouseFactory()
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance)
+        TurnoverFactory(
+            user=user,
+            type=COMING,
+            material=material,
+            warehouse=warehouse,
+            entrance=entrance,
+            price=13.0,
+            quantity=1.0,
+            sum=13.0,
+        )
+
+        payload = {
+            "status": WORK,
+            "reasons": [reason.pk],
+            "date_begin": "19.09.2022 14:00",
+            "post": post.pk,
+            "car": car.pk,
+            "driver": driver.pk,
+            "responsible": responsible.pk,
+            "odometer": 321000,
+            "note": "Тестовый заказ-наряд",
+            "order_works": [],
+            "turnovers_from_order": [
+                {
+                    "pk": None,
+                    "date": "01.01.2022",
+                    "material": material.pk,
+                    "warehouse": warehouse.pk,
+                    "quantity": 1.0,
+                },
+            ],
+        }
+
+        url = reverse("order-detail", kwargs={"pk": order.pk})
+        response = self.client.put(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # Цена списания по средней цене (20 + 13) / 3
+        turnover = order.turnovers_from_order.get()
+        self.assertEqual(float(turnover.price), 11.0)
+        self.assertEqual(float(turnover.sum), -11.0)
+
+        balance = MaterialBalance.objects.get(material=material, warehouse=warehouse)
+        self.assertEqual(float(balance.quantity), 2.0)
+        self.assertEqual(float(balance.average_price), 11.0)
+
+    def test_create_fractional_quantity_default_price(self):
+        user = get_test_user()
+
+        reason = ReasonFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        material = MaterialFactory(unit=UnitFactory(), category=MaterialCategoryFactory())
+        warehouse = WarehouseFactory()
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(
+            user=user,
+            type=COMING,
+            material=material,
+            warehouse=warehouse,
+            entrance=entrance,
+            price=999.89,
+            quantity=10.0,
+            sum=9998.9,
+        )
+
+        payload = {
+            "status": WORK,
+            "reasons": [reason.pk],
+            "date_begin": "19.09.2022 14:00",
+            "responsible": responsible.pk,
+            "order_works": [],
+            "turnovers_from_order": [
+                {"date": "01.01.2022", "material": material.pk, "warehouse": warehouse.pk, "quantity": 2.5},
+            ],
+        }
+
+        url = reverse("order-list")
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+        # Сумма по цене и дробному количеству округляется так же, как проверяется при записи
+        turnover = Turnover.objects.get(order=response.data["pk"])
+        self.assertEqual(float(turnover.price), 999.89)
+        self.assertEqual(float(turnover.sum), -2499.73)
+
+        # Ошибка проверки оборота при записи - ответ 400, а не ошибка сервера
+        payload["turnovers_from_order"][0].update(price=10.0, sum=11.0)
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("turnovers_from_order", response.data)
+
+    def test_update_not_enough_materials(self):
+        user = get_test_user()
+
+        reason = ReasonFactory()
+        post = PostFactory()
+        car = CarFactory()
+        driver = EmployeeFactory(type=1, position="Водитель")
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+
+        order = OrderFactory(user=user, post=post, car=car, driver=driver, responsible=responsible)
+        order.reasons.add(reason)
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material = MaterialFactory(unit=unit, category=category)
+        warehouse = WarehouseFactory()
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance)
+
+        # По отдельности строки проходят, в сумме остатка не хватает
+        line = {"pk": None, "date": "01.01.2022", "material": material.pk, "warehouse": warehouse.pk, "quantity": 1.5}
+        payload = {
+            "status": WORK,
+            "reasons": [reason.pk],
+            "date_begin": "19.09.2022 14:00",
+            "post": post.pk,
+            "car": car.pk,
+            "driver": driver.pk,
+            "responsible": responsible.pk,
+            "odometer": 321000,
+            "note": "Изменённый заказ-наряд",
+            "order_works": [],
+            "turnovers_from_order": [line, line],
+        }
+
+        url = reverse("order-detail", kwargs={"pk": order.pk})
+        response = self.client.put(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        self.assertIn("quantity", response.data["errors"])
+
+        # Заказ-наряд не изменён
+        order.refresh_from_db()
+        self.assertNotEqual(order.note, payload["note"])
+        self.assertFalse(order.turnovers_from_order.exists())
+
+    def test_update_backdated_expense(self):
+        user = get_test_user()
+
+        reason = ReasonFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        order = OrderFactory(user=user, responsible=responsible)
+        order.reasons.add(reason)
+
+        material = MaterialFactory(unit=UnitFactory(), category=MaterialCategoryFactory())
+        warehouse = WarehouseFactory()
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(
+            user=user, type=COMING, date="2022-02-01", material=material, warehouse=warehouse, entrance=entrance
+        )
+
+        # Текущего остатка хватает, но на дату списания материал ещё не поступил
+        line = {"pk": None, "date": "01.01.2022", "material": material.pk, "warehouse": warehouse.pk, "quantity": 1}
+        payload = {"reasons": [reason.pk], "turnovers_from_order": [line]}
+
+        url = reverse("order-detail", kwargs={"pk": order.pk})
+        response = self.client.put(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        self.assertIn("quantity", response.data["errors"])
+        self.assertFalse(order.turnovers_from_order.exists())
+
+        line["date"] = "01.02.2022"
+        response = self.client.put(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(order.turnovers_from_order.count(), 1)
+
     def test_delete(self):
         user = get_test_user()
 
@@ -2,12 +2,14 @@ from django.urls import reverse
 
 from rest_framework import status
 
+from app.helpers.serializers import annotate_related_fields
 from app.helpers.testing import AuthorizationAPITestCase
 
 from ...api.serializers import WorkCategoryListSerializer
 from ...api.serializers import WorkCategorySerializer
 from ...models import WorkCategory
 from ..factory import WorkCategoryFactory
+from ..factory import WorkFactory
 
 
 class WorkCategoryApiTestCase(AuthorizationAPITestCase):
@@ -23,6 +25,23 @@ class WorkCategoryApiTestCase(AuthorizationAPITestCase):
         serializer_data = WorkCategoryListSerializer(queryset, many=True).data
         self.assertEqual(serializer_data, response.data)
 
+    def test_get_list_work_count(self):
+        work_category1 = WorkCategoryFactory()
+        WorkCategoryFactory(name="Ходовая")
+        WorkFactory(category=work_category1, name="Замена масла")
+        WorkFactory(category=work_category1, name="Замена фильтра")
+
+        url = reverse("work-category-list")
+        queryset = annotate_related_fields(WorkCategory.objects.all(), WorkCategoryListSerializer)
+        with self.assertNumQueries(1):
+            serializer_data = WorkCategoryListSerializer(queryset, many=True).data
+        self.assertEqual(
+            {row["name"]: row["work_count"] for row in serializer_data}, {"Ходовая": 0, work_category1.name: 2}
+        )
+
+        response = self.client.get(url)
+        self.assertEqual(serializer_data, response.data)
+
     def test_create(self):
         payload = {"name": "Электрика"}
 
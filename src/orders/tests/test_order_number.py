@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.utils import timezone
+
+from app.helpers.testing import THREADS_COUNT
+from app.helpers.testing import get_test_user
+from app.helpers.testing import run_concurrently
+from core.tests.factory import CarFactory
+
+from ..constants import ORDER_NUMBER_YEAR_FACTOR
+from ..models import Order
+from ..models import OrderNumberCounter
+from .factory import OrderFactory
+
+
+class OrderNumberTestCase(TestCase):
+    def setUp(self):
+        self.user = get_test_user()
+        self.car = CarFactory()
+
+    def test_numbers(self):
+        order1 = OrderFactory(user=self.user, car=self.car)
+        order2 = OrderFactory(user=self.user, car=self.car)
+        self.assertEqual((order1.number, order2.number), (1, 2))
+        self.assertEqual(OrderNumberCounter.objects.get(year=0).value, 2)
+
+        # Номер откаченной записи выдаётся следующей
+        try:
+            with transaction.atomic():
+                OrderFactory(user=self.user, car=self.car)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(OrderFactory(user=self.user, car=self.car).number, 3)
+
+        # Изменение заказ-наряда номер не меняет
+        order1.note = "Изменённый заказ-наряд"
+        order1.save()
+        self.assertEqual(order1.number, 1)
+        self.assertEqual(OrderNumberCounter.objects.get(year=0).value, 3)
+
+    @override_settings(ORDER_NUMBER_PER_YEAR=True)
+    def test_numbers_per_year(self):
+        number_base = timezone.localdate().year * ORDER_NUMBER_YEAR_FACTOR
+        # Счётчик года создаётся при первом номере и продолжает уже выданные номера года,
+        # номера сквозной нумерации на него не влияют
+        OrderFactory(user=self.user, car=self.car, number=7)
+        OrderFactory(user=self.user, car=self.car, number=number_base + 41)
+
+        order1 = OrderFactory(user=self.user, car=self.car)
+        order2 = OrderFactory(user=self.user, car=self.car)
+        self.assertEqual((order1.number, order2.number), (number_base + 42, number_base + 43))
+
+
+class OrderNumberConcurrencyTestCase(TransactionTestCase):
+    """Параллельное создание заказ-нарядов: номера уникальны и идут без пропусков"""
+
+    def test_concurrent_create(self):
+        user = get_test_user()
+        car = CarFactory()
+
+        def create(number):
+            return OrderFactory(user=user, car=car).number
+
+        results = run_concurrently(create)
+
+        self.assertEqual(sorted(results), list(range(1, THREADS_COUNT + 1)))
+        self.assertEqual(Order.objects.count(), THREADS_COUNT)
+        self.assertEqual(OrderNumberCounter.objects.get(year=0).value, THREADS_COUNT)
@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from app.helpers.testing import get_test_user
+from core.tests.factory import CarFactory
+
+from ..helpers.order_general_search import order_general_search
+from ..models import Order
+from .factory import OrderFactory
+from .factory import ReasonFactory
+
+
+class OrderSearchTestCase(TestCase):
+    def setUp(self):
+        user = get_test_user()
+
+        self.reason1 = ReasonFactory(name="Ремонт двигателя")
+        self.reason2 = ReasonFactory(type=2, name="Ремонт электрооборудования")
+        self.car1 = CarFactory()
+        self.car2 = CarFactory(gos_nom_in_putewka=2, name="КАМАЗ", state_number="Б 666 ББ")
+
+        self.order1 = OrderFactory(user=user, car=self.car1, note="Поломка стартера")
+        self.order1.reasons.add(self.reason1, self.reason2)
+        self.order2 = OrderFactory(user=user, car=self.car2)
+        self.order2.reasons.add(self.reason2)
+        self.order3 = OrderFactory(user=user, note=f"Повторно после заказ-наряда {self.order1.number}")
+
+    def get_search_document(self, order: Order) -> str:
+        order.refresh_from_db()
+        return order.search_document
+
+    def search(self, search: str) -> list:
+        return list(order_general_search(Order.objects.all(), search).values_list("pk", flat=True))
+
+    def test_search_document(self):
+        self.assertEqual(
+            self.get_search_document(self.order1),
+            f"{self.order1.number}\nА 777 АА\nА777АА\nУАЗ 111\nРЕМОНТ ДВИГАТЕЛЯ\nРЕМОНТ ЭЛЕКТРООБОРУДОВАНИЯ\n"
+            "ПОЛОМКА СТАРТЕРА",
+        )
+        self.assertEqual(self.get_search_document(self.order3), f"{self.order3.number}\n{self.order3.note.upper()}")
+
+        # Изменение ТС, причины и списка причин обновляет документ
+        self.car2.state_number = "В 555 ВВ"
+        self.car2.save()
+        self.assertIn("В555ВВ", self.get_search_document(self.order2))
+
+        # Сохранение без изменения номера и названия документы не перезаписывает
+        with patch("orders.receivers.refresh_orders_search_document") as refresh:
+            self.car2.save()
+            self.reason2.save()
+        refresh.assert_not_called()
+
+        self.reason2.name = "Ремонт кузова"
+        self.reason2.save()
+        self.assertIn("РЕМОНТ КУЗОВА", self.get_search_document(self.order1))
+        self.assertIn("РЕМОНТ КУЗОВА", self.get_search_document(self.order2))
+
+        self.order1.reasons.remove(self.reason1)
+        self.assertNotIn("ДВИГАТЕЛЯ", self.get_search_document(self.order1))
+
+        self.reason2.orders.clear()
+        self.assertNotIn("КУЗОВА", self.get_search_document(self.order1))
+        self.assertNotIn("КУЗОВА", self.get_search_document(self.order2))
+
+        self.order2.reasons.add(self.reason1)
+        self.reason1.delete()
+        self.assertNotIn("ДВИГАТЕЛЯ", self.get_search_document(self.order2))
+
+    def test_search(self):
+        # Заказ-наряд с двумя подходящими причинами не дублируется и релевантнее
+        self.assertEqual(self.search("ремонт"), [self.order1.pk, self.order2.pk])
+
+        self.assertEqual(self.search("Б666ББ"), [self.order2.pk])
+        self.assertEqual(self.search("б 666"), [self.order2.pk])
+        self.assertEqual(self.search("камаз"), [self.order2.pk])
+        # Полнотекстовый поиск находит другую форму слова
+        self.assertEqual(self.search("поломки"), [self.order1.pk])
+
+        # Совпадение номера выше упоминания номера в примечании
+        self.assertEqual(self.search(str(self.order1.number)), [self.order1.pk, self.order3.pk])
@@ -1,4 +1,6 @@
+from datetime import date
 from datetime import datetime
+from decimal import Decimal
 
 from django.contrib.postgres.aggregates import ArrayAgg
 from django.db.models import DecimalField
@@ -6,24 +8,35 @@ from django.db.models import OuterRef
 from django.db.models import Q
 from django.db.models import Subquery
 from django.db.models import Sum
+from django.db.models import Value
 from django.db.models.functions import Coalesce
 
 from app.helpers.database import get_period_filter_lookup
 from app.helpers.postgresql import Round2
 from warehouse.constants import EXPENSE
 from warehouse.models import Material
+from warehouse.models import MaterialBalanceSnapshot
+from warehouse.models import Turnover
 
 
 def get_report_materials_queryset(date_begin: str, date_end: str):
-    remains_quantity = Material.objects.annotate(
-        remains_quantity=Round2(
-            Sum(
-                "turnovers__quantity",
-                filter=Q(turnovers__date__lte=datetime.strptime(date_end, "%d.%m.%Y"))
-                & Q(turnovers__warehouse=OuterRef("turnovers__warehouse")),
-            )
+    date_end_value = datetime.strptime(date_end, "%d.%m.%Y").date()
+
+    # Остаток на конец периода: последний снимок закрытого месяца плюс обороты после него
+    snapshots = MaterialBalanceSnapshot.objects.filter(
+        material=OuterRef("pk"), warehouse=OuterRef("turnovers__warehouse"), period__lte=date_end_value
+    ).order_by("-period")
+    remains_after_snapshot = (
+        Turnover.objects.filter(
+            material=OuterRef("pk"),
+            warehouse=OuterRef("turnovers__warehouse"),
+            date__gt=OuterRef("remains_period"),
+            date__lte=date_end_value,
         )
-    ).filter(pk=OuterRef("pk"))
+        .values("material")
+        .annotate(quantity_sum=Sum("quantity"))
+        .values("quantity_sum")
+    )
 
     filter_turnovers = (
         Q(turnovers__type=EXPENSE)
@@ -44,8 +57,15 @@ def get_report_materials_queryset(date_begin: str, date_end: str):
             0.0,
             output_field=DecimalField(max_digits=12, decimal_places=2),
         ),
-        remains_quantity=Subquery(remains_quantity.values("remains_quantity")),
         turnovers_pk=ArrayAgg("turnovers__pk", filter=filter_turnovers),
+        remains_period=Coalesce(Subquery(snapshots.values("period")[:1]), Value(date.min)),
+    )
+
+    queryset = queryset.annotate(
+        remains_quantity=Round2(
+            Coalesce(Subquery(snapshots.values("quantity")[:1]), Decimal(0))
+            + Coalesce(Subquery(remains_after_snapshot), Decimal(0))
+        ),
     )
 
     queryset = queryset.filter(used_quantity__lt=0.0)
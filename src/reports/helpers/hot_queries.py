@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from warehouse.models import Turnover
+
+from .get_report_cars_queryset import get_report_cars_queryset
+from .get_report_materials_queryset import get_report_materials_queryset
+from .get_report_mechanics_queryset import get_report_mechanics_queryset
+
+
+def get_hot_queries(turnover: Turnover) -> dict:
+    """
+    Запросы отчётов для проверки планов (команда explain_hot_queries)
+    Период - месяц до даты оборота turnover: {название: функция, выполняющая запросы}
+    """
+    date_begin = (turnover.date - timedelta(days=30)).strftime("%d.%m.%Y")
+    date_end = turnover.date.strftime("%d.%m.%Y")
+
+    return {
+        "get_report_materials_queryset": lambda: list(get_report_materials_queryset(date_begin, date_end)),
+        "get_report_cars_queryset": lambda: list(get_report_cars_queryset(date_begin, date_end, None)),
+        "get_report_mechanics_queryset": lambda: list(get_report_mechanics_queryset(date_begin, date_end)),
+    }
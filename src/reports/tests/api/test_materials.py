@@ -0,0 +1,86 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from rest_framework import status
+
+from app.helpers.testing import AuthorizationAPITestCase
+from app.helpers.testing import get_test_user
+from core.tests.factory import CarFactory
+from core.tests.factory import EmployeeFactory
+from orders.constants import COMPLETED
+from orders.tests.factory import OrderFactory
+from orders.tests.factory import PostFactory
+from warehouse.constants import COMING
+from warehouse.constants import EXPENSE
+from warehouse.tests.factory import EntranceFactory
+from warehouse.tests.factory import MaterialCategoryFactory
+from warehouse.tests.factory import MaterialFactory
+from warehouse.tests.factory import TurnoverFactory
+from warehouse.tests.factory import UnitFactory
+from warehouse.tests.factory import WarehouseFactory
+
+
+class ReportMaterialsApiTestCase(AuthorizationAPITestCase):
+    def test_remains_quantity(self):
+        user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material = MaterialFactory(unit=unit, category=category)
+        warehouse = WarehouseFactory()
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance)
+        TurnoverFactory(
+            user=user, type=COMING, date="2022-02-10", material=material, warehouse=warehouse, entrance=entrance
+        )
+
+        order = OrderFactory(
+            user=user,
+            status=COMPLETED,
+            post=PostFactory(),
+            car=CarFactory(),
+            driver=EmployeeFactory(type=1, position="Водитель"),
+            responsible=responsible,
+            date_begin="2022-01-15 08:00",
+            date_end="2022-01-20 17:00",
+        )
+        TurnoverFactory(
+            user=user,
+            type=EXPENSE,
+            date="2022-01-20",
+            material=material,
+            warehouse=warehouse,
+            order=order,
+            quantity=0.5,
+            sum=5.0,
+        )
+
+        url = reverse("reports-materials-list")
+        params = {"date_begin": "01.01.2022", "date_end": "31.01.2022"}
+
+        response = self.client.get(url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(float(response.data[0]["remains_quantity"]), 1.5)
+
+        # Остаток по снимкам закрытых месяцев совпадает с остатком по всем оборотам
+        call_command("close_material_periods", stdout=StringIO())
+        response = self.client.get(url, params)
+        self.assertEqual(float(response.data[0]["remains_quantity"]), 1.5)
+
+        TurnoverFactory(
+            user=user,
+            type=EXPENSE,
+            date="2022-01-10",
+            is_correction=True,
+            note="Списание",
+            material=material,
+            warehouse=warehouse,
+            quantity=0.5,
+            sum=5.0,
+        )
+        response = self.client.get(url, params)
+        self.assertEqual(float(response.data[0]["remains_quantity"]), 1.0)
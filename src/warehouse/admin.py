@@ -2,7 +2,13 @@ from django.contrib import admin
 
 from .models import Entrance
 from .models import Material
+from .models import MaterialBalance
+from .models import MaterialBalanceSnapshot
 from .models import MaterialCategory
+from .models import MaterialConsumption
+from .models import MaterialLastPrice
+from .models import Stocktake
+from .models import StocktakeLine
 from .models import Turnover
 from .models import Unit
 from .models import Warehouse
@@ -24,6 +30,30 @@ class MaterialAdmin(admin.ModelAdmin):
     pass
 
 
+class MaterialBalanceAdmin(admin.ModelAdmin):
+    pass
+
+
+class MaterialLastPriceAdmin(admin.ModelAdmin):
+    pass
+
+
+class MaterialBalanceSnapshotAdmin(admin.ModelAdmin):
+    pass
+
+
+class MaterialConsumptionAdmin(admin.ModelAdmin):
+    pass
+
+
+class StocktakeAdmin(admin.ModelAdmin):
+    pass
+
+
+class StocktakeLineAdmin(admin.ModelAdmin):
+    pass
+
+
 class EntranceAdmin(admin.ModelAdmin):
     pass
 
@@ -36,5 +66,11 @@ admin.site.register(Warehouse, WarehouseAdmin)
 admin.site.register(Unit, UnitAdmin)
 admin.site.register(MaterialCategory, MaterialCategoryAdmin)
 admin.site.register(Material, MaterialAdmin)
+admin.site.register(MaterialBalance, MaterialBalanceAdmin)
+admin.site.register(MaterialLastPrice, MaterialLastPriceAdmin)
+admin.site.register(MaterialBalanceSnapshot, MaterialBalanceSnapshotAdmin)
+admin.site.register(MaterialConsumption, MaterialConsumptionAdmin)
+admin.site.register(Stocktake, StocktakeAdmin)
+admin.site.register(StocktakeLine, StocktakeLineAdmin)
 admin.site.register(Entrance, EntranceAdmin)
 admin.site.register(Turnover, TurnoverMaterialAdmin)
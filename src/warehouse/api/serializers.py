@@ -1,23 +1,49 @@
-from django.conf import settings
+from decimal import Decimal
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Manager
+from django.db.models import Prefetch
+from django.db.models import prefetch_related_objects
+from django.db.transaction import atomic
+
+from rest_framework.serializers import BooleanField
+from rest_framework.serializers import CharField
 from rest_framework.serializers import DateField
 from rest_framework.serializers import DecimalField
 from rest_framework.serializers import Field
+from rest_framework.serializers import FileField
 from rest_framework.serializers import HiddenField
 from rest_framework.serializers import IntegerField
+from rest_framework.serializers import ListSerializer
 from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import PrimaryKeyRelatedField
 from rest_framework.serializers import Serializer
 from rest_framework.serializers import SerializerMethodField
+from rest_framework.serializers import ValidationError
 
+from app.helpers.serializers import BulkPrimaryKeyRelatedField
 from app.helpers.serializers import CurrentUserDefault
+from app.helpers.serializers import RelatedCountField
+from app.helpers.serializers import RelatedExistsField
+from app.helpers.serializers import get_lines_pk
+from app.helpers.serializers import set_bulk_related_objects
 
 from ..constants import COMING
+from ..helpers.material_balance import calculate_average_price
 from ..helpers.material_utils import get_material_in_warehouses
 from ..helpers.material_utils import get_material_prices
 from ..helpers.material_utils import get_material_remains
+from ..helpers.material_utils import get_materials_in_warehouses
+from ..helpers.material_utils import get_materials_prices
+from ..helpers.material_utils import get_materials_remains
+from ..helpers.stocktake import create_stocktake_lines
+from ..helpers.turnover_bulk_create import bulk_create_turnovers
 from ..models import Entrance
 from ..models import Material
 from ..models import MaterialCategory
+from ..models import Stocktake
+from ..models import StocktakeLine
 from ..models import Turnover
 from ..models import Unit
 from ..models import Warehouse
@@ -31,6 +57,20 @@ class PositiveExpensesTurnoverSerializerField(Field):
         return data
 
 
+class TurnoverBulkListSerializer(ListSerializer):
+    """Загружает материалы и склады всех строк двумя запросами перед проверкой строк"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            lines = [line for line in data if isinstance(line, dict)]
+            set_bulk_related_objects(
+                self.context,
+                material=Material.objects.select_related("unit").in_bulk(get_lines_pk(lines, "material")),
+                warehouse=Warehouse.objects.in_bulk(get_lines_pk(lines, "warehouse")),
+            )
+        return super().to_internal_value(data)
+
+
 class WarehouseSerializer(ModelSerializer):
     class Meta:
         model = Warehouse
@@ -41,14 +81,11 @@ class WarehouseSerializer(ModelSerializer):
 
 
 class WarehouseListSerializer(WarehouseSerializer):
-    delete_forbidden = SerializerMethodField()
+    delete_forbidden = RelatedExistsField("turnovers")
 
     class Meta(WarehouseSerializer.Meta):
         fields = WarehouseSerializer.Meta.fields + ("delete_forbidden",)
 
-    def get_delete_forbidden(self, obj):
-        return obj.turnovers.all().exists()
-
 
 class UnitSerializer(ModelSerializer):
     class Meta:
@@ -70,14 +107,11 @@ class MaterialCategorySerializer(ModelSerializer):
 
 
 class MaterialCategoryListSerializer(MaterialCategorySerializer):
-    material_count = SerializerMethodField()
+    material_count = RelatedCountField("materials")
 
     class Meta(MaterialCategorySerializer.Meta):
         fields = MaterialCategorySerializer.Meta.fields + ("material_count",)
 
-    def get_material_count(self, obj):
-        return Material.objects.filter(category=obj).count()
-
 
 class MaterialSerializer(ModelSerializer):
     class Meta:
@@ -93,7 +127,7 @@ class MaterialSerializer(ModelSerializer):
 
 
 class MaterialListSerializer(MaterialSerializer):
-    delete_forbidden = SerializerMethodField()
+    delete_forbidden = RelatedExistsField("turnovers")
     unit_name = SerializerMethodField()
     unit_is_precision_point = SerializerMethodField()
 
@@ -104,8 +138,9 @@ class MaterialListSerializer(MaterialSerializer):
             "unit_is_precision_point",
         )
 
-    def get_delete_forbidden(self, obj):
-        return obj.turnovers.all().exists()
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related("unit")
 
     def get_unit_name(self, obj):
         if obj.unit:
@@ -118,6 +153,20 @@ class MaterialListSerializer(MaterialSerializer):
         return None
 
 
+class MaterialAvailabilityListSerializer(ListSerializer):
+    """Наличие по складам, цены и остатки всех материалов списка загружаются пакетно за фиксированное число запросов"""
+
+    def to_representation(self, data):
+        materials = list(data.all() if isinstance(data, Manager) else data)
+        materials_pk = [material.pk for material in materials]
+        self.context["materials_availability"] = {
+            "warehouses_availability": get_materials_in_warehouses(materials_pk),
+            "prices": get_materials_prices(materials_pk),
+            "quantity": get_materials_remains(materials_pk),
+        }
+        return super().to_representation(materials)
+
+
 class MaterialAvailabilitySerializer(ModelSerializer):
     warehouses_availability = SerializerMethodField()
     prices = SerializerMethodField()
@@ -136,14 +185,25 @@ class MaterialAvailabilitySerializer(ModelSerializer):
             "unit_name",
             "unit_is_precision_point",
         )
+        list_serializer_class = MaterialAvailabilityListSerializer
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related("unit")
 
     def get_warehouses_availability(self, obj):
+        if "materials_availability" in self.context:
+            return self.context["materials_availability"]["warehouses_availability"].get(obj.pk, [])
         return get_material_in_warehouses(obj.pk)
 
     def get_prices(self, obj):
+        if "materials_availability" in self.context:
+            return self.context["materials_availability"]["prices"][obj.pk]
         return get_material_prices(obj.pk)
 
     def get_quantity(self, obj):
+        if "materials_availability" in self.context:
+            return self.context["materials_availability"]["quantity"][obj.pk]
         return get_material_remains(obj.pk)
 
     def get_unit_name(self, obj):
@@ -219,8 +279,22 @@ class TurnoverNestedWriteSerializer(TurnoverSerializer):
 
 
 class TurnoverOrderNestedWriteSerializer(TurnoverNestedWriteSerializer):
+    """Цена и сумма списания необязательны, по умолчанию берётся текущая средняя цена на складе"""
+
+    price = DecimalField(max_digits=12, decimal_places=2, coerce_to_string=False, required=False)
     quantity = PositiveExpensesTurnoverSerializerField()
-    sum = PositiveExpensesTurnoverSerializerField()
+    sum = PositiveExpensesTurnoverSerializerField(required=False)
+
+
+class TurnoverEntranceNestedWriteSerializer(TurnoverNestedWriteSerializer):
+    """Строка прихода: пользователь берётся из прихода, материалы и склады загружаются пакетом"""
+
+    user = HiddenField(default=None)
+    material = BulkPrimaryKeyRelatedField(queryset=Material.objects.all())
+    warehouse = BulkPrimaryKeyRelatedField(queryset=Warehouse.objects.all())
+
+    class Meta(TurnoverNestedWriteSerializer.Meta):
+        list_serializer_class = TurnoverBulkListSerializer
 
 
 class TurnoverMaterialReadSerializer(ModelSerializer):
@@ -283,6 +357,26 @@ class TurnoverMovingMaterialSerializer(Serializer):
     sum = DecimalField(max_digits=18, decimal_places=2, coerce_to_string=False)
 
 
+class TurnoverMovingMaterialLineSerializer(Serializer):
+    material = IntegerField()
+    quantity = DecimalField(max_digits=18, decimal_places=2, coerce_to_string=False)
+    price = DecimalField(max_digits=18, decimal_places=2, coerce_to_string=False)
+    sum = DecimalField(max_digits=18, decimal_places=2, coerce_to_string=False)
+
+
+class TurnoverMovingMaterialsSerializer(Serializer):
+    date = DateField(**settings.SERIALIZER_DATE_PARAMS)
+    warehouse_outgoing = IntegerField()
+    warehouse_incoming = IntegerField()
+    materials = TurnoverMovingMaterialLineSerializer(many=True, allow_empty=False)
+
+
+class EntranceImportSerializer(Serializer):
+    file = FileField()
+    warehouse = PrimaryKeyRelatedField(queryset=Warehouse.objects.all())
+    commit = BooleanField(default=False)
+
+
 class EntranceListSerializer(ModelSerializer):
     date = DateField(**settings.SERIALIZER_DATE_PARAMS)
 
@@ -300,7 +394,7 @@ class EntranceListSerializer(ModelSerializer):
 class EntranceSerializer(ModelSerializer):
     user = HiddenField(default=CurrentUserDefault())
     date = DateField(**settings.SERIALIZER_DATE_PARAMS)
-    turnovers_from_entrance = TurnoverNestedWriteSerializer(many=True)
+    turnovers_from_entrance = TurnoverEntranceNestedWriteSerializer(many=True)
 
     class Meta:
         model = Entrance
@@ -322,18 +416,16 @@ class EntranceSerializer(ModelSerializer):
         validated_data = super().run_validation(data=data)
         return validated_data
 
+    @atomic
     def create(self, validated_data):
         turnovers_from_entrance = validated_data.pop("turnovers_from_entrance")
 
         entrance = self.Meta.model.objects.create(**validated_data)
-
-        for turnover_material in turnovers_from_entrance:
-            turnover_material["date"] = entrance.date
-            turnover_material["user"] = entrance.user
-            entrance.turnovers_from_entrance.create(**turnover_material)
+        self.create_turnovers(entrance, turnovers_from_entrance)
 
         return entrance
 
+    @atomic
     def update(self, instance, validated_data):
         turnovers_from_entrance = validated_data.pop("turnovers_from_entrance")
 
@@ -343,14 +435,54 @@ class EntranceSerializer(ModelSerializer):
         instance.save()
 
         # Сохраняем только вновь добавленные материалы
-        for turnover_material in turnovers_from_entrance:
-            if "pk" not in turnover_material or turnover_material["pk"] is None:
-                turnover_material["date"] = instance.date
-                turnover_material["user"] = instance.user
-                instance.turnovers_from_entrance.create(**turnover_material)
+        self.create_turnovers(
+            instance,
+            [
+                turnover_material
+                for turnover_material in turnovers_from_entrance
+                if "pk" not in turnover_material or turnover_material["pk"] is None
+            ],
+        )
 
         return instance
 
+    def create_turnovers(self, entrance, turnovers_from_entrance):
+        """Строки прихода записываются одним пакетом"""
+        turnovers = []
+        for turnover_material in turnovers_from_entrance:
+            turnover_material.pop("pk", None)
+            turnover_material["date"] = entrance.date
+            turnover_material["user"] = entrance.user
+            turnovers.append(Turnover(entrance=entrance, **turnover_material))
+
+        try:
+            bulk_create_turnovers(turnovers)
+        except DjangoValidationError as e:
+            # Проверка оборотов при записи - ошибка данных запроса (400), а не сервера
+            raise ValidationError({"turnovers_from_entrance": e.message_dict})
+
+        # Строки для ответа одним запросом вместе с материалами и складами
+        prefetch_related_objects(
+            [entrance],
+            Prefetch(
+                "turnovers_from_entrance", queryset=Turnover.objects.select_related("material__unit", "warehouse")
+            ),
+        )
+
+
+class MaterialReorderSerializer(Serializer):
+    """Строка списка на закупку (get_reorder_queryset)"""
+
+    material = IntegerField()
+    material_name = CharField(source="material__name")
+    unit_name = CharField(source="material__unit__name")
+    warehouse = IntegerField()
+    warehouse_name = CharField(source="warehouse__name")
+    remains = DecimalField(max_digits=12, decimal_places=2, coerce_to_string=False)
+    daily_quantity = DecimalField(max_digits=15, decimal_places=4, coerce_to_string=False)
+    days_of_cover = DecimalField(max_digits=15, decimal_places=2, coerce_to_string=False)
+    reorder_quantity = DecimalField(max_digits=15, decimal_places=2, coerce_to_string=False)
+
 
 class MaterialRemainsSerializer(ModelSerializer):
     pk = SerializerMethodField()
@@ -404,6 +536,9 @@ class MaterialRemainsSerializer(ModelSerializer):
 
     def get_warehouses_availability(self, obj):
         if obj["quantity"] and obj["quantity"] > 0.00:
+            # Наличие загружается сразу для всей страницы (см. MaterialRemainsListView.list)
+            if "warehouses_availability" in self.context:
+                return self.context["warehouses_availability"].get(obj["pk"], [])
             return get_material_in_warehouses(obj["pk"], True)
         return []
 
@@ -413,9 +548,7 @@ class MaterialRemainsSerializer(ModelSerializer):
         return 0.00
 
     def get_price(self, obj):
-        if obj["quantity"] and obj["sum"]:
-            return round(obj["sum"] / obj["quantity"], 2)
-        return 0.00
+        return calculate_average_price(obj["sum"], obj["quantity"])
 
     def get_sum(self, obj):
         if obj["sum"]:
@@ -468,10 +601,10 @@ class MaterialRemainsCategorySerializer(ModelSerializer):
         return obj["unit__is_precision_point"]
 
     def get_warehouse(self, obj):
-        return obj["turnovers__warehouse"]
+        return obj["balances__warehouse"]
 
     def get_warehouse_name(self, obj):
-        return obj["turnovers__warehouse__name"]
+        return obj["balances__warehouse__name"]
 
     def get_compatbility(self, obj):
         return obj["compatbility"]
@@ -482,11 +615,74 @@ class MaterialRemainsCategorySerializer(ModelSerializer):
         return 0.00
 
     def get_price(self, obj):
-        if obj["quantity"] and obj["sum"]:
-            return round(obj["sum"] / obj["quantity"], 2)
-        return 0.00
+        return calculate_average_price(obj["sum"], obj["quantity"])
 
     def get_sum(self, obj):
         if obj["sum"]:
             return obj["sum"]
         return 0.00
+
+
+class StocktakeSerializer(ModelSerializer):
+    user = HiddenField(default=CurrentUserDefault())
+    date = DateField(**settings.SERIALIZER_DATE_PARAMS)
+    warehouse_name = CharField(source="warehouse.name", read_only=True)
+
+    class Meta:
+        model = Stocktake
+        fields = (
+            "pk",
+            "user",
+            "warehouse",
+            "warehouse_name",
+            "date",
+            "status",
+            "note",
+        )
+        read_only_fields = ("status",)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related("warehouse")
+
+    @atomic
+    def create(self, validated_data):
+        stocktake = super().create(validated_data)
+        create_stocktake_lines(stocktake)
+        return stocktake
+
+
+class StocktakeLineSerializer(ModelSerializer):
+    material_name = CharField(source="material.name", read_only=True)
+    unit_name = CharField(source="material.unit.name", read_only=True)
+    difference = SerializerMethodField()
+
+    class Meta:
+        model = StocktakeLine
+        fields = (
+            "pk",
+            "material",
+            "material_name",
+            "unit_name",
+            "expected_quantity",
+            "counted_quantity",
+            "difference",
+            "price",
+        )
+
+    def get_difference(self, obj):
+        if obj.counted_quantity is None:
+            return None
+        return obj.counted_quantity - obj.expected_quantity
+
+
+class StocktakeCountSerializer(Serializer):
+    material = IntegerField()
+    counted_quantity = DecimalField(max_digits=12, decimal_places=2, min_value=0, coerce_to_string=False)
+    price = DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal("0.01"), coerce_to_string=False, required=False
+    )
+
+
+class StocktakeCountsSerializer(Serializer):
+    lines = StocktakeCountSerializer(many=True, allow_empty=False)
@@ -1,6 +1,15 @@
-from django.db.models import Q
+import csv
+import tempfile
+from datetime import datetime
+from urllib.parse import quote
+from zipfile import BadZipFile
+
+from django.core.exceptions import ValidationError
+from django.http import FileResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
+from openpyxl.utils.exceptions import InvalidFileException
 from rest_framework import status
 from rest_framework.generics import GenericAPIView
 from rest_framework.generics import ListAPIView
@@ -18,15 +27,31 @@ from authentication.utils import get_current_user
 from orders.constants import COMPLETED
 
 from ..helpers.entrance_general_search import entrance_general_search
+from ..helpers.entrance_import import import_invoice
 from ..helpers.get_provider_list import get_provider_list
 from ..helpers.get_queryset_materials_remains import get_queryset_materials_remains
+from ..helpers.material_consumption import get_reorder_queryset
+from ..helpers.material_reservation import InsufficientStockError
+from ..helpers.material_search import search_materials
+from ..helpers.material_utils import get_materials_in_warehouses
+from ..helpers.stocktake import check_stocktake_draft
+from ..helpers.stocktake import post_stocktake
+from ..helpers.stocktake import set_stocktake_counts
+from ..helpers.turnover_export import get_turnovers_export_queryset
+from ..helpers.turnover_export import iter_turnovers_csv
+from ..helpers.turnover_export import write_turnovers_xlsx
 from ..helpers.turnover_moving_material import turnover_moving_material
+from ..helpers.turnover_moving_material import turnover_moving_materials
 from ..models import Entrance
 from ..models import Material
 from ..models import MaterialCategory
+from ..models import MaterialConsumption
+from ..models import Stocktake
+from ..models import StocktakeLine
 from ..models import Turnover
 from ..models import Unit
 from ..models import Warehouse
+from .serializers import EntranceImportSerializer
 from .serializers import EntranceListSerializer
 from .serializers import EntranceSerializer
 from .serializers import MaterialAvailabilitySerializer
@@ -35,16 +60,21 @@ from .serializers import MaterialCategorySerializer
 from .serializers import MaterialListSerializer
 from .serializers import MaterialRemainsCategorySerializer
 from .serializers import MaterialRemainsSerializer
+from .serializers import MaterialReorderSerializer
 from .serializers import MaterialSerializer
+from .serializers import StocktakeCountsSerializer
+from .serializers import StocktakeLineSerializer
+from .serializers import StocktakeSerializer
 from .serializers import TurnoverMaterialReadSerializer
 from .serializers import TurnoverMovingMaterialSerializer
+from .serializers import TurnoverMovingMaterialsSerializer
 from .serializers import TurnoverSerializer
 from .serializers import UnitSerializer
 from .serializers import WarehouseListSerializer
 from .serializers import WarehouseSerializer
 
 
-class WarehouseListView(CreateModelMixin, GenericAPIView):
+class WarehouseListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """Список складов"""
 
     queryset = Warehouse.objects.all()
@@ -124,7 +154,7 @@ class UnitDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, Ge
         return self.destroy(request, *args, **kwargs)
 
 
-class MaterialCategoryListView(CreateModelMixin, GenericAPIView):
+class MaterialCategoryListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """Список категорий материалов"""
 
     queryset = MaterialCategory.objects.all()
@@ -166,7 +196,7 @@ class MaterialCategoryDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyMo
         return self.destroy(request, *args, **kwargs)
 
 
-class MaterialListView(CreateModelMixin, GenericAPIView):
+class MaterialListView(EagerLoadingMixin, CreateModelMixin, GenericAPIView):
     """
     Список материалов
 
@@ -190,7 +220,7 @@ class MaterialListView(CreateModelMixin, GenericAPIView):
 
         general_search = self.request.query_params.get("general_search")
         if general_search:
-            queryset = queryset.filter(Q(name__icontains=general_search) | Q(compatbility__icontains=general_search))
+            queryset = search_materials(queryset, general_search).order_by("-search_rank", "name")
 
         return queryset
 
@@ -203,6 +233,34 @@ class MaterialListView(CreateModelMixin, GenericAPIView):
         return self.create(request, *args, **kwargs)
 
 
+class MaterialAvailabilityListView(EagerLoadingMixin, GenericAPIView):
+    """
+    Наличие по складам, цены и остатки нескольких материалов для формы заказ-наряда,
+    то же что MaterialDetailView с availability_mode=true, но одним запросом для всех материалов
+
+    Filters: materials(list(int) через запятую)
+    """
+
+    serializer_class = MaterialAvailabilitySerializer
+    queryset = Material.objects.all()
+
+    def get(self, request, *args, **kwargs):
+        materials = request.query_params.get("materials", "").split(",")
+        if not all(material_pk.strip().isdigit() for material_pk in materials):
+            return Response(
+                {"errors": {"materials": ("Список материалов должен содержать id через запятую")}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        materials_pk = [int(material_pk) for material_pk in materials]
+        # Материалы в порядке запроса
+        materials = self.get_queryset().in_bulk(materials_pk)
+        queryset = [materials[material_pk] for material_pk in dict.fromkeys(materials_pk) if material_pk in materials]
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
 class MaterialDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, GenericAPIView):
     """
     Материал
@@ -241,6 +299,7 @@ class EntranceListView(EagerLoadingMixin, ListAPIView, CreateModelMixin):
 
     Filters: date_begin(date_str), date_end(date_str)
     Search's: general_search (provider, document_number, turnovers_from_entrance__material__name)
+    Pagination: page или pagination=cursor, cursor (без COUNT, для прокрутки длинных списков)
     """
 
     queryset = Entrance.objects.all()
@@ -268,6 +327,69 @@ class EntranceListView(EagerLoadingMixin, ListAPIView, CreateModelMixin):
         return self.create(request, *args, **kwargs)
 
 
+class EntranceImportView(GenericAPIView):
+    """
+    Импорт накладной поставщика (CSV, XLSX) в поступление
+
+    Params: file, warehouse(int), commit(bool),
+    при commit=true - поля поступления: date, document_number, responsible, provider, note
+    Columns: Артикул, Наименование, Количество, Цена, Сумма (необязательно)
+    Без commit возвращает предпросмотр строк, с commit - создаёт поступление, если все строки сопоставлены
+    """
+
+    serializer_class = EntranceImportSerializer
+    queryset = Entrance.objects.none()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            lines = import_invoice(serializer.validated_data["file"])
+        except UnicodeDecodeError:
+            return Response(
+                {"errors": {"file": ("Неверная кодировка файла, ожидается UTF-8 или Windows-1251")}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except (BadZipFile, InvalidFileException, csv.Error):
+            return Response(
+                {"errors": {"file": ("Файл повреждён или не является накладной CSV или XLSX")}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        unmatched_count = len([line for line in lines if line["error"]])
+        preview = {
+            "lines": lines,
+            "matched_count": len(lines) - unmatched_count,
+            "unmatched_count": unmatched_count,
+        }
+
+        if not serializer.validated_data["commit"]:
+            return Response(preview)
+
+        if unmatched_count or not lines:
+            return Response(preview, status=status.HTTP_400_BAD_REQUEST)
+
+        entrance_fields = ("date", "document_number", "responsible", "provider", "note")
+        data = {field: request.data.get(field) for field in entrance_fields if field in request.data}
+        data["turnovers_from_entrance"] = [
+            {
+                "pk": None,
+                "date": data.get("date"),
+                "material": line["material"],
+                "warehouse": serializer.validated_data["warehouse"].pk,
+                "price": line["price"],
+                "quantity": line["quantity"],
+                "sum": line["sum"],
+            }
+            for line in lines
+        ]
+
+        entrance_serializer = EntranceSerializer(data=data, context=self.get_serializer_context())
+        entrance_serializer.is_valid(raise_exception=True)
+        entrance_serializer.save()
+        return Response(entrance_serializer.data, status=status.HTTP_201_CREATED)
+
+
 class EntranceDetailView(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, GenericAPIView):
     """Поступление"""
 
@@ -329,7 +451,10 @@ class TurnoverListView(GenericAPIView, CreateModelMixin):
         return Response(serializer.data)
 
     def post(self, request, *args, **kwargs):
-        return self.create(request, *args, **kwargs)
+        try:
+            return self.create(request, *args, **kwargs)
+        except InsufficientStockError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_409_CONFLICT)
 
 
 class TurnoverMaterialListView(EagerLoadingMixin, ListAPIView):
@@ -337,6 +462,7 @@ class TurnoverMaterialListView(EagerLoadingMixin, ListAPIView):
     Обороты по материалу
 
     Filters: type
+    Pagination: page или pagination=cursor, cursor (без COUNT, для прокрутки длинных списков)
     """
 
     serializer_class = TurnoverMaterialReadSerializer
@@ -439,6 +565,22 @@ class MaterialRemainsListView(EagerLoadingMixin, ListAPIView):
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        materials = page if page is not None else list(queryset)
+
+        context = self.get_serializer_context()
+        context["warehouses_availability"] = get_materials_in_warehouses(
+            [material["pk"] for material in materials if material["quantity"] and material["quantity"] > 0.00], True
+        )
+        serializer = self.get_serializer_class()(materials, many=True, context=context)
+
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
 
 class MaterialRemainsCategoryListView(EagerLoadingMixin, ListAPIView):
     """
@@ -488,6 +630,32 @@ class MaterialRemainsCategoryListView(EagerLoadingMixin, ListAPIView):
         return Response(serializer.data)
 
 
+class MaterialReorderListView(GenericAPIView):
+    """
+    Список на закупку: материалы, которых при среднем расходе за CONSUMPTION_WINDOW_DAYS дней
+    хватит меньше чем на days дней. Расход предрасчитан командой refresh_material_consumption
+
+    Filters: days(int, по умолчанию 14), warehouse(int), category(int)
+    """
+
+    serializer_class = MaterialReorderSerializer
+    queryset = MaterialConsumption.objects.none()
+
+    def get(self, request, *args, **kwargs):
+        days = request.query_params.get("days", "14")
+        if not days.isdigit() or int(days) == 0:
+            return Response(
+                {"errors": {"days": ("Количество дней должно быть целым числом больше 0")}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = get_reorder_queryset(
+            int(days), request.query_params.get("warehouse"), request.query_params.get("category")
+        )
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
 class TurnoverMovingMaterialView(GenericAPIView):
     serializer_class = TurnoverMovingMaterialSerializer
     queryset = Turnover.objects.none()
@@ -503,5 +671,175 @@ class TurnoverMovingMaterialView(GenericAPIView):
         try:
             turnover_moving_material(serializer.data, user)
             return Response(data={"message": "Успешно перемещено"}, status=status.HTTP_201_CREATED)
+        except InsufficientStockError as e:
+            return Response(
+                data={"message": "Ошибка при перемещении", "errors": e.message_dict},
+                status=status.HTTP_409_CONFLICT,
+            )
         except Exception:
             return Response(data={"message": "Ошибка при перемещении"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TurnoverMovingMaterialsView(GenericAPIView):
+    """
+    Перемещение нескольких материалов между складами одним запросом
+
+    Params: date, warehouse_outgoing(int), warehouse_incoming(int), materials(list(material, quantity, price, sum))
+    """
+
+    serializer_class = TurnoverMovingMaterialsSerializer
+    queryset = Turnover.objects.none()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = get_current_user(request)
+
+        try:
+            turnover_moving_materials(serializer.validated_data, user)
+            return Response(data={"message": "Успешно перемещено"}, status=status.HTTP_201_CREATED)
+        except InsufficientStockError as e:
+            return Response(
+                data={"message": "Ошибка при перемещении", "errors": e.message_dict},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except ValidationError as e:
+            return Response(
+                data={"message": "Ошибка при перемещении", "errors": e.message_dict},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+
+class TurnoverExportView(GenericAPIView):
+    """
+    Выгрузка журнала оборотов для сверки с бухгалтерией
+
+    Filters: date_begin(date_str), date_end(date_str), warehouse(int), category(int), turnover_type(int)
+    Params: file_format(csv, xlsx)
+    CSV отдаётся потоком по мере чтения строк, XLSX собирается во временном файле и отдаётся потоком
+    """
+
+    queryset = Turnover.objects.none()
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in ("csv", "xlsx"):
+            return Response(
+                {"errors": {"file_format": ("Формат файла должен быть csv или xlsx")}},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = get_turnovers_export_queryset(
+            date_begin=request.query_params.get("date_begin"),
+            date_end=request.query_params.get("date_end"),
+            warehouse=request.query_params.get("warehouse"),
+            category=request.query_params.get("category"),
+            turnover_type=request.query_params.get("turnover_type"),
+        )
+        filename = f"Обороты {datetime.today().strftime('%d%m%Y%H%M%S')}.{file_format}"
+
+        if file_format == "xlsx":
+            file = tempfile.TemporaryFile()
+            write_turnovers_xlsx(queryset, file)
+            file.seek(0)
+            return FileResponse(file, as_attachment=True, filename=filename)
+
+        response = StreamingHttpResponse(iter_turnovers_csv(queryset), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        return response
+
+
+class StocktakeListView(EagerLoadingMixin, ListAPIView, CreateModelMixin):
+    """
+    Список инвентаризаций, при создании фиксируются учётные остатки склада
+
+    Filters: warehouse(int), status(int)
+    """
+
+    serializer_class = StocktakeSerializer
+    queryset = Stocktake.objects.all()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        warehouse = self.request.query_params.get("warehouse")
+        if warehouse:
+            queryset = queryset.filter(warehouse=warehouse)
+
+        stocktake_status = self.request.query_params.get("status")
+        if stocktake_status:
+            queryset = queryset.filter(status=stocktake_status)
+
+        return queryset
+
+    def post(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+
+class StocktakeDetailView(RetrieveModelMixin, DestroyModelMixin, GenericAPIView):
+    """Инвентаризация, удалить можно только не проведённую"""
+
+    serializer_class = StocktakeSerializer
+    queryset = Stocktake.objects.all()
+
+    def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
+    def delete(self, request, *args, **kwargs):
+        try:
+            check_stocktake_draft(self.get_object())
+        except ValidationError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.destroy(request, *args, **kwargs)
+
+
+class StocktakeLineListView(EagerLoadingMixin, ListAPIView):
+    """
+    Строки инвентаризации
+
+    Filters: is_counted(bool)
+    Params (POST): lines(list(material, counted_quantity, price)) - посчитанные количества,
+    записываются одним запросом, цена нужна только для материалов без цены на складе
+    """
+
+    serializer_class = StocktakeLineSerializer
+
+    def get_queryset(self):
+        queryset = StocktakeLine.objects.filter(stocktake=self.kwargs["pk"]).select_related("material__unit")
+
+        is_counted = self.request.query_params.get("is_counted")
+        if is_counted:
+            queryset = queryset.filter(counted_quantity__isnull=is_counted != "true")
+
+        return queryset
+
+    def post(self, request, *args, **kwargs):
+        stocktake = get_object_or_404(Stocktake, pk=self.kwargs["pk"])
+        serializer = StocktakeCountsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            count = set_stocktake_counts(stocktake, serializer.validated_data["lines"])
+        except ValidationError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"lines_count": count})
+
+
+class StocktakePostView(GenericAPIView):
+    """Проведение инвентаризации: корректировки по всем расхождениям создаются в одной транзакции"""
+
+    serializer_class = StocktakeSerializer
+    queryset = Stocktake.objects.all()
+
+    def post(self, request, *args, **kwargs):
+        stocktake = self.get_object()
+
+        try:
+            turnovers = post_stocktake(stocktake, get_current_user(request))
+        except ValidationError as e:
+            return Response({"errors": e.message_dict}, status=status.HTTP_400_BAD_REQUEST)
+
+        stocktake.refresh_from_db()
+        return Response({**self.get_serializer(stocktake).data, "turnovers_count": len(turnovers)})
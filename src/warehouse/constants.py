@@ -1,3 +1,10 @@
 COMING = 1
 EXPENSE = 2
 TURNOVER_TYPE = ((COMING, "Приход"), (EXPENSE, "Расход"))
+
+# Скользящее окно расчёта среднего расхода материалов, дней
+CONSUMPTION_WINDOW_DAYS = 90
+
+STOCKTAKE_DRAFT = 1
+STOCKTAKE_POSTED = 2
+STOCKTAKE_STATUS = ((STOCKTAKE_DRAFT, "Черновик"), (STOCKTAKE_POSTED, "Проведена"))
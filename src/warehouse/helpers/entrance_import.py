@@ -0,0 +1,184 @@
+import codecs
+import csv
+from decimal import ROUND_HALF_UP
+from decimal import Decimal
+from decimal import InvalidOperation
+from itertools import chain
+from itertools import islice
+
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from openpyxl import load_workbook
+
+from ..models import Material
+from .material_balance import calculate_sum
+
+IMPORT_BATCH_SIZE = 500
+
+# Допустимые заголовки столбцов накладной (в нижнем регистре)
+INVOICE_COLUMNS = {
+    "article_number": ("артикул", "код", "article_number", "article"),
+    "name": ("наименование", "материал", "name"),
+    "quantity": ("количество", "кол-во", "quantity"),
+    "price": ("цена", "price"),
+    "sum": ("сумма", "sum"),
+}
+
+
+def iter_decoded_lines(file):
+    """
+    Строки CSV в UTF-8 (с BOM или без) или в cp1251 (выгрузка 1С и Excel).
+    Кодировка определяется по первой строке с не-ASCII символами: не UTF-8 - значит cp1251
+    """
+    encoding = None
+    for number, line in enumerate(file):
+        if number == 0 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8) :]
+
+        if encoding is None and not line.isascii():
+            try:
+                line.decode("utf-8")
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                encoding = "cp1251"
+
+        yield line.decode(encoding or "ascii")
+
+
+def iter_csv_rows(file):
+    lines = iter_decoded_lines(file)
+    first_line = next(lines, "")
+    delimiter = ";" if first_line.count(";") >= first_line.count(",") else ","
+    return csv.reader(chain([first_line], lines), delimiter=delimiter)
+
+
+def iter_xlsx_rows(file):
+    wb = load_workbook(file, read_only=True, data_only=True)
+    return wb.active.iter_rows(values_only=True)
+
+
+def get_columns(header) -> dict | None:
+    """Номера столбцов по строке заголовка, None - если первая строка не заголовок"""
+    header = [str(value or "").strip().lower() for value in header]
+    columns = {
+        key: header.index(title) for key, titles in INVOICE_COLUMNS.items() for title in titles if title in header
+    }
+    if "quantity" in columns and "price" in columns:
+        return columns
+    return None
+
+
+def to_str(value) -> str:
+    # Коды из XLSX могут прийти числом (12345.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value if value is not None else "").strip()
+
+
+def to_decimal(value):
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return Decimal(str(value).replace(" ", "").replace("\xa0", "").replace(",", ".")).quantize(
+            Decimal("0.01"), rounding=ROUND_HALF_UP
+        )
+    except InvalidOperation:
+        raise ValueError(f"Неверное число: {value}")
+
+
+def read_invoice_lines(file):
+    """Построчно читает накладную (CSV или XLSX) и возвращает строки в виде dict"""
+    if file.name.lower().endswith(".xlsx"):
+        rows = iter_xlsx_rows(file)
+    else:
+        rows = iter_csv_rows(file)
+
+    first_row = next(rows, None)
+    if first_row is None:
+        return
+
+    columns = get_columns(first_row)
+    row_number = 1
+    if columns is None:
+        # Без заголовка столбцы идут в порядке INVOICE_COLUMNS
+        columns = {key: number for number, key in enumerate(INVOICE_COLUMNS)}
+        rows = chain([first_row], rows)
+        row_number = 0
+
+    for row in rows:
+        row_number += 1
+        if not any(str(value or "").strip() for value in row):
+            continue
+
+        values = {key: row[number] if number < len(row) else None for key, number in columns.items()}
+        line = {
+            "row": row_number,
+            "article_number": to_str(values.get("article_number")),
+            "name": to_str(values.get("name")),
+            "material": None,
+            "material_name": "",
+            "quantity": None,
+            "price": None,
+            "sum": None,
+            "error": "",
+        }
+
+        try:
+            line["quantity"] = to_decimal(values.get("quantity"))
+            line["price"] = to_decimal(values.get("price"))
+            line["sum"] = to_decimal(values.get("sum"))
+        except ValueError as e:
+            line["error"] = str(e)
+            yield line
+            continue
+
+        if not line["quantity"] or not line["price"] or line["quantity"] < 0 or line["price"] < 0:
+            line["error"] = "Количество и цена должны быть больше 0"
+            yield line
+            continue
+
+        # Сумма оборота при записи проверяется по цене и количеству, расхождение видно уже в предпросмотре
+        expected_sum = calculate_sum(line["price"], line["quantity"])
+        if line["sum"] is None:
+            line["sum"] = expected_sum
+        elif line["sum"] != expected_sum:
+            line["error"] = f"Сумма не равна количеству, умноженному на цену: {expected_sum}"
+
+        yield line
+
+
+def match_materials(lines: list):
+    """Сопоставляет строки с материалами по артикулу или наименованию одним запросом на пакет"""
+    article_numbers = {line["article_number"] for line in lines if line["article_number"]}
+    names = {line["name"].upper() for line in lines if line["name"]}
+
+    materials = (
+        Material.objects.annotate(name_upper=Upper("name"))
+        .filter(Q(article_number__in=article_numbers) | Q(name_upper__in=names))
+        .values("pk", "name", "name_upper", "article_number")
+    )
+    by_article_number = {}
+    by_name = {}
+    for material in materials:
+        if material["article_number"]:
+            by_article_number[material["article_number"]] = material
+        by_name[material["name_upper"]] = material
+
+    for line in lines:
+        material = by_article_number.get(line["article_number"]) or by_name.get(line["name"].upper())
+        if material:
+            line["material"] = material["pk"]
+            line["material_name"] = material["name"]
+        elif not line["error"]:
+            line["error"] = "Материал не найден"
+
+
+def import_invoice(file) -> list:
+    """Строки накладной с найденными материалами, материалы ищутся пакетами по IMPORT_BATCH_SIZE строк"""
+    result = []
+    lines = read_invoice_lines(file)
+    while batch := list(islice(lines, IMPORT_BATCH_SIZE)):
+        match_materials(batch)
+        result += batch
+    return result
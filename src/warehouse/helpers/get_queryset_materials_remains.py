@@ -4,6 +4,7 @@ from django.db.models import Sum
 from app.helpers.postgresql import Round2
 
 from ..models import Material
+from .material_search import search_materials
 
 
 def get_queryset_materials_remains(
@@ -26,24 +27,26 @@ def get_queryset_materials_remains(
     elif compatbility:
         queryset = queryset.filter(compatbility__overlap=[car_tag for car_tag in compatbility.split(",")])
 
+    ordering = ("name",)
     if search_name:
-        queryset = queryset.filter(name__icontains=search_name)
+        queryset = search_materials(queryset, search_name, with_compatbility=False)
+        ordering = ("-search_rank", "name")
 
-    quantity_annotate = Sum("turnovers__quantity")
-    sum_annotate = Sum("turnovers__sum")
+    quantity_annotate = Sum("balances__quantity")
+    sum_annotate = Sum("balances__sum")
     values = ["pk", "name", "category", "category__name", "unit__name", "unit__is_precision_point", "compatbility"]
 
     if warehouse:
-        quantity_annotate = Sum("turnovers__quantity", filter=Q(turnovers__warehouse=warehouse))
-        sum_annotate = Sum("turnovers__sum", filter=Q(turnovers__warehouse=warehouse))
+        quantity_annotate = Sum("balances__quantity", filter=Q(balances__warehouse=warehouse))
+        sum_annotate = Sum("balances__sum", filter=Q(balances__warehouse=warehouse))
 
     if group_warehouse:
-        values.extend(["turnovers__warehouse", "turnovers__warehouse__name"])
+        values.extend(["balances__warehouse", "balances__warehouse__name"])
 
     queryset = (
         queryset.values(*values)
         .annotate(quantity=Round2(quantity_annotate), sum=Round2(sum_annotate))
-        .order_by("name")
+        .order_by(*ordering)
     )
 
     if hide_empty == "true" or warehouse:
@@ -0,0 +1,34 @@
+from ..constants import COMING
+from ..models import Turnover
+from .material_last_price import refresh_material_last_prices
+from .material_utils import get_material_remains
+from .material_utils import get_materials_in_warehouses
+from .material_utils import get_materials_prices
+from .material_utils import get_materials_remains
+from .material_utils import get_materials_remains_in_warehouse
+
+
+def get_hot_queries(turnover: Turnover) -> dict:
+    """
+    Часто выполняемые запросы склада для проверки планов (команда explain_hot_queries)
+    Параметры берутся из оборота turnover: {название: функция, выполняющая запросы}
+    """
+    material_pk = turnover.material_id
+    warehouse_pk = turnover.warehouse_id
+    material_turnovers = Turnover.objects.filter(material=material_pk).order_by("-date", "-pk")
+
+    return {
+        "get_material_remains": lambda: get_material_remains(material_pk, warehouse_pk, turnover.date),
+        "get_materials_remains_in_warehouse": lambda: get_materials_remains_in_warehouse(
+            [material_pk], warehouse_pk, turnover.date
+        ),
+        "get_materials_in_warehouses": lambda: get_materials_in_warehouses([material_pk]),
+        "get_materials_prices": lambda: get_materials_prices([material_pk]),
+        "get_materials_remains": lambda: get_materials_remains([material_pk], turnover.date),
+        "refresh_material_last_prices": lambda: refresh_material_last_prices([material_pk]),
+        "material_turnovers": lambda: list(material_turnovers[:50]),
+        "material_warehouse_turnovers": lambda: list(material_turnovers.filter(warehouse=warehouse_pk)[:50]),
+        "material_purchases": lambda: list(material_turnovers.filter(type=COMING, is_correction=False)[:50]),
+        "order_turnovers": lambda: list(Turnover.objects.filter(order=turnover.order_id)),
+        "entrance_turnovers": lambda: list(Turnover.objects.filter(entrance=turnover.entrance_id)),
+    }
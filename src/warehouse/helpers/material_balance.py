@@ -0,0 +1,157 @@
+from collections import defaultdict
+from decimal import ROUND_HALF_UP
+from decimal import Decimal
+
+from django.db import connection
+from django.db import transaction
+from django.db.models import Sum
+
+from ..models import MaterialBalance
+from ..models import Turnover
+
+
+def calculate_average_price(sum_, quantity) -> Decimal:
+    """
+    Средневзвешенная цена по сумме и количеству остатка, округление как у ROUND в PostgreSQL.
+    Единое правило для хранимой средней цены и для цен, считаемых по сгруппированным остаткам
+    """
+    if not quantity or quantity <= 0:
+        return Decimal("0.00")
+    return (Decimal(sum_) / Decimal(quantity)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def calculate_sum(price, quantity) -> Decimal:
+    """Сумма оборота по цене и количеству, тем же правилом сумма проверяется при записи оборота"""
+    return (Decimal(str(price)) * abs(Decimal(str(quantity)))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def get_average_prices(pairs) -> dict:
+    """Текущие средние цены одним запросом: pairs - [(material_pk, warehouse_pk), ...]"""
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+
+    queryset = MaterialBalance.objects.filter(
+        material__in={material_pk for material_pk, _ in pairs},
+        warehouse__in={warehouse_pk for _, warehouse_pk in pairs},
+    ).values("material", "warehouse", "average_price")
+    return {
+        (row["material"], row["warehouse"]): row["average_price"]
+        for row in queryset
+        if (row["material"], row["warehouse"]) in pairs
+    }
+
+
+def set_default_expense_prices(turnovers: list):
+    """
+    Проставляет цену списания по текущей средней цене склада в строках без цены (validated_data),
+    сумма считается от цены, если не передана
+    """
+    turnovers = [turnover for turnover in turnovers if turnover.get("price") is None]
+    average_prices = get_average_prices((turnover["material"].pk, turnover["warehouse"].pk) for turnover in turnovers)
+
+    for turnover in turnovers:
+        price = average_prices.get((turnover["material"].pk, turnover["warehouse"].pk), Decimal("0.00"))
+        turnover["price"] = price
+        if turnover.get("sum") is None:
+            turnover["sum"] = calculate_sum(price, turnover["quantity"])
+
+
+def update_material_balances(turnovers, sign: int = 1):
+    """
+    Применяет обороты к таблице остатков одним запросом (INSERT ... ON CONFLICT),
+    средняя цена пересчитывается в том же запросе.
+    turnovers - список Turnover или dict с ключами material_id, warehouse_id, quantity, sum
+    sign - 1 при добавлении оборотов, -1 при удалении
+    """
+    deltas = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for turnover in turnovers:
+        if isinstance(turnover, dict):
+            key = (turnover["material_id"], turnover["warehouse_id"])
+            quantity, sum_ = turnover["quantity"], turnover["sum"]
+        else:
+            key = (turnover.material_id, turnover.warehouse_id)
+            quantity, sum_ = turnover.quantity, turnover.sum
+
+        deltas[key][0] += Decimal(quantity) * sign
+        deltas[key][1] += Decimal(sum_) * sign
+
+    if not deltas:
+        return
+
+    table = MaterialBalance._meta.db_table
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(deltas))
+    params = []
+    for (material_pk, warehouse_pk), (quantity, sum_) in sorted(deltas.items()):
+        params.extend([material_pk, warehouse_pk, quantity, sum_, calculate_average_price(sum_, quantity)])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (material_id, warehouse_id, quantity, sum, average_price) VALUES {values} "
+            f"ON CONFLICT (material_id, warehouse_id) DO UPDATE SET "
+            f"quantity = {table}.quantity + EXCLUDED.quantity, sum = {table}.sum + EXCLUDED.sum, "
+            f"average_price = CASE WHEN {table}.quantity + EXCLUDED.quantity > 0 "
+            f"THEN ROUND(({table}.sum + EXCLUDED.sum) / ({table}.quantity + EXCLUDED.quantity), 2) ELSE 0 END",
+            params,
+        )
+
+
+def get_ledger_balances() -> dict:
+    """Остатки, посчитанные по всей истории оборотов: {(material_pk, warehouse_pk): (quantity, sum)}"""
+    queryset = (
+        Turnover.objects.values("material", "warehouse")
+        .annotate(quantity_sum=Sum("quantity"), sum_sum=Sum("sum"))
+        .order_by()
+    )
+    return {(row["material"], row["warehouse"]): (row["quantity_sum"], row["sum_sum"]) for row in queryset}
+
+
+@transaction.atomic
+def rebuild_material_balances() -> int:
+    """Полностью пересобирает таблицу остатков по оборотам, возвращает количество записей"""
+    with connection.cursor() as cursor:
+        # Блокируем запись оборотов на время пересборки
+        cursor.execute(f"LOCK TABLE {Turnover._meta.db_table} IN SHARE MODE")
+
+    MaterialBalance.objects.all().delete()
+    balances = MaterialBalance.objects.bulk_create(
+        [
+            MaterialBalance(
+                material_id=material_pk,
+                warehouse_id=warehouse_pk,
+                quantity=quantity,
+                sum=sum_,
+                average_price=calculate_average_price(sum_, quantity),
+            )
+            for (material_pk, warehouse_pk), (quantity, sum_) in get_ledger_balances().items()
+        ],
+        batch_size=1000,
+    )
+    return len(balances)
+
+
+def get_material_balance_mismatches() -> list:
+    """Сверяет таблицу остатков с оборотами, возвращает список расхождений"""
+    ledger = get_ledger_balances()
+    stored = {
+        (row["material"], row["warehouse"]): (row["quantity"], row["sum"])
+        for row in MaterialBalance.objects.values("material", "warehouse", "quantity", "sum")
+    }
+
+    mismatches = []
+    for key in sorted(set(ledger) | set(stored)):
+        expected = ledger.get(key, (Decimal(0), Decimal(0)))
+        actual = stored.get(key, (Decimal(0), Decimal(0)))
+        if expected != actual:
+            mismatches.append(
+                {
+                    "material": key[0],
+                    "warehouse": key[1],
+                    "expected_quantity": expected[0],
+                    "expected_sum": expected[1],
+                    "quantity": actual[0],
+                    "sum": actual[1],
+                }
+            )
+
+    return mismatches
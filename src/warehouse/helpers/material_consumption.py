@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import date
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db import transaction
+from django.db.models import DecimalField
+from django.db.models import ExpressionWrapper
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
+
+from app.helpers.postgresql import Round2
+
+from ..constants import CONSUMPTION_WINDOW_DAYS
+from ..constants import EXPENSE
+from ..models import MaterialBalance
+from ..models import MaterialConsumption
+from ..models import Turnover
+
+
+def is_consumption(type_: int, is_correction: bool) -> bool:
+    """Списание по заказ-наряду (не корректировка и не перемещение) - участвует в расходе"""
+    return type_ == EXPENSE and not is_correction
+
+
+def get_window_begin(date_end: date) -> date:
+    """Первый день окна CONSUMPTION_WINDOW_DAYS дней, заканчивающегося date_end"""
+    return date_end - timedelta(days=CONSUMPTION_WINDOW_DAYS - 1)
+
+
+def get_ledger_consumption(date_begin: date, date_end: date) -> dict:
+    """Расход по оборотам за период: {(material_pk, warehouse_pk): quantity}, количество положительное"""
+    queryset = (
+        Turnover.objects.filter(type=EXPENSE, is_correction=False, date__gte=date_begin, date__lte=date_end)
+        .values("material", "warehouse")
+        .annotate(quantity_sum=Sum("quantity"))
+        .order_by()
+    )
+    return {(row["material"], row["warehouse"]): -row["quantity_sum"] for row in queryset}
+
+
+def upsert_material_consumption(deltas: dict, date_end: date):
+    """Добавляет расход к строкам (material, warehouse) одним запросом (INSERT ... ON CONFLICT)"""
+    deltas = {key: quantity for key, quantity in deltas.items() if quantity}
+    if not deltas:
+        return
+
+    table = MaterialConsumption._meta.db_table
+    values = ", ".join(["(%s, %s, %s::date, %s)"] * len(deltas))
+    params = []
+    for (material_pk, warehouse_pk), quantity in sorted(deltas.items()):
+        params.extend([material_pk, warehouse_pk, date_end, quantity])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (material_id, warehouse_id, date_end, quantity) VALUES {values} "
+            f"ON CONFLICT (material_id, warehouse_id) DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity",
+            params,
+        )
+
+
+@transaction.atomic
+def refresh_material_consumption(today: date | None = None, rebuild: bool = False) -> int:
+    """
+    Сдвигает окно расхода на вчерашний день: прибавляет списания за дни, вошедшие в окно,
+    и вычитает списания за дни, вышедшие из него. Стоимость не зависит от длины истории.
+    При первом запуске, rebuild или пропуске больше длины окна расход считается заново.
+    Возвращает количество строк расхода
+    """
+    with connection.cursor() as cursor:
+        # Блокируем запись оборотов, чтобы окно совпало с оборотами
+        cursor.execute(f"LOCK TABLE {Turnover._meta.db_table} IN SHARE MODE")
+
+    date_end = (today or date.today()) - timedelta(days=1)
+    last_date_end = MaterialConsumption.objects.aggregate(date_end=Max("date_end"))["date_end"]
+
+    if rebuild or last_date_end is None or last_date_end < get_window_begin(date_end):
+        MaterialConsumption.objects.all().delete()
+        upsert_material_consumption(get_ledger_consumption(get_window_begin(date_end), date_end), date_end)
+    elif last_date_end < date_end:
+        deltas = defaultdict(Decimal)
+        entered = get_ledger_consumption(last_date_end + timedelta(days=1), date_end)
+        left = get_ledger_consumption(get_window_begin(last_date_end), get_window_begin(date_end) - timedelta(days=1))
+        for key, quantity in entered.items():
+            deltas[key] += quantity
+        for key, quantity in left.items():
+            deltas[key] -= quantity
+
+        MaterialConsumption.objects.update(date_end=date_end)
+        upsert_material_consumption(deltas, date_end)
+        MaterialConsumption.objects.filter(quantity__lte=0).delete()
+
+    return MaterialConsumption.objects.count()
+
+
+def update_material_consumption(turnovers, sign: int = 1):
+    """
+    Поправляет расход при списаниях, попадающих в текущее окно (в том числе задним числом), одним запросом.
+    turnovers - список Turnover или dict с ключами type, is_correction, material_id, warehouse_id, date, quantity
+    sign - 1 при добавлении оборотов, -1 при удалении
+    """
+    deltas = defaultdict(Decimal)
+    for turnover in turnovers:
+        if not isinstance(turnover, dict):
+            turnover = {
+                "type": turnover.type,
+                "is_correction": turnover.is_correction,
+                "material_id": turnover.material_id,
+                "warehouse_id": turnover.warehouse_id,
+                "date": turnover.date,
+                "quantity": turnover.quantity,
+            }
+
+        if is_consumption(turnover["type"], turnover["is_correction"]):
+            key = (turnover["material_id"], turnover["warehouse_id"], turnover["date"])
+            deltas[key] -= Decimal(turnover["quantity"]) * sign
+
+    if not deltas:
+        return
+
+    table = MaterialConsumption._meta.db_table
+    values = ", ".join(["(%s, %s, %s::date, %s::numeric)"] * len(deltas))
+    params = []
+    for (material_pk, warehouse_pk, date_), quantity in sorted(deltas.items()):
+        params.extend([material_pk, warehouse_pk, date_, quantity])
+
+    # Окно берётся из таблицы: пока расход не рассчитан командой, строки не добавляются
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (material_id, warehouse_id, date_end, quantity) "
+            f"SELECT turnover.material_id, turnover.warehouse_id, window_end.date_end, SUM(turnover.quantity) "
+            f"FROM (VALUES {values}) AS turnover (material_id, warehouse_id, date, quantity) "
+            f"CROSS JOIN (SELECT MAX(date_end) AS date_end FROM {table}) AS window_end "
+            f"WHERE turnover.date <= window_end.date_end "
+            f"AND turnover.date > window_end.date_end - {CONSUMPTION_WINDOW_DAYS} "
+            f"GROUP BY turnover.material_id, turnover.warehouse_id, window_end.date_end "
+            f"ON CONFLICT (material_id, warehouse_id) DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity",
+            params,
+        )
+
+
+def get_reorder_queryset(days: int, warehouse: int | None = None, category: int | None = None):
+    """
+    Материалы, которых при текущем среднем расходе хватит меньше чем на days дней.
+    Считается по предрасчитанному расходу (MaterialConsumption) и остаткам (MaterialBalance)
+    """
+    decimal_field = DecimalField(max_digits=15, decimal_places=4)
+    remains = MaterialBalance.objects.filter(material=OuterRef("material"), warehouse=OuterRef("warehouse")).values(
+        "quantity"
+    )
+
+    queryset = MaterialConsumption.objects.filter(quantity__gt=0)
+
+    if warehouse:
+        queryset = queryset.filter(warehouse=warehouse)
+
+    if category:
+        queryset = queryset.filter(material__category=category)
+
+    queryset = (
+        queryset.annotate(
+            remains=Coalesce(Subquery(remains), Decimal(0)),
+            daily_quantity=ExpressionWrapper(
+                F("quantity") / Value(CONSUMPTION_WINDOW_DAYS), output_field=decimal_field
+            ),
+        )
+        .annotate(
+            days_of_cover=Round2(ExpressionWrapper(F("remains") / F("daily_quantity"), output_field=decimal_field)),
+            reorder_quantity=Round2(
+                Greatest(
+                    ExpressionWrapper(F("daily_quantity") * Value(days) - F("remains"), output_field=decimal_field),
+                    Decimal(0),
+                )
+            ),
+        )
+        .filter(days_of_cover__lt=days)
+        .values(
+            "material",
+            "material__name",
+            "material__unit__name",
+            "warehouse",
+            "warehouse__name",
+            "remains",
+            "daily_quantity",
+            "days_of_cover",
+            "reorder_quantity",
+        )
+        .order_by("days_of_cover", "material__name", "warehouse__name")
+    )
+
+    return queryset
@@ -0,0 +1,45 @@
+from django.db import transaction
+
+from ..constants import COMING
+from ..models import Material
+from ..models import MaterialLastPrice
+from ..models import Turnover
+
+
+def is_purchase(type_: int, is_correction: bool) -> bool:
+    """Приход от поставщика (не корректировка) - участвует в последней цене"""
+    return type_ == COMING and not is_correction
+
+
+@transaction.atomic
+def refresh_material_last_prices(materials_pk):
+    """Пересчитывает последние цены прихода (по складам и общую) для списка материалов"""
+    materials_pk = sorted(set(materials_pk))
+    if not materials_pk:
+        return
+
+    # Блокируем материалы, чтобы параллельные приходы не пересчитывали цены одновременно
+    list(Material.objects.filter(pk__in=materials_pk).order_by("pk").select_for_update().values_list("pk"))
+
+    purchases = Turnover.objects.filter(type=COMING, is_correction=False, material__in=materials_pk)
+
+    last_prices = [
+        MaterialLastPrice(
+            material_id=row["material_id"],
+            warehouse_id=row["warehouse_id"],
+            turnover_id=row["pk"],
+            price=row["price"],
+        )
+        for row in purchases.order_by("material_id", "warehouse_id", "-date", "-pk")
+        .distinct("material_id", "warehouse_id")
+        .values("pk", "material_id", "warehouse_id", "price")
+    ]
+    last_prices += [
+        MaterialLastPrice(material_id=row["material_id"], warehouse_id=None, turnover_id=row["pk"], price=row["price"])
+        for row in purchases.order_by("material_id", "-date", "-pk")
+        .distinct("material_id")
+        .values("pk", "material_id", "price")
+    ]
+
+    MaterialLastPrice.objects.filter(material__in=materials_pk).delete()
+    MaterialLastPrice.objects.bulk_create(last_prices)
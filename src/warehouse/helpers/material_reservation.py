@@ -0,0 +1,120 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from ..constants import EXPENSE
+from ..models import Material
+from ..models import MaterialBalance
+from .material_utils import get_materials_remains_in_warehouse
+
+
+class InsufficientStockError(ValidationError):
+    """Остатка не хватает для списания, во view отдаётся 409 Conflict"""
+
+
+def lock_material_balances(pairs) -> dict:
+    """
+    Блокирует строки остатков (SELECT ... FOR UPDATE) до конца транзакции: параллельные списания
+    тех же материалов со склада ждут и затем видят уже изменённый остаток.
+    Строки блокируются в порядке (material, warehouse), поэтому две транзакции с одинаковыми
+    материалами в разном порядке не взаимоблокируются.
+    pairs - [(material_pk, warehouse_pk), ...], возвращает {(material_pk, warehouse_pk): quantity}.
+    Строки нет, если материал не приходовался на склад - остаток нулевой, блокировать нечего
+    """
+    materials_by_warehouse = defaultdict(set)
+    for material_pk, warehouse_pk in pairs:
+        materials_by_warehouse[warehouse_pk].add(material_pk)
+
+    if not materials_by_warehouse:
+        return {}
+
+    lookup = Q()
+    for warehouse_pk, materials_pk in materials_by_warehouse.items():
+        lookup |= Q(warehouse=warehouse_pk, material__in=materials_pk)
+
+    queryset = (
+        MaterialBalance.objects.filter(lookup)
+        .order_by("material_id", "warehouse_id")
+        .select_for_update()
+        .values_list("material_id", "warehouse_id", "quantity")
+    )
+    return {(material_pk, warehouse_pk): quantity for material_pk, warehouse_pk, quantity in queryset}
+
+
+def reserve_materials(quantities: dict, lock_pairs=()):
+    """
+    Блокирует остатки списываемых материалов и проверяет, что текущего остатка хватает.
+    quantities - {(material_pk, warehouse_pk): количество к списанию}. Вызывается в транзакции,
+    в которой затем записываются обороты.
+    lock_pairs - остатки, которые изменятся в той же транзакции (склад получатель перемещения),
+    блокируются одним запросом со списываемыми в общем порядке
+    """
+    balances = lock_material_balances([*quantities, *lock_pairs])
+
+    not_enough = {
+        material_pk
+        for (material_pk, warehouse_pk), quantity in quantities.items()
+        if abs(Decimal(str(quantity))) > balances.get((material_pk, warehouse_pk), Decimal(0))
+    }
+    if not_enough:
+        names = Material.objects.filter(pk__in=not_enough).order_by("name").values_list("name", flat=True)
+        raise InsufficientStockError(
+            {"quantity": (f"Вы пытаетесь списать больше чем в наличии на складе: {', '.join(names)}")}
+        )
+
+
+def check_remains_at_dates(turnovers):
+    """
+    Проверяет, что на дату каждого списания остатка хватало, как при записи одного оборота:
+    текущий остаток (reserve_materials) не защищает от списания задним числом до прихода.
+    Списания пакета с более ранней датой учитываются в остатке на более позднюю дату.
+    turnovers - validated_data оборотов (type, material, warehouse, date, quantity), один запрос на склад и дату
+    """
+    expenses = defaultdict(lambda: defaultdict(Decimal))
+    for turnover in turnovers:
+        if turnover["type"] == EXPENSE:
+            key = (turnover["warehouse"].pk, turnover["date"])
+            expenses[key][turnover["material"].pk] += abs(Decimal(str(turnover["quantity"])))
+
+    not_enough = set()
+    for (warehouse_pk, remains_date), quantities in expenses.items():
+        remains = get_materials_remains_in_warehouse(list(quantities), warehouse_pk, remains_date)
+        for material_pk in quantities:
+            quantity = sum(
+                earlier_quantities.get(material_pk, Decimal(0))
+                for (earlier_warehouse_pk, earlier_date), earlier_quantities in expenses.items()
+                if earlier_warehouse_pk == warehouse_pk and earlier_date <= remains_date
+            )
+            if quantity > remains.get(material_pk, Decimal(0)):
+                not_enough.add(material_pk)
+
+    if not_enough:
+        names = Material.objects.filter(pk__in=not_enough).order_by("name").values_list("name", flat=True)
+        raise InsufficientStockError(
+            {"quantity": (f"Вы пытаетесь списать больше чем в наличии на складе: {', '.join(names)}")}
+        )
+
+
+def get_expense_quantities(turnovers) -> dict:
+    """
+    Суммарное количество списаний по (material_pk, warehouse_pk).
+    turnovers - список dict с ключами type, material, warehouse, quantity (validated_data) или Turnover
+    """
+    quantities = defaultdict(Decimal)
+    for turnover in turnovers:
+        if isinstance(turnover, dict):
+            if turnover["type"] != EXPENSE:
+                continue
+            key = (turnover["material"].pk, turnover["warehouse"].pk)
+            quantity = turnover["quantity"]
+        else:
+            if turnover.type != EXPENSE:
+                continue
+            key = (turnover.material_id, turnover.warehouse_id)
+            quantity = turnover.quantity
+
+        quantities[key] += abs(Decimal(str(quantity)))
+
+    return quantities
@@ -0,0 +1,23 @@
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+
+def search_materials(queryset, search: str, with_compatbility: bool = True):
+    """
+    Поиск материалов по подстроке в наименовании и тегах совместимости.
+    Условия используют GIN индексы pg_trgm: name ~* (регистронезависимо, в отличие от UPPER(name) LIKE
+    у icontains) и compatbility_search LIKE, релевантность (search_rank) - триграммное сходство
+    """
+    search = search.strip()
+
+    lookup = Q(name__iregex=re.escape(search))
+    search_rank = TrigramSimilarity("name", search)
+
+    if with_compatbility:
+        lookup |= Q(compatbility_search__contains=search.upper())
+        search_rank = Greatest(search_rank, TrigramSimilarity("compatbility_search", search.upper()))
+
+    return queryset.filter(lookup).annotate(search_rank=search_rank)
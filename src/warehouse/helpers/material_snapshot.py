@@ -0,0 +1,207 @@
+import calendar
+from collections import defaultdict
+from datetime import date
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db import transaction
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from ..models import MaterialBalanceSnapshot
+from ..models import Turnover
+
+
+def get_period_end(value: date) -> date:
+    """Последний день месяца, в который попадает дата"""
+    return value.replace(day=calendar.monthrange(value.year, value.month)[1])
+
+
+def get_last_closed_period(today: date | None = None) -> date:
+    """Последний день предыдущего (последнего закрытого) месяца"""
+    today = today or date.today()
+    return today.replace(day=1) - timedelta(days=1)
+
+
+@transaction.atomic
+def close_material_periods(today: date | None = None) -> int:
+    """
+    Досчитывает остатки на конец месяцев, закрытых после последнего запуска.
+    Каждый месяц считается как остаток предыдущего снимка плюс обороты за месяц,
+    поэтому стоимость не зависит от длины истории. Возвращает количество созданных записей
+    """
+    with connection.cursor() as cursor:
+        # Блокируем запись оборотов, чтобы снимки совпали с оборотами
+        cursor.execute(f"LOCK TABLE {Turnover._meta.db_table} IN SHARE MODE")
+
+    last_period = get_last_closed_period(today)
+    closed_period = MaterialBalanceSnapshot.objects.aggregate(period=Max("period"))["period"]
+    if closed_period:
+        date_begin = closed_period + timedelta(days=1)
+    else:
+        date_begin = Turnover.objects.aggregate(date=Min("date"))["date"]
+
+    if not date_begin or date_begin > last_period:
+        return 0
+
+    balances = {
+        (row["material_id"], row["warehouse_id"]): (row["quantity"], row["sum"])
+        for row in MaterialBalanceSnapshot.objects.order_by("material_id", "warehouse_id", "-period")
+        .distinct("material_id", "warehouse_id")
+        .values("material_id", "warehouse_id", "quantity", "sum")
+    }
+
+    turnovers_by_month = defaultdict(list)
+    turnovers = (
+        Turnover.objects.filter(date__gte=date_begin, date__lte=last_period)
+        .annotate(month=TruncMonth("date"))
+        .values("month", "material_id", "warehouse_id")
+        .annotate(quantity_sum=Sum("quantity"), sum_sum=Sum("sum"))
+        .order_by()
+    )
+    for row in turnovers:
+        turnovers_by_month[row["month"]].append(row)
+
+    snapshots = []
+    for month in sorted(turnovers_by_month):
+        for row in turnovers_by_month[month]:
+            key = (row["material_id"], row["warehouse_id"])
+            quantity, sum_ = balances.get(key, (Decimal(0), Decimal(0)))
+            balances[key] = (quantity + row["quantity_sum"], sum_ + row["sum_sum"])
+            snapshots.append(
+                MaterialBalanceSnapshot(
+                    material_id=key[0],
+                    warehouse_id=key[1],
+                    period=get_period_end(month),
+                    quantity=balances[key][0],
+                    sum=balances[key][1],
+                )
+            )
+
+    return len(MaterialBalanceSnapshot.objects.bulk_create(snapshots, batch_size=1000))
+
+
+@transaction.atomic
+def rebuild_material_periods(today: date | None = None) -> int:
+    """Удаляет все снимки остатков и считает их заново по оборотам"""
+    MaterialBalanceSnapshot.objects.all().delete()
+    return close_material_periods(today)
+
+
+def update_material_snapshots(turnovers, sign: int = 1):
+    """
+    Поправляет снимки остатков закрытых месяцев при оборотах задним числом.
+    turnovers - список Turnover или dict с ключами material_id, warehouse_id, date, quantity, sum
+    sign - 1 при добавлении оборотов, -1 при удалении
+    """
+    deltas = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for turnover in turnovers:
+        if isinstance(turnover, dict):
+            key = (turnover["material_id"], turnover["warehouse_id"], turnover["date"])
+            quantity, sum_ = turnover["quantity"], turnover["sum"]
+        else:
+            key = (turnover.material_id, turnover.warehouse_id, turnover.date)
+            quantity, sum_ = turnover.quantity, turnover.sum
+
+        deltas[key][0] += Decimal(quantity) * sign
+        deltas[key][1] += Decimal(sum_) * sign
+
+    if not deltas:
+        return
+
+    table = MaterialBalanceSnapshot._meta.db_table
+    values = ", ".join(["(%s, %s, %s::date, %s::numeric, %s::numeric)"] * len(deltas))
+    params = []
+    for (material_pk, warehouse_pk, date_), (quantity, sum_) in deltas.items():
+        params.extend([material_pk, warehouse_pk, date_, quantity, sum_])
+
+    # Одним запросом: каждый снимок с периодом не раньше даты оборота получает сумму своих изменений
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET quantity = {table}.quantity + delta.quantity, sum = {table}.sum + delta.sum "
+            f"FROM (SELECT snapshot.id, SUM(turnover.quantity) AS quantity, SUM(turnover.sum) AS sum "
+            f"FROM {table} AS snapshot "
+            f"JOIN (VALUES {values}) AS turnover (material_id, warehouse_id, date, quantity, sum) "
+            f"ON snapshot.material_id = turnover.material_id AND snapshot.warehouse_id = turnover.warehouse_id "
+            f"AND snapshot.period >= turnover.date GROUP BY snapshot.id) AS delta "
+            f"WHERE {table}.id = delta.id",
+            params,
+        )
+
+    create_missing_snapshots(deltas)
+
+
+def create_missing_snapshots(deltas: dict):
+    """
+    Оборот в закрытом месяце позже последнего снимка материала на складе: исправлять нечего,
+    а закрытие следующих месяцев продолжило бы от устаревшего снимка. Создаётся снимок месяца оборота:
+    предыдущий снимок плюс обороты после него (обороты уже записаны или удалены).
+    deltas - {(material_pk, warehouse_pk, date): изменения}
+    """
+    closed_period = MaterialBalanceSnapshot.objects.aggregate(period=Max("period"))["period"]
+    if closed_period is None:
+        return
+
+    periods = {}
+    for material_pk, warehouse_pk, date_ in deltas:
+        # Дата несохранённого оборота может быть строкой
+        date_ = Turnover._meta.get_field("date").to_python(date_)
+        if date_ <= closed_period:
+            key = (material_pk, warehouse_pk)
+            periods[key] = max(periods.get(key, date.min), get_period_end(date_))
+
+    if not periods:
+        return
+
+    last_snapshots = {
+        (row["material_id"], row["warehouse_id"]): row
+        for row in MaterialBalanceSnapshot.objects.filter(
+            material__in={material_pk for material_pk, _ in periods},
+            warehouse__in={warehouse_pk for _, warehouse_pk in periods},
+        )
+        .order_by("material_id", "warehouse_id", "-period")
+        .distinct("material_id", "warehouse_id")
+        .values("material_id", "warehouse_id", "period", "quantity", "sum")
+    }
+    periods = {
+        key: period
+        for key, period in periods.items()
+        if key not in last_snapshots or last_snapshots[key]["period"] < period
+    }
+    if not periods:
+        return
+
+    lookup = Q(pk__in=[])
+    for (material_pk, warehouse_pk), period in periods.items():
+        pair_lookup = Q(material=material_pk, warehouse=warehouse_pk, date__lte=period)
+        if (material_pk, warehouse_pk) in last_snapshots:
+            pair_lookup &= Q(date__gt=last_snapshots[(material_pk, warehouse_pk)]["period"])
+        lookup |= pair_lookup
+
+    turnovers = {
+        (row["material_id"], row["warehouse_id"]): (row["quantity_sum"], row["sum_sum"])
+        for row in Turnover.objects.filter(lookup)
+        .values("material_id", "warehouse_id")
+        .annotate(quantity_sum=Sum("quantity"), sum_sum=Sum("sum"))
+        .order_by()
+    }
+
+    snapshots = []
+    for key, period in periods.items():
+        last_snapshot = last_snapshots.get(key, {"quantity": Decimal(0), "sum": Decimal(0)})
+        quantity, sum_ = turnovers.get(key, (Decimal(0), Decimal(0)))
+        snapshots.append(
+            MaterialBalanceSnapshot(
+                material_id=key[0],
+                warehouse_id=key[1],
+                period=period,
+                quantity=last_snapshot["quantity"] + quantity,
+                sum=last_snapshot["sum"] + sum_,
+            )
+        )
+
+    MaterialBalanceSnapshot.objects.bulk_create(snapshots)
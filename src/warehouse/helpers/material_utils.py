@@ -1,73 +1,87 @@
 from datetime import date
+from decimal import Decimal
 
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
 from django.db.models import Sum
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 
 from app.helpers.postgresql import Round2
 
-from ..constants import COMING
 from ..models import Material
+from ..models import MaterialBalance
+from ..models import MaterialBalanceSnapshot
+from ..models import MaterialLastPrice
 from ..models import Turnover
+from .material_balance import calculate_average_price
 
 
 def get_material_in_warehouses(material_pk: str, skip_epmty: bool = False):
-    materials_warehouses = []
+    return get_materials_in_warehouses([int(material_pk)], skip_epmty).get(int(material_pk), [])
 
-    queryset = Material.objects.all().filter(pk=material_pk)
 
-    queryset = queryset.values("turnovers__warehouse", "turnovers__warehouse__name").annotate(
-        quantity=Round2(Sum("turnovers__quantity")), sum=Round2(Sum("turnovers__sum"))
-    )
+def get_materials_in_warehouses(materials_pk: list, skip_epmty: bool = False):
+    """
+    Наличие материалов по складам для списка материалов за фиксированное число запросов
+    Returns: {material_pk: [{warehouse, warehouse_name, quantity, prices}, ...]}
+    """
+    materials_warehouses = {}
+
+    if not materials_pk:
+        return materials_warehouses
+
+    queryset = MaterialBalance.objects.filter(material__in=materials_pk)
 
     if skip_epmty:
         queryset = queryset.filter(quantity__gt=0.0)
 
-    queryset = queryset.order_by("name")
-
-    if queryset[0]["turnovers__warehouse"] is not None:
-        for warehouse in queryset:
-            average_price = round(warehouse["sum"] / warehouse["quantity"], 2) if warehouse["quantity"] > 0 else 0.0
-            materials_warehouses.append(
-                {
-                    "warehouse": warehouse["turnovers__warehouse"],
-                    "warehouse_name": warehouse["turnovers__warehouse__name"],
-                    "quantity": float(warehouse["quantity"]),
-                    "prices": {
-                        "average_price": average_price,
-                        "last_price": get_last_price(material_pk, warehouse["turnovers__warehouse"]),
-                    },
-                }
-            )
-
-    return materials_warehouses
+    queryset = queryset.values("material", "warehouse", "warehouse__name", "quantity", "average_price").order_by(
+        "material_id", "warehouse__name"
+    )
 
+    last_prices = get_last_prices_in_warehouses(materials_pk)
+
+    for warehouse in queryset:
+        materials_warehouses.setdefault(warehouse["material"], []).append(
+            {
+                "warehouse": warehouse["warehouse"],
+                "warehouse_name": warehouse["warehouse__name"],
+                "quantity": float(warehouse["quantity"]),
+                "prices": {
+                    "average_price": warehouse["average_price"],
+                    "last_price": last_prices.get((warehouse["material"], warehouse["warehouse"]), 0.00),
+                },
+            }
+        )
 
-def get_last_price(material_pk: int, warehouse_pk: int | None = None):
-    last_price = 0.00
+    return materials_warehouses
 
-    queryset = Turnover.objects.filter(type=COMING, is_correction=False, material=material_pk)
 
-    if warehouse_pk:
-        queryset = queryset.filter(warehouse=warehouse_pk)
+def get_last_prices_in_warehouses(materials_pk: list):
+    """Последние цены прихода по складам: {(material_pk, warehouse_pk): price}"""
+    queryset = MaterialLastPrice.objects.filter(material__in=materials_pk, warehouse__isnull=False).values(
+        "material", "warehouse", "price"
+    )
+    return {(row["material"], row["warehouse"]): row["price"] for row in queryset}
 
-    last_turnovers = queryset.order_by("-date", "-pk").first()
-    if last_turnovers:
-        last_price = last_turnovers.price
 
-    return last_price
+def get_last_price(material_pk: int, warehouse_pk: int | None = None):
+    last_price = (
+        MaterialLastPrice.objects.filter(material=material_pk, warehouse=warehouse_pk)
+        .values_list("price", flat=True)
+        .first()
+    )
+    return last_price if last_price is not None else 0.00
 
 
 def get_average_price(material_pk: int):
-    average_price = 0.00
-
-    queryset = (
-        Turnover.objects.filter(material=material_pk)
-        .values("material")
-        .annotate(quantity_sum=Round2(Sum("quantity")), sum_sum=Round2(Sum("sum")))
+    """Средневзвешенная цена материала по всем складам"""
+    balance = MaterialBalance.objects.filter(material=material_pk).aggregate(
+        quantity_sum=Sum("quantity"), sum_sum=Sum("sum")
     )
-    if queryset and queryset[0]["quantity_sum"] > 0.0:
-        average_price = round(queryset[0]["sum_sum"] / queryset[0]["quantity_sum"], 2)
-
-    return average_price
+    return calculate_average_price(balance["sum_sum"], balance["quantity_sum"])
 
 
 def get_material_prices(material_pk: int):
@@ -77,21 +91,122 @@ def get_material_prices(material_pk: int):
     }
 
 
+def get_materials_prices(materials_pk: list) -> dict:
+    """
+    Цены списка материалов двумя запросами, так же как get_material_prices
+    Returns: {material_pk: {last_price, average_price}}
+    """
+    last_prices = dict(
+        MaterialLastPrice.objects.filter(material__in=materials_pk, warehouse__isnull=True).values_list(
+            "material", "price"
+        )
+    )
+    balances = (
+        MaterialBalance.objects.filter(material__in=materials_pk)
+        .values("material")
+        .annotate(quantity_sum=Sum("quantity"), sum_sum=Sum("sum"))
+        .order_by()
+    )
+    average_prices = {
+        row["material"]: calculate_average_price(row["sum_sum"], row["quantity_sum"]) for row in balances
+    }
+
+    return {
+        material_pk: {
+            "last_price": last_prices.get(material_pk, 0.00),
+            "average_price": average_prices.get(material_pk, Decimal("0.00")),
+        }
+        for material_pk in materials_pk
+    }
+
+
+def get_materials_remains(materials_pk: list, remains_date: date | None = None) -> dict:
+    """
+    Остатки списка материалов по всем складам на дату двумя запросами: {material_pk: quantity}
+    Текущий остаток (MaterialBalance) минус обороты после даты, обычно их нет
+    """
+    remains_date = remains_date or date.today()
+
+    remains = dict(
+        MaterialBalance.objects.filter(material__in=materials_pk)
+        .values("material")
+        .annotate(quantity_sum=Sum("quantity"))
+        .order_by()
+        .values_list("material", "quantity_sum")
+    )
+    after_date = (
+        Turnover.objects.filter(material__in=materials_pk, date__gt=remains_date)
+        .values("material")
+        .annotate(quantity_sum=Sum("quantity"))
+        .order_by()
+        .values_list("material", "quantity_sum")
+    )
+    for material_pk, quantity in after_date:
+        remains[material_pk] = remains.get(material_pk, Decimal(0)) - quantity
+
+    return {material_pk: remains.get(material_pk, Decimal(0)) for material_pk in materials_pk}
+
+
 def get_material_remains(material_pk: int, warehouse_pk: int | None = None, date=date.today()):
+    """Остаток на дату: последний снимок закрытого месяца по каждому складу плюс обороты после него"""
     remains = 0.00
 
+    snapshots = MaterialBalanceSnapshot.objects.filter(material=material_pk, period__lte=date)
     queryset = Turnover.objects.filter(material=material_pk, date__lte=date)
 
     if warehouse_pk:
+        snapshots = snapshots.filter(warehouse=warehouse_pk)
         queryset = queryset.filter(warehouse=warehouse_pk)
 
-    queryset = queryset.values("material").annotate(quantity_sum=Round2(Sum("quantity")))
+    snapshots = list(
+        snapshots.order_by("warehouse_id", "-period")
+        .distinct("warehouse_id")
+        .values("warehouse_id", "period", "quantity")
+    )
+    after_snapshots = ~Q(warehouse__in=[snapshot["warehouse_id"] for snapshot in snapshots])
+    for snapshot in snapshots:
+        after_snapshots |= Q(warehouse=snapshot["warehouse_id"], date__gt=snapshot["period"])
+
+    queryset = queryset.filter(after_snapshots).values("material").annotate(quantity_sum=Round2(Sum("quantity")))
 
-    if queryset:
-        remains = queryset[0]["quantity_sum"]
+    if snapshots or queryset:
+        remains = sum(snapshot["quantity"] for snapshot in snapshots)
+        remains += queryset[0]["quantity_sum"] if queryset else 0
 
     return remains
 
 
+def get_materials_remains_in_warehouse(materials_pk: list, warehouse_pk: int, remains_date: date) -> dict:
+    """
+    Остатки списка материалов на складе на дату одним запросом: {material_pk: quantity}
+    Так же как get_material_remains - последний снимок плюс обороты после него
+    """
+    snapshots = MaterialBalanceSnapshot.objects.filter(
+        material=OuterRef("pk"), warehouse=warehouse_pk, period__lte=remains_date
+    ).order_by("-period")
+    remains_after_snapshot = (
+        Turnover.objects.filter(
+            material=OuterRef("pk"),
+            warehouse=warehouse_pk,
+            date__gt=OuterRef("remains_period"),
+            date__lte=remains_date,
+        )
+        .values("material")
+        .annotate(quantity_sum=Sum("quantity"))
+        .values("quantity_sum")
+    )
+
+    queryset = (
+        Material.objects.filter(pk__in=materials_pk)
+        .annotate(remains_period=Coalesce(Subquery(snapshots.values("period")[:1]), Value(date.min)))
+        .annotate(
+            remains=Coalesce(Subquery(snapshots.values("quantity")[:1]), Decimal(0))
+            + Coalesce(Subquery(remains_after_snapshot), Decimal(0))
+        )
+        .values_list("pk", "remains")
+    )
+    return dict(queryset)
+
+
 def has_tag_materials(car_name: str):
     return Material.objects.filter(compatbility__contains=[car_name]).exists()
@@ -0,0 +1,177 @@
+from decimal import ROUND_HALF_UP
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from django.db.transaction import atomic
+
+from ..constants import COMING
+from ..constants import EXPENSE
+from ..constants import STOCKTAKE_DRAFT
+from ..constants import STOCKTAKE_POSTED
+from ..models import Material
+from ..models import MaterialBalance
+from ..models import MaterialLastPrice
+from ..models import Stocktake
+from ..models import StocktakeLine
+from ..models import Turnover
+from .material_reservation import lock_material_balances
+from .turnover_bulk_create import bulk_create_turnovers
+
+
+def check_stocktake_draft(stocktake: Stocktake):
+    if stocktake.status != STOCKTAKE_DRAFT:
+        raise ValidationError({"status": ("Инвентаризация уже проведена")})
+
+
+def create_stocktake_lines(stocktake: Stocktake) -> int:
+    """Фиксирует учётные остатки склада (MaterialBalance) строками инвентаризации одним INSERT ... SELECT"""
+    line_table = StocktakeLine._meta.db_table
+    balance_table = MaterialBalance._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {line_table} (stocktake_id, material_id, expected_quantity) "
+            f"SELECT %s, material_id, quantity FROM {balance_table} WHERE warehouse_id = %s AND quantity <> 0",
+            [stocktake.pk, stocktake.warehouse_id],
+        )
+        return cursor.rowcount
+
+
+@atomic
+def set_stocktake_counts(stocktake: Stocktake, lines: list) -> int:
+    """
+    Записывает посчитанные количества одним INSERT ... ON CONFLICT.
+    lines - список dict с ключами material, counted_quantity и необязательным price.
+    Материал, которого нет в учётных остатках, добавляется строкой с нулевым учётным остатком
+    """
+    check_stocktake_draft(stocktake)
+
+    # При повторе материала в списке берётся последняя строка
+    lines = {line["material"]: line for line in lines}
+    if not lines:
+        return 0
+
+    materials_pk = set(Material.objects.filter(pk__in=lines).values_list("pk", flat=True))
+    missing = sorted(set(lines) - materials_pk)
+    if missing:
+        raise ValidationError({"lines": (f"Материалы не найдены: {missing}")})
+
+    table = StocktakeLine._meta.db_table
+    values = ", ".join(["(%s, %s, 0, %s::numeric, %s::numeric)"] * len(lines))
+    params = []
+    for material_pk, line in sorted(lines.items()):
+        params.extend([stocktake.pk, material_pk, line["counted_quantity"], line.get("price")])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (stocktake_id, material_id, expected_quantity, counted_quantity, price) "
+            f"VALUES {values} "
+            f"ON CONFLICT (stocktake_id, material_id) DO UPDATE SET "
+            f"counted_quantity = EXCLUDED.counted_quantity, price = COALESCE(EXCLUDED.price, {table}.price)",
+            params,
+        )
+        return cursor.rowcount
+
+
+def get_stocktake_differences(stocktake: Stocktake):
+    """
+    Посчитанные строки с текущим учётным остатком, расхождением и ценой корректировки одним запросом.
+    Цена: указанная при подсчёте, иначе средняя по складу, иначе последняя цена прихода на склад или общая
+    """
+    balances = MaterialBalance.objects.filter(material=OuterRef("material"), warehouse=stocktake.warehouse_id)
+    last_prices = MaterialLastPrice.objects.filter(material=OuterRef("material"))
+
+    return (
+        StocktakeLine.objects.filter(stocktake=stocktake, counted_quantity__isnull=False)
+        .annotate(
+            balance_quantity=Coalesce(Subquery(balances.values("quantity")), Decimal(0)),
+            difference=F("counted_quantity") - F("balance_quantity"),
+            turnover_price=Coalesce(
+                "price",
+                Subquery(balances.filter(average_price__gt=0).values("average_price")),
+                Subquery(last_prices.filter(warehouse=stocktake.warehouse_id).values("price")),
+                Subquery(last_prices.filter(warehouse__isnull=True).values("price")),
+            ),
+        )
+        .values("pk", "material", "material__name", "balance_quantity", "difference", "turnover_price")
+    )
+
+
+@atomic
+def post_stocktake(stocktake: Stocktake, user) -> list:
+    """
+    Проводит инвентаризацию: по расхождениям с текущими остатками создаются корректировки
+    (приход при излишке, расход при недостаче) одним bulk_create. Непосчитанные строки не корректируются.
+    Возвращает созданные обороты
+    """
+    # Повторное проведение из параллельного запроса ждёт окончания этой транзакции
+    stocktake = Stocktake.objects.select_for_update().get(pk=stocktake.pk)
+    check_stocktake_draft(stocktake)
+
+    # Списания по складу во время проведения ждут его окончания, расхождения считаются по неизменным остаткам
+    materials_pk = list(stocktake.lines.filter(counted_quantity__isnull=False).values_list("material", flat=True))
+    lock_material_balances((material_pk, stocktake.warehouse_id) for material_pk in materials_pk)
+
+    # Расхождения считаются с текущими остатками, а корректировки записываются датой инвентаризации:
+    # это верно, только если после этой даты по посчитанным материалам склада оборотов нет
+    last_date = Turnover.objects.filter(
+        warehouse=stocktake.warehouse_id, material__in=materials_pk, date__gt=stocktake.date
+    ).aggregate(last_date=Max("date"))["last_date"]
+    if last_date:
+        raise ValidationError(
+            {
+                "date": (
+                    f"По материалам склада есть обороты после даты инвентаризации (до {last_date:%d.%m.%Y}), "
+                    "дата инвентаризации должна быть не раньше последнего оборота"
+                )
+            }
+        )
+
+    differences = list(get_stocktake_differences(stocktake))
+
+    without_price = [row["material__name"] for row in differences if row["difference"] and not row["turnover_price"]]
+    if without_price:
+        raise ValidationError({"price": (f"Не указана цена материалов: {', '.join(without_price)}")})
+
+    note = f"Инвентаризация №{stocktake.pk}"
+    turnovers = []
+    for row in differences:
+        if not row["difference"]:
+            continue
+
+        quantity = abs(row["difference"])
+        turnovers.append(
+            Turnover(
+                user=user,
+                type=COMING if row["difference"] > 0 else EXPENSE,
+                date=stocktake.date,
+                is_correction=True,
+                note=note,
+                material_id=row["material"],
+                warehouse_id=stocktake.warehouse_id,
+                price=row["turnover_price"],
+                quantity=quantity,
+                sum=(quantity * row["turnover_price"]).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+            )
+        )
+
+    # Учётный остаток строк - на момент проведения
+    StocktakeLine.objects.bulk_update(
+        [StocktakeLine(pk=row["pk"], expected_quantity=row["balance_quantity"]) for row in differences],
+        ["expected_quantity"],
+        batch_size=1000,
+    )
+
+    # Недостача не больше учётного остатка, поэтому остатки для списания не проверяются
+    turnovers = bulk_create_turnovers(turnovers, check_remains=False)
+
+    stocktake.status = STOCKTAKE_POSTED
+    stocktake.save(update_fields=["status"])
+
+    return turnovers
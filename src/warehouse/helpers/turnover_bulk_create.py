@@ -0,0 +1,41 @@
+from django.db.transaction import atomic
+
+from ..models import Turnover
+from .material_balance import update_material_balances
+from .material_consumption import update_material_consumption
+from .material_last_price import is_purchase
+from .material_last_price import refresh_material_last_prices
+from .material_reservation import get_expense_quantities
+from .material_reservation import reserve_materials
+from .material_snapshot import update_material_snapshots
+from .validators_turnover import validator_turnover
+
+
+@atomic
+def bulk_create_turnovers(turnovers: list, check_remains: bool = True):
+    """
+    Пакетная запись оборотов: все строки проверяются до записи, затем один bulk_create.
+    bulk_create не вызывает save и сигналы, поэтому нормализация знаков, проверки и
+    обновление остатков, снимков, расхода и последних цен выполняются здесь
+    """
+    if check_remains:
+        # Остатки всех списываемых материалов блокируются заранее и в одном порядке
+        reserve_materials(get_expense_quantities(turnovers))
+
+    for turnover in turnovers:
+        turnover.normalize_signs()
+        validator_turnover(turnover, check_remains)
+
+    turnovers = Turnover.objects.bulk_create(turnovers, batch_size=500)
+
+    update_material_balances(turnovers)
+    update_material_snapshots(turnovers)
+    update_material_consumption(turnovers)
+
+    materials_pk = {
+        turnover.material_id for turnover in turnovers if is_purchase(turnover.type, turnover.is_correction)
+    }
+    if materials_pk:
+        refresh_material_last_prices(materials_pk)
+
+    return turnovers
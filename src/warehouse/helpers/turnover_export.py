@@ -0,0 +1,92 @@
+import csv
+
+from django.conf import settings
+
+from openpyxl import Workbook
+
+from app.helpers.database import get_period_filter_lookup
+
+from ..constants import TURNOVER_TYPE
+from ..models import Turnover
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Поле оборота и заголовок столбца выгрузки
+EXPORT_COLUMNS = (
+    ("pk", "№"),
+    ("date", "Дата"),
+    ("type", "Тип"),
+    ("is_correction", "Корректировка"),
+    ("material__article_number", "Код (Артикул)"),
+    ("material__name", "Материал"),
+    ("material__category__name", "Категория"),
+    ("material__unit__name", "Ед. изм."),
+    ("warehouse__name", "Склад"),
+    ("quantity", "Количество"),
+    ("price", "Цена"),
+    ("sum", "Сумма"),
+    ("order__number", "Заказ-наряд"),
+    ("entrance__document_number", "Номер документа прихода"),
+    ("entrance__provider", "Поставщик"),
+    ("note", "Примечание"),
+)
+
+TURNOVER_TYPE_NAMES = dict(TURNOVER_TYPE)
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: строка возвращается вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def get_turnovers_export_queryset(date_begin=None, date_end=None, warehouse=None, category=None, turnover_type=None):
+    """Строки журнала оборотов (tuple по EXPORT_COLUMNS) в порядке date, pk"""
+    queryset = Turnover.objects.filter(get_period_filter_lookup("date", date_begin, date_end))
+
+    if warehouse:
+        queryset = queryset.filter(warehouse=warehouse)
+
+    if category:
+        queryset = queryset.filter(material__category=category)
+
+    if turnover_type:
+        queryset = queryset.filter(type=turnover_type)
+
+    return queryset.order_by("date", "pk").values_list(*[field for field, _ in EXPORT_COLUMNS])
+
+
+def iter_turnover_rows(queryset):
+    """Строки читаются курсором на сервере БД пакетами по EXPORT_CHUNK_SIZE, в памяти только один пакет"""
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = list(row)
+        row[2] = TURNOVER_TYPE_NAMES.get(row[2], row[2])
+        row[3] = "Да" if row[3] else ""
+        yield row
+
+
+def iter_turnovers_csv(queryset):
+    """CSV построчно для StreamingHttpResponse"""
+    writer = csv.writer(Echo(), delimiter=";")
+    # BOM, чтобы Excel открыл файл в UTF-8
+    yield "\ufeff" + writer.writerow([title for _, title in EXPORT_COLUMNS])
+
+    for row in iter_turnover_rows(queryset):
+        row[1] = row[1].strftime(settings.DATE_FORMAT)
+        yield writer.writerow(["" if value is None else value for value in row])
+
+
+def write_turnovers_xlsx(queryset, file):
+    """
+    XLSX в файл file. В режиме write_only openpyxl сразу сбрасывает строки на диск,
+    поэтому память не растёт с количеством строк
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Обороты")
+    ws.append([title for _, title in EXPORT_COLUMNS])
+
+    for row in iter_turnover_rows(queryset):
+        ws.append(row)
+
+    wb.save(file)
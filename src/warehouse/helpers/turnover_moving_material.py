@@ -1,5 +1,8 @@
+from collections import defaultdict
 from datetime import datetime
+from decimal import Decimal
 
+from django.core.exceptions import ValidationError
 from django.db.transaction import atomic
 
 from ..constants import COMING
@@ -7,47 +10,96 @@ from ..constants import EXPENSE
 from ..models import Material
 from ..models import Turnover
 from ..models import Warehouse
+from .material_reservation import InsufficientStockError
+from .material_reservation import reserve_materials
+from .material_utils import get_materials_remains_in_warehouse
+from .turnover_bulk_create import bulk_create_turnovers
 
 
-@atomic
 def turnover_moving_material(data, user):
-    material = Material.objects.get(pk=data["material"])
-    warehouse_outgoing = Warehouse.objects.get(pk=data["warehouse_outgoing"])
-    warehouse_incoming = Warehouse.objects.get(pk=data["warehouse_incoming"])
+    return turnover_moving_materials(
+        {
+            "date": datetime.strptime(data["date"], "%d.%m.%Y").date(),
+            "warehouse_outgoing": data["warehouse_outgoing"],
+            "warehouse_incoming": data["warehouse_incoming"],
+            "materials": [
+                {
+                    "material": data["material"],
+                    "price": data["price"],
+                    "quantity": data["quantity"],
+                    "sum": data["sum"],
+                }
+            ],
+        },
+        user,
+    )
 
-    date = datetime.strptime(data["date"], "%d.%m.%Y")
-    price = data["price"]
-    quantity = data["quantity"]
-    sum = data["sum"]
 
-    note = f'перемещение из "{warehouse_outgoing.name}" в "{warehouse_incoming.name}"'
+@atomic
+def turnover_moving_materials(data, user):
+    """
+    Перемещение списка материалов между складами: материалы и склады загружаются одним запросом,
+    остатки всех строк блокируются и проверяются одним запросом, обороты записываются одним bulk_create
+    """
+    lines = data["materials"]
+    materials = Material.objects.in_bulk({line["material"] for line in lines})
+    warehouses = Warehouse.objects.in_bulk({data["warehouse_outgoing"], data["warehouse_incoming"]})
 
-    turnover1 = Turnover(
-        user=user,
-        type=EXPENSE,
-        date=date,
-        is_correction=True,
-        note=note,
-        material=material,
-        warehouse=warehouse_outgoing,
-        price=price,
-        quantity=quantity,
-        sum=sum,
-    )
-    turnover2 = Turnover(
-        user=user,
-        type=COMING,
-        date=date,
-        is_correction=True,
-        note=note,
-        material=material,
-        warehouse=warehouse_incoming,
-        price=price,
-        quantity=quantity,
-        sum=sum,
+    if data["warehouse_outgoing"] == data["warehouse_incoming"]:
+        raise ValidationError({"warehouse_incoming": ("Склад отправитель и получатель совпадают")})
+
+    if data["warehouse_outgoing"] not in warehouses or data["warehouse_incoming"] not in warehouses:
+        raise ValidationError({"warehouse": ("Склад не найден")})
+
+    missing = [line["material"] for line in lines if line["material"] not in materials]
+    if missing:
+        raise ValidationError({"materials": (f"Материалы не найдены: {missing}")})
+
+    # Одинаковые материалы в нескольких строках проверяются суммарно
+    quantities = defaultdict(Decimal)
+    for line in lines:
+        quantities[line["material"]] += abs(Decimal(str(line["quantity"])))
+
+    # Остатки получателя блокируются вместе с остатками отправителя, иначе встречные перемещения
+    # того же материала взаимоблокируются на записи остатков
+    reserve_materials(
+        {(material_pk, data["warehouse_outgoing"]): quantity for material_pk, quantity in quantities.items()},
+        [(material_pk, data["warehouse_incoming"]) for material_pk in quantities],
     )
 
-    turnover1.save()
-    turnover2.save()
+    remains = get_materials_remains_in_warehouse(list(quantities), data["warehouse_outgoing"], data["date"])
+    not_enough = [
+        materials[material_pk].name
+        for material_pk, quantity in quantities.items()
+        if quantity > remains.get(material_pk, Decimal(0))
+    ]
+    if not_enough:
+        raise InsufficientStockError(
+            {"quantity": (f"Вы пытаетесь списать больше чем в наличии на складе: {', '.join(not_enough)}")}
+        )
+
+    warehouse_outgoing = warehouses[data["warehouse_outgoing"]]
+    warehouse_incoming = warehouses[data["warehouse_incoming"]]
+    note = f'перемещение из "{warehouse_outgoing.name}" в "{warehouse_incoming.name}"'
+
+    turnovers = []
+    for line in lines:
+        for type_, warehouse in ((EXPENSE, warehouse_outgoing), (COMING, warehouse_incoming)):
+            turnovers.append(
+                Turnover(
+                    user=user,
+                    type=type_,
+                    date=data["date"],
+                    is_correction=True,
+                    note=note,
+                    material=materials[line["material"]],
+                    warehouse=warehouse,
+                    price=line["price"],
+                    quantity=line["quantity"],
+                    sum=line["sum"],
+                )
+            )
+
+    bulk_create_turnovers(turnovers, check_remains=False)
 
     return True
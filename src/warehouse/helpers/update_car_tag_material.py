@@ -1,8 +1,43 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import Case
+from django.db.models import CharField
+from django.db.models import F
+from django.db.models import Func
+from django.db.models import TextField
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Upper
+
 from ..models import Material
 
 
-def update_car_tag_material(old_name: str, new_name: str):
+def update_car_tag_material(old_name: str, new_name: str, dry_run: bool = False) -> int:
+    """
+    Переименовывает тег ТС в совместимости материалов одним UPDATE (array_replace),
+    материалы находятся по GIN индексу compatbility. Если новый тег у материала уже есть, старый удаляется.
+    dry_run - только посчитать материалы, которые изменятся. Возвращает количество материалов
+    """
     materials = Material.objects.filter(compatbility__contains=[old_name])
-    for material in materials:
-        material.compatbility = [new_name if car_tag == old_name else car_tag for car_tag in material.compatbility]
-        material.save()
+
+    if dry_run or old_name == new_name:
+        return materials.count()
+
+    compatbility_field = ArrayField(CharField(max_length=64))
+    compatbility = Case(
+        When(
+            compatbility__contains=[new_name],
+            then=Func(F("compatbility"), Value(old_name), function="array_remove", output_field=compatbility_field),
+        ),
+        default=Func(
+            F("compatbility"),
+            Value(old_name),
+            Value(new_name),
+            function="array_replace",
+            output_field=compatbility_field,
+        ),
+    )
+    # В UPDATE поля справа имеют старые значения, поэтому строка для поиска строится по тому же выражению,
+    # что и Material.get_compatbility_search
+    compatbility_search = Upper(Func(compatbility, Value("\n"), function="array_to_string", output_field=TextField()))
+
+    return materials.update(compatbility=compatbility, compatbility_search=compatbility_search)
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+
+from ..constants import COMING
+from ..constants import EXPENSE
+from .material_balance import calculate_sum
+from .material_reservation import InsufficientStockError
+from .material_reservation import lock_material_balances
+from .material_utils import get_material_remains
+
+
+def validator_turnover(instance, check_remains: bool = True):
+    """
+    Проверка оборота перед записью (в pre_save и при пакетной записи).
+    check_remains=False - остаток для списания уже проверен пакетно вызывающим кодом
+    """
+    if instance.type == COMING and not instance.is_correction and not instance.entrance:
+        raise ValidationError({"entrance": ("Отсутсвует поле entrance")})
+
+    if instance.type == EXPENSE and not instance.is_correction and not instance.order:
+        raise ValidationError({"entrance": ("Отсутсвует поле order")})
+
+    if instance.order and instance.entrance:
+        raise ValidationError({"entrance": ("Должно быть одно из полей 'entrance' или 'order'")})
+
+    if instance.is_correction and (instance.order or instance.entrance):
+        raise ValidationError({"is_correction": ("Поля 'entrance' и 'order' не должны указываться при корректировке")})
+
+    if instance.is_correction is True and len(instance.note) <= 0:
+        raise ValidationError({"is_correction": ("Поле 'note' обязательно при корректировки")})
+
+    quantity = float(abs(instance.quantity))
+    price = float(instance.price)
+    sum_ = float(abs(instance.sum))
+
+    if calculate_sum(instance.price, instance.quantity) != abs(Decimal(str(instance.sum))):
+        raise ValidationError({"sum": ("Неверная сумма")})
+
+    if quantity <= 0.00:
+        raise ValidationError({"quantity": ("Количество должно быть больше 0")})
+
+    if price <= 0.00:
+        raise ValidationError({"price": ("Цена должно быть больше 0")})
+
+    if sum_ <= 0.00:
+        raise ValidationError({"sum": ("Сумма должно быть больше 0")})
+
+    if check_remains and instance.type == EXPENSE:
+        # Остаток проверяется после блокировки строки остатка, параллельное списание ждёт этой транзакции
+        lock_material_balances([(instance.material_id, instance.warehouse_id)])
+        if quantity > get_material_remains(instance.material, instance.warehouse, instance.date):
+            raise InsufficientStockError({"quantity": ("Вы пытаетесь списать больше чем в наличии на складе")})
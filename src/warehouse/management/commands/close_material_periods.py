@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.helpers.material_snapshot import close_material_periods
+from warehouse.helpers.material_snapshot import rebuild_material_periods
+
+
+class Command(BaseCommand):
+    """Команда для расчёта остатков материалов на конец закрытых месяцев"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Пересчитать все месяцы заново")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            count = rebuild_material_periods()
+        else:
+            count = close_material_periods()
+
+        self.stdout.write(f"Остатки на конец месяцев рассчитаны, записей: {count}")
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from app.helpers.query_plans import capture_select_queries
+from app.helpers.query_plans import explain_query
+from app.helpers.query_plans import get_seq_scans
+from reports.helpers.hot_queries import get_hot_queries as get_reports_hot_queries
+from warehouse.helpers.hot_queries import get_hot_queries as get_warehouse_hot_queries
+from warehouse.models import MaterialBalance
+from warehouse.models import MaterialBalanceSnapshot
+from warehouse.models import MaterialLastPrice
+from warehouse.models import Turnover
+
+# Большие таблицы, последовательное чтение которых считается регрессией индексов
+WATCHED_TABLES = (
+    Turnover._meta.db_table,
+    MaterialBalance._meta.db_table,
+    MaterialBalanceSnapshot._meta.db_table,
+    MaterialLastPrice._meta.db_table,
+)
+
+
+class Command(BaseCommand):
+    """Команда для проверки планов частых запросов склада и отчётов (EXPLAIN ANALYZE) на последовательное чтение"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--no-seqscan",
+            action="store_true",
+            help="Запретить планировщику последовательное чтение там, где есть индекс (для маленькой базы)",
+        )
+        parser.add_argument("--skip-reports", action="store_true", help="Не проверять запросы отчётов")
+
+    def handle(self, *args, **options):
+        turnover = Turnover.objects.order_by("-pk").first()
+        if turnover is None:
+            raise CommandError("Нет оборотов для построения планов")
+
+        hot_queries = get_warehouse_hot_queries(turnover)
+        if not options["skip_reports"]:
+            hot_queries.update(get_reports_hot_queries(turnover))
+
+        queries_count = 0
+        problems = 0
+        for name, func in hot_queries.items():
+            for sql in capture_select_queries(func):
+                queries_count += 1
+                plan = explain_query(sql, seqscan=not options["no_seqscan"])
+                seq_scans = get_seq_scans(plan, WATCHED_TABLES)
+
+                if seq_scans:
+                    problems += 1
+                    self.stdout.write(f"{name}: последовательное чтение {', '.join(seq_scans)}")
+                    self.stdout.write(f"{sql}\n{plan}\n")
+                elif options["verbosity"] > 1:
+                    self.stdout.write(f"{name}: OK\n{sql}\n{plan}\n")
+
+        if problems:
+            raise CommandError(f"Запросов с последовательным чтением: {problems} из {queries_count}")
+
+        self.stdout.write(
+            f"Проверено запросов: {queries_count} ({len(hot_queries)} функций), последовательного чтения нет"
+        )
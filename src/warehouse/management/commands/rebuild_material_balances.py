@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from warehouse.helpers.material_balance import get_material_balance_mismatches
+from warehouse.helpers.material_balance import rebuild_material_balances
+
+
+class Command(BaseCommand):
+    """Команда для пересборки и сверки таблицы остатков материалов по оборотам"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Только сверить остатки с оборотами")
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            count = rebuild_material_balances()
+            self.stdout.write(f"Остатки пересобраны, записей: {count}")
+
+        mismatches = get_material_balance_mismatches()
+        for mismatch in mismatches:
+            self.stdout.write(
+                f"material={mismatch['material']} warehouse={mismatch['warehouse']}: "
+                f"{mismatch['quantity']} / {mismatch['sum']} "
+                f"(по оборотам {mismatch['expected_quantity']} / {mismatch['expected_sum']})"
+            )
+
+        if mismatches:
+            raise CommandError(f"Расхождений остатков: {len(mismatches)}")
+
+        self.stdout.write("Остатки совпадают с оборотами")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from warehouse.helpers.material_consumption import refresh_material_consumption
+
+
+class Command(BaseCommand):
+    """Команда для расчёта расхода материалов за скользящее окно (для списка на закупку)"""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Пересчитать расход заново")
+
+    def handle(self, *args, **options):
+        count = refresh_material_consumption(rebuild=options["rebuild"])
+        self.stdout.write(f"Расход материалов рассчитан, записей: {count}")
@@ -0,0 +1,59 @@
+# Generated by Django 4.0 on 2026-10-18 14:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_material_balances(apps, schema_editor):
+    """
+        Fills MaterialBalance with quantity and sum
+        aggregated from the whole Turnover ledger
+    """
+    Turnover = apps.get_model('warehouse', 'Turnover')
+    MaterialBalance = apps.get_model('warehouse', 'MaterialBalance')
+
+    queryset = Turnover.objects.values('material', 'warehouse').annotate(
+        quantity_sum=models.Sum('quantity'), sum_sum=models.Sum('sum')
+    ).order_by()
+
+    MaterialBalance.objects.bulk_create(
+        [
+            MaterialBalance(
+                material_id=row['material'],
+                warehouse_id=row['warehouse'],
+                quantity=row['quantity_sum'],
+                sum=row['sum_sum'],
+            )
+            for row in queryset
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Количество')),
+                ('sum', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Сумма')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='warehouse.material', verbose_name='Материал')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='warehouse.warehouse', verbose_name='Склад')),
+            ],
+            options={
+                'verbose_name': 'Остаток материала',
+                'verbose_name_plural': 'Остатки материалов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='materialbalance',
+            constraint=models.UniqueConstraint(fields=('material', 'warehouse'), name='unique_material_balance'),
+        ),
+        migrations.RunPython(fill_material_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.0 on 2026-10-18 14:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_material_last_prices(apps, schema_editor):
+    """
+        Fills MaterialLastPrice with the latest purchase price
+        of every material per warehouse and across all warehouses
+    """
+    Turnover = apps.get_model('warehouse', 'Turnover')
+    MaterialLastPrice = apps.get_model('warehouse', 'MaterialLastPrice')
+
+    purchases = Turnover.objects.filter(type=1, is_correction=False)
+
+    last_prices = [
+        MaterialLastPrice(
+            material_id=row['material_id'], warehouse_id=row['warehouse_id'], turnover_id=row['pk'], price=row['price']
+        )
+        for row in purchases.order_by('material_id', 'warehouse_id', '-date', '-pk')
+        .distinct('material_id', 'warehouse_id')
+        .values('pk', 'material_id', 'warehouse_id', 'price')
+    ]
+    last_prices += [
+        MaterialLastPrice(material_id=row['material_id'], warehouse_id=None, turnover_id=row['pk'], price=row['price'])
+        for row in purchases.order_by('material_id', '-date', '-pk')
+        .distinct('material_id')
+        .values('pk', 'material_id', 'price')
+    ]
+
+    MaterialLastPrice.objects.bulk_create(last_prices, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0002_materialbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialLastPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Цена')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='last_prices', to='warehouse.material', verbose_name='Материал')),
+                ('turnover', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='warehouse.turnover', verbose_name='Приход')),
+                ('warehouse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='last_prices', to='warehouse.warehouse', verbose_name='Склад')),
+            ],
+            options={
+                'verbose_name': 'Последняя цена материала',
+                'verbose_name_plural': 'Последние цены материалов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='materiallastprice',
+            constraint=models.UniqueConstraint(condition=models.Q(('warehouse__isnull', False)), fields=('material', 'warehouse'), name='unique_material_last_price_warehouse'),
+        ),
+        migrations.AddConstraint(
+            model_name='materiallastprice',
+            constraint=models.UniqueConstraint(condition=models.Q(('warehouse__isnull', True)), fields=('material',), name='unique_material_last_price'),
+        ),
+        migrations.RunPython(fill_material_last_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0 on 2026-10-18 14:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0003_materiallastprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(verbose_name='Последний день месяца')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Количество')),
+                ('sum', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Сумма')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='warehouse.material', verbose_name='Материал')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='warehouse.warehouse', verbose_name='Склад')),
+            ],
+            options={
+                'verbose_name': 'Остаток материала на конец месяца',
+                'verbose_name_plural': 'Остатки материалов на конец месяца',
+                'ordering': ('-period',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='materialbalancesnapshot',
+            constraint=models.UniqueConstraint(fields=('material', 'warehouse', 'period'), name='unique_material_balance_snapshot'),
+        ),
+    ]
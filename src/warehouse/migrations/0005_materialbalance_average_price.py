@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+def fill_average_price(apps, schema_editor):
+    """
+        Fills MaterialBalance.average_price as ROUND(sum / quantity, 2)
+        for balances with positive quantity
+    """
+    MaterialBalance = apps.get_model('warehouse', 'MaterialBalance')
+
+    MaterialBalance.objects.filter(quantity__gt=0).update(
+        average_price=models.Func(
+            models.F('sum') / models.F('quantity'), models.Value(2), function='ROUND'
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0004_materialbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materialbalance',
+            name='average_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Средняя цена'),
+        ),
+        migrations.RunPython(fill_average_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0 on 2026-10-18 14:39
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db import models
+
+
+def fill_compatbility_search(apps, schema_editor):
+    """
+    Fills Material.compatbility_search with upper-cased
+    compatibility tags, one per line
+    """
+    Material = apps.get_model("warehouse", "Material")
+
+    materials = list(Material.objects.only("pk", "compatbility"))
+    for material in materials:
+        material.compatbility_search = "\n".join(car_tag.upper() for car_tag in material.compatbility or [])
+
+    Material.objects.bulk_update(materials, ["compatbility_search"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("warehouse", "0005_materialbalance_average_price"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="material",
+            name="compatbility_search",
+            field=models.TextField(blank=True, default="", editable=False, verbose_name="Cовместимость для поиска"),
+        ),
+        migrations.RunPython(fill_compatbility_search, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="material",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["name"], name="material_name_trgm", opclasses=("gin_trgm_ops",)
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="material",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["compatbility_search"], name="material_compatbility_trgm", opclasses=("gin_trgm_ops",)
+            ),
+        ),
+    ]
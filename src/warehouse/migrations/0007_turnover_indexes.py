@@ -0,0 +1,54 @@
+# Generated by Django 4.0 on 2026-10-18 14:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_alter_order_driver'),
+        ('warehouse', '0006_material_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='turnover',
+            name='entrance',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='turnovers_from_entrance', to='warehouse.entrance', verbose_name='Приход'),
+        ),
+        migrations.AlterField(
+            model_name='turnover',
+            name='material',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='turnovers', to='warehouse.material', verbose_name='Материал'),
+        ),
+        migrations.AlterField(
+            model_name='turnover',
+            name='order',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='turnovers_from_order', to='orders.order', verbose_name='Заказ-наряд'),
+        ),
+        migrations.AddIndex(
+            model_name='turnover',
+            index=models.Index(fields=['material', 'warehouse', 'date'], name='turnover_material_warehouse'),
+        ),
+        migrations.AddIndex(
+            model_name='turnover',
+            index=models.Index(fields=['material', '-date', '-id'], name='turnover_material_date'),
+        ),
+        migrations.AddIndex(
+            model_name='turnover',
+            index=models.Index(condition=models.Q(('is_correction', False), ('type', 1)), fields=['material', 'warehouse', '-date', '-id'], name='turnover_purchase'),
+        ),
+        migrations.AddIndex(
+            model_name='turnover',
+            index=models.Index(fields=['date'], name='turnover_date'),
+        ),
+        migrations.AddIndex(
+            model_name='turnover',
+            index=models.Index(condition=models.Q(('order__isnull', False)), fields=['order'], name='turnover_order'),
+        ),
+        migrations.AddIndex(
+            model_name='turnover',
+            index=models.Index(condition=models.Q(('entrance__isnull', False)), fields=['entrance'], name='turnover_entrance'),
+        ),
+    ]
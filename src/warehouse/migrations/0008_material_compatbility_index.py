@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 14:54
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_turnover_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['compatbility'], name='material_compatbility'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0 on 2026-10-18 14:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_material_compatbility_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_end', models.DateField(verbose_name='Последний день окна')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Израсходовано')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumptions', to='warehouse.material', verbose_name='Материал')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumptions', to='warehouse.warehouse', verbose_name='Склад')),
+            ],
+            options={
+                'verbose_name': 'Расход материала',
+                'verbose_name_plural': 'Расход материалов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='materialconsumption',
+            constraint=models.UniqueConstraint(fields=('material', 'warehouse'), name='unique_material_consumption'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.0 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0002_alter_customgroup_options_alter_customuser_groups_and_more"),
+        ("warehouse", "0009_materialconsumption"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Stocktake",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "status",
+                    models.IntegerField(choices=[(1, "Черновик"), (2, "Проведена")], default=1, verbose_name="Статус"),
+                ),
+                ("note", models.TextField(blank=True, verbose_name="Примечание")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="stocktakes",
+                        to="authentication.customuser",
+                        verbose_name="Пользователь",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="stocktakes",
+                        to="warehouse.warehouse",
+                        verbose_name="Склад",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Инвентаризация",
+                "verbose_name_plural": "Инвентаризации",
+                "ordering": ("-date", "-pk"),
+            },
+        ),
+        migrations.CreateModel(
+            name="StocktakeLine",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "expected_quantity",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name="Учётный остаток"),
+                ),
+                (
+                    "counted_quantity",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True, verbose_name="Фактический остаток"
+                    ),
+                ),
+                (
+                    "price",
+                    models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name="Цена"),
+                ),
+                (
+                    "material",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="stocktake_lines",
+                        to="warehouse.material",
+                        verbose_name="Материал",
+                    ),
+                ),
+                (
+                    "stocktake",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lines",
+                        to="warehouse.stocktake",
+                        verbose_name="Инвентаризация",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Строка инвентаризации",
+                "verbose_name_plural": "Строки инвентаризации",
+                "ordering": ("pk",),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="stocktakeline",
+            constraint=models.UniqueConstraint(fields=("stocktake", "material"), name="unique_stocktake_line"),
+        ),
+    ]
@@ -1,9 +1,14 @@
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db import transaction
 
 from core.constants import MANAGEMENT
 
+from .constants import COMING
+from .constants import STOCKTAKE_DRAFT
+from .constants import STOCKTAKE_STATUS
 from .constants import TURNOVER_TYPE
 
 
@@ -58,6 +63,9 @@ class Material(models.Model):
     )
     article_number = models.CharField(verbose_name="Код (Артикул)", max_length=32, unique=True, null=True, blank=True)
     compatbility = ArrayField(models.CharField(max_length=64), verbose_name="Cовместимость c ТС", blank=True)
+    compatbility_search = models.TextField(
+        verbose_name="Cовместимость для поиска", blank=True, default="", editable=False
+    )
 
     def __str__(self):
         return self.name
@@ -66,6 +74,21 @@ class Material(models.Model):
         verbose_name = "Материал"
         verbose_name_plural = "Материалы"
         ordering = ("name",)
+        indexes = [
+            # Поиск по подстроке через pg_trgm (helpers.material_search)
+            GinIndex(fields=("name",), opclasses=("gin_trgm_ops",), name="material_name_trgm"),
+            GinIndex(fields=("compatbility_search",), opclasses=("gin_trgm_ops",), name="material_compatbility_trgm"),
+            GinIndex(fields=("compatbility",), name="material_compatbility"),
+        ]
+
+    @staticmethod
+    def get_compatbility_search(compatbility) -> str:
+        """Теги совместимости в верхнем регистре построчно, для поиска по подстроке"""
+        return "\n".join(car_tag.upper() for car_tag in compatbility or [])
+
+    def save(self, *args, **kwargs):
+        self.compatbility_search = self.get_compatbility_search(self.compatbility)
+        super().save(*args, **kwargs)
 
 
 class Entrance(models.Model):
@@ -101,7 +124,10 @@ class Turnover(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, verbose_name="Пользователь", on_delete=models.PROTECT, related_name="turnover"
     )
-    material = models.ForeignKey(Material, verbose_name="Материал", on_delete=models.PROTECT, related_name="turnovers")
+    # Отдельный индекс по материалу не нужен: material первый столбец составных индексов
+    material = models.ForeignKey(
+        Material, verbose_name="Материал", on_delete=models.PROTECT, related_name="turnovers", db_index=False
+    )
     warehouse = models.ForeignKey(Warehouse, verbose_name="Склад", on_delete=models.PROTECT, related_name="turnovers")
     price = models.DecimalField(verbose_name="Цена", max_digits=12, decimal_places=2)
     quantity = models.DecimalField(verbose_name="Количество", max_digits=9, decimal_places=2)
@@ -113,6 +139,7 @@ class Turnover(models.Model):
         related_name="turnovers_from_order",
         blank=True,
         null=True,
+        db_index=False,
     )
     entrance = models.ForeignKey(
         Entrance,
@@ -121,6 +148,7 @@ class Turnover(models.Model):
         related_name="turnovers_from_entrance",
         blank=True,
         null=True,
+        db_index=False,
     )
 
     def __str__(self):
@@ -130,8 +158,26 @@ class Turnover(models.Model):
         verbose_name = "Движение материала"
         verbose_name_plural = "Движение материалов"
         ordering = ("date", "pk")
+        indexes = [
+            # Остатки на дату и обороты материала по складу
+            models.Index(fields=("material", "warehouse", "date"), name="turnover_material_warehouse"),
+            # Обороты материала по всем складам, новые сверху
+            models.Index(fields=("material", "-date", "-id"), name="turnover_material_date"),
+            # Последняя цена прихода от поставщика
+            models.Index(
+                fields=("material", "warehouse", "-date", "-id"),
+                name="turnover_purchase",
+                condition=models.Q(type=COMING, is_correction=False),
+            ),
+            # Закрытие месяцев
+            models.Index(fields=("date",), name="turnover_date"),
+            # Строки заказ-наряда и прихода, у большинства оборотов одно из полей пустое
+            models.Index(fields=("order",), name="turnover_order", condition=models.Q(order__isnull=False)),
+            models.Index(fields=("entrance",), name="turnover_entrance", condition=models.Q(entrance__isnull=False)),
+        ]
 
-    def save(self, *args, **kwargs):
+    def normalize_signs(self):
+        """Приход хранится с положительными количеством и суммой, расход - с отрицательными"""
         if self.type == 1:
             self.price = abs(self.price)
             self.quantity = abs(self.quantity)
@@ -140,4 +186,166 @@ class Turnover(models.Model):
             self.price = abs(self.price)
             self.quantity = -abs(self.quantity)
             self.sum = -abs(self.sum)
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.normalize_signs()
+
+        # Остатки (MaterialBalance) обновляются в receivers в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class MaterialBalance(models.Model):
+    """Текущий остаток материала на складе, поддерживается при каждом изменении оборотов"""
+
+    material = models.ForeignKey(Material, verbose_name="Материал", on_delete=models.CASCADE, related_name="balances")
+    warehouse = models.ForeignKey(Warehouse, verbose_name="Склад", on_delete=models.CASCADE, related_name="balances")
+    quantity = models.DecimalField(verbose_name="Количество", max_digits=12, decimal_places=2, default=0)
+    sum = models.DecimalField(verbose_name="Сумма", max_digits=15, decimal_places=2, default=0)
+    average_price = models.DecimalField(verbose_name="Средняя цена", max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.material.name} - {self.warehouse.name} ({self.quantity})"
+
+    class Meta:
+        verbose_name = "Остаток материала"
+        verbose_name_plural = "Остатки материалов"
+        constraints = [
+            models.UniqueConstraint(fields=("material", "warehouse"), name="unique_material_balance"),
+        ]
+
+
+class MaterialLastPrice(models.Model):
+    """Последняя цена прихода материала на склад (warehouse=None - по всем складам)"""
+
+    material = models.ForeignKey(
+        Material, verbose_name="Материал", on_delete=models.CASCADE, related_name="last_prices"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, verbose_name="Склад", on_delete=models.CASCADE, related_name="last_prices", blank=True, null=True
+    )
+    turnover = models.ForeignKey(Turnover, verbose_name="Приход", on_delete=models.CASCADE, related_name="+")
+    price = models.DecimalField(verbose_name="Цена", max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        warehouse_name = self.warehouse.name if self.warehouse else "Все склады"
+        return f"{self.material.name} - {warehouse_name} ({self.price})"
+
+    class Meta:
+        verbose_name = "Последняя цена материала"
+        verbose_name_plural = "Последние цены материалов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("material", "warehouse"),
+                condition=models.Q(warehouse__isnull=False),
+                name="unique_material_last_price_warehouse",
+            ),
+            models.UniqueConstraint(
+                fields=("material",),
+                condition=models.Q(warehouse__isnull=True),
+                name="unique_material_last_price",
+            ),
+        ]
+
+
+class MaterialBalanceSnapshot(models.Model):
+    """
+    Остаток материала на складе на конец закрытого месяца.
+    Запись создаётся только для месяцев, в которых по материалу на складе были обороты
+    """
+
+    material = models.ForeignKey(
+        Material, verbose_name="Материал", on_delete=models.CASCADE, related_name="balance_snapshots"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, verbose_name="Склад", on_delete=models.CASCADE, related_name="balance_snapshots"
+    )
+    period = models.DateField(verbose_name="Последний день месяца")
+    quantity = models.DecimalField(verbose_name="Количество", max_digits=12, decimal_places=2, default=0)
+    sum = models.DecimalField(verbose_name="Сумма", max_digits=15, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.period.strftime('%d.%m.%Y')} - {self.material.name} - {self.warehouse.name} ({self.quantity})"
+
+    class Meta:
+        verbose_name = "Остаток материала на конец месяца"
+        verbose_name_plural = "Остатки материалов на конец месяца"
+        ordering = ("-period",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=("material", "warehouse", "period"), name="unique_material_balance_snapshot"
+            ),
+        ]
+
+
+class MaterialConsumption(models.Model):
+    """
+    Расход материала на складе (списания по заказ-нарядам) за скользящее окно
+    CONSUMPTION_WINDOW_DAYS дней по date_end включительно
+    """
+
+    material = models.ForeignKey(
+        Material, verbose_name="Материал", on_delete=models.CASCADE, related_name="consumptions"
+    )
+    warehouse = models.ForeignKey(
+        Warehouse, verbose_name="Склад", on_delete=models.CASCADE, related_name="consumptions"
+    )
+    date_end = models.DateField(verbose_name="Последний день окна")
+    quantity = models.DecimalField(verbose_name="Израсходовано", max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date_end.strftime('%d.%m.%Y')} - {self.material.name} - {self.warehouse.name} ({self.quantity})"
+
+    class Meta:
+        verbose_name = "Расход материала"
+        verbose_name_plural = "Расход материалов"
+        constraints = [
+            models.UniqueConstraint(fields=("material", "warehouse"), name="unique_material_consumption"),
+        ]
+
+
+class Stocktake(models.Model):
+    """Инвентаризация склада: учётные остатки фиксируются при создании, фактические вводятся пользователями"""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name="Пользователь", on_delete=models.PROTECT, related_name="stocktakes"
+    )
+    warehouse = models.ForeignKey(Warehouse, verbose_name="Склад", on_delete=models.PROTECT, related_name="stocktakes")
+    date = models.DateField(verbose_name="Дата")
+    status = models.IntegerField(verbose_name="Статус", choices=STOCKTAKE_STATUS, default=STOCKTAKE_DRAFT)
+    note = models.TextField(verbose_name="Примечание", blank=True)
+
+    def __str__(self):
+        return f"{self.date.strftime('%d.%m.%Y')} - {self.warehouse.name}"
+
+    class Meta:
+        verbose_name = "Инвентаризация"
+        verbose_name_plural = "Инвентаризации"
+        ordering = ("-date", "-pk")
+
+
+class StocktakeLine(models.Model):
+    """Строка инвентаризации: учётный остаток материала и посчитанное количество (None - ещё не посчитан)"""
+
+    stocktake = models.ForeignKey(
+        Stocktake, verbose_name="Инвентаризация", on_delete=models.CASCADE, related_name="lines"
+    )
+    material = models.ForeignKey(
+        Material, verbose_name="Материал", on_delete=models.PROTECT, related_name="stocktake_lines"
+    )
+    expected_quantity = models.DecimalField(verbose_name="Учётный остаток", max_digits=12, decimal_places=2, default=0)
+    counted_quantity = models.DecimalField(
+        verbose_name="Фактический остаток", max_digits=12, decimal_places=2, blank=True, null=True
+    )
+    price = models.DecimalField(verbose_name="Цена", max_digits=12, decimal_places=2, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.material.name} ({self.expected_quantity} / {self.counted_quantity})"
+
+    class Meta:
+        verbose_name = "Строка инвентаризации"
+        verbose_name_plural = "Строки инвентаризации"
+        ordering = ("pk",)
+        constraints = [
+            models.UniqueConstraint(fields=("stocktake", "material"), name="unique_stocktake_line"),
+        ]
@@ -1,47 +1,60 @@
-from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 
-from .constants import COMING
-from .constants import EXPENSE
-from .helpers.material_utils import get_material_remains
+from .helpers.material_balance import update_material_balances
+from .helpers.material_consumption import update_material_consumption
+from .helpers.material_last_price import is_purchase
+from .helpers.material_last_price import refresh_material_last_prices
+from .helpers.material_snapshot import update_material_snapshots
+from .helpers.validators_turnover import validator_turnover
 from .models import Turnover
 
 
 @receiver(pre_save, sender=Turnover)
 def check_before_save(sender, instance, *args, **kwargs):
-    if instance.type == COMING and not instance.is_correction and not instance.entrance:
-        raise ValidationError({"entrance": ("Отсутсвует поле entrance")})
+    validator_turnover(instance)
 
-    if instance.type == EXPENSE and not instance.is_correction and not instance.order:
-        raise ValidationError({"entrance": ("Отсутсвует поле order")})
 
-    if instance.order and instance.entrance:
-        raise ValidationError({"entrance": ("Должно быть одно из полей 'entrance' или 'order'")})
-
-    if instance.is_correction and (instance.order or instance.entrance):
-        raise ValidationError({"is_correction": ("Поля 'entrance' и 'order' не должны указываться при корректировке")})
-
-    if instance.is_correction is True and len(instance.note) <= 0:
-        raise ValidationError({"is_correction": ("Поле 'note' обязательно при корректировки")})
-
-    quantity = float(abs(instance.quantity))
-    price = float(instance.price)
-    sum_ = float(abs(instance.sum))
-
-    if round(quantity * price, 2) != sum_:
-        raise ValidationError({"sum": ("Неверная сумма")})
-
-    if quantity <= 0.00:
-        raise ValidationError({"quantity": ("Количество должно быть больше 0")})
-
-    if price <= 0.00:
-        raise ValidationError({"price": ("Цена должно быть больше 0")})
-
-    if sum_ <= 0.00:
-        raise ValidationError({"sum": ("Сумма должно быть больше 0")})
-
-    if instance.type == EXPENSE and quantity > get_material_remains(
-        instance.material, instance.warehouse, instance.date
-    ):
-        raise ValidationError({"quantity": ("Вы пытаетесь списать больше чем в наличии на складе")})
+@receiver(pre_save, sender=Turnover)
+def remember_turnover_before_save(sender, instance, *args, **kwargs):
+    instance._previous_turnover = None
+    if instance.pk:
+        instance._previous_turnover = (
+            Turnover.objects.filter(pk=instance.pk)
+            .values("type", "is_correction", "material_id", "warehouse_id", "date", "quantity", "sum")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Turnover)
+def update_balance_after_save(sender, instance, created, *args, **kwargs):
+    previous_turnover = getattr(instance, "_previous_turnover", None)
+    if previous_turnover:
+        update_material_balances([previous_turnover], sign=-1)
+        update_material_snapshots([previous_turnover], sign=-1)
+        update_material_consumption([previous_turnover], sign=-1)
+
+    update_material_balances([instance])
+    update_material_snapshots([instance])
+    update_material_consumption([instance])
+
+    materials_pk = []
+    if previous_turnover and is_purchase(previous_turnover["type"], previous_turnover["is_correction"]):
+        materials_pk.append(previous_turnover["material_id"])
+    if is_purchase(instance.type, instance.is_correction):
+        materials_pk.append(instance.material_id)
+
+    if materials_pk:
+        refresh_material_last_prices(materials_pk)
+
+
+@receiver(post_delete, sender=Turnover)
+def update_balance_after_delete(sender, instance, *args, **kwargs):
+    update_material_balances([instance], sign=-1)
+    update_material_snapshots([instance], sign=-1)
+    update_material_consumption([instance], sign=-1)
+
+    if is_purchase(instance.type, instance.is_correction):
+        refresh_material_last_prices([instance.material_id])
@@ -1,8 +1,14 @@
 import json
+from decimal import Decimal
+from io import BytesIO
 
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.db.models.deletion import ProtectedError
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from openpyxl import Workbook
 from rest_framework import status
 
 from app.helpers.database import get_period_filter_lookup
@@ -14,6 +20,8 @@ from ...api.serializers import EntranceListSerializer
 from ...api.serializers import EntranceSerializer
 from ...constants import COMING
 from ...models import Entrance
+from ...models import MaterialBalance
+from ...models import MaterialLastPrice
 from ...tests.factory import EntranceFactory
 from ...tests.factory import MaterialCategoryFactory
 from ...tests.factory import MaterialFactory
@@ -22,6 +30,28 @@ from ...tests.factory import UnitFactory
 from ...tests.factory import WarehouseFactory
 
 
+def get_entrance_payload(responsible, warehouse, materials):
+    return {
+        "date": "18.10.2022",
+        "document_number": "A-111",
+        "responsible": responsible.pk,
+        "provider": "ОАО КАМАЗ",
+        "note": "Тестовое поступление",
+        "turnovers_from_entrance": [
+            {
+                "pk": None,
+                "date": "18.10.2022",
+                "material": material.pk,
+                "warehouse": warehouse.pk,
+                "price": 10.0,
+                "quantity": 2.0,
+                "sum": 20.0,
+            }
+            for material in materials
+        ],
+    }
+
+
 class EntranceApiTestCase(AuthorizationAPITestCase):
     def test_get_list(self):
         user = get_test_user()
@@ -112,6 +142,39 @@ class EntranceApiTestCase(AuthorizationAPITestCase):
         self.assertEqual(status.HTTP_201_CREATED, response.status_code)
         self.assertTrue(Entrance.objects.get(document_number=payload["document_number"]))
 
+    def test_create_bulk(self):
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        materials = [MaterialFactory(unit=unit, category=category, name=f"Материал {number}") for number in range(20)]
+        warehouse = WarehouseFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+
+        payload = get_entrance_payload(responsible, warehouse, materials)
+
+        url = reverse("entrance-list")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+        # Строки прихода записываются одним INSERT
+        turnover_inserts = [
+            query for query in context.captured_queries if query["sql"].startswith('INSERT INTO "warehouse_turnover"')
+        ]
+        self.assertEqual(len(turnover_inserts), 1)
+
+        # Число запросов не зависит от количества строк
+        payload_few = get_entrance_payload(responsible, WarehouseFactory(name="Склад 2"), materials[:2])
+        payload_few["document_number"] = "A-112"
+        with CaptureQueriesContext(connection) as context_few:
+            response = self.client.post(url, data=json.dumps(payload_few), content_type="application/json")
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(len(context_few), len(context))
+
+        entrance = Entrance.objects.get(document_number=payload["document_number"])
+        self.assertEqual(entrance.turnovers_from_entrance.filter(type=COMING, quantity=2.0, sum=20.0).count(), 20)
+        self.assertEqual(MaterialBalance.objects.filter(warehouse=warehouse, quantity=2.0, sum=20.0).count(), 20)
+        self.assertEqual(MaterialLastPrice.objects.filter(warehouse=warehouse, price=10.0).count(), 20)
+
     def test_get(self):
         user = get_test_user()
 
@@ -254,3 +317,87 @@ class EntranceApiTestCase(AuthorizationAPITestCase):
 
         result_providers = ["ГиперАвто", "ОАО КАМАЗ"]
         self.assertEqual(response.data, result_providers)
+
+    def test_import_preview(self):
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material1 = MaterialFactory(unit=unit, category=category, article_number="A-1")
+        material2 = MaterialFactory(unit=unit, category=category, name="Масло моторное TOYOTA 5w20")
+        warehouse = WarehouseFactory()
+
+        content = (
+            "Артикул;Наименование;Количество;Цена\n"
+            "A-1;Другое название;2;10,50\n"
+            ";масло моторное toyota 5w20;1;100\n"
+            "B-2;Неизвестный материал;3;5\n"
+        )
+        url = reverse("entrance-import")
+        # Выгрузка 1С и Excel - в cp1251, остальные - в UTF-8 с BOM или без
+        for encoding in ("utf-8", "utf-8-sig", "cp1251"):
+            file = SimpleUploadedFile("invoice.csv", content.encode(encoding), content_type="text/csv")
+            response = self.client.post(url, {"file": file, "warehouse": warehouse.pk}, format="multipart")
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(response.data["matched_count"], 2)
+            self.assertEqual(response.data["unmatched_count"], 1)
+
+            lines = response.data["lines"]
+            self.assertEqual([line["material"] for line in lines], [material1.pk, material2.pk, None])
+            self.assertEqual(lines[0]["sum"], Decimal("21.00"))
+            self.assertEqual(lines[2]["error"], "Материал не найден")
+        self.assertFalse(Entrance.objects.exists())
+
+        file = SimpleUploadedFile("invoice.csv", b"\x98\x98;1;2\n", content_type="text/csv")
+        response = self.client.post(url, {"file": file, "warehouse": warehouse.pk}, format="multipart")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("file", response.data["errors"])
+
+        file = SimpleUploadedFile("invoice.xlsx", b"not a zip file")
+        response = self.client.post(url, {"file": file, "warehouse": warehouse.pk}, format="multipart")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("file", response.data["errors"])
+
+    def test_import_commit(self):
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material = MaterialFactory(unit=unit, category=category, article_number="12345")
+        warehouse = WarehouseFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+
+        wb = Workbook()
+        wb.active.append(["Код", "Наименование", "Количество", "Цена", "Сумма"])
+        wb.active.append([12345, "", 4, 5, 20])
+        file = BytesIO()
+        wb.save(file)
+        file = SimpleUploadedFile("invoice.xlsx", file.getvalue())
+
+        payload = {
+            "file": file,
+            "warehouse": warehouse.pk,
+            "commit": True,
+            "date": "18.10.2022",
+            "document_number": "A-111",
+            "responsible": responsible.pk,
+            "provider": "ОАО КАМАЗ",
+            "note": "Импорт накладной",
+        }
+
+        url = reverse("entrance-import")
+        response = self.client.post(url, payload, format="multipart")
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+        # Сумма не равна количеству, умноженному на цену - строка не сопоставлена, поступление не создаётся
+        content = "12345;x;3;3,33;10,00\n"
+        payload["file"] = SimpleUploadedFile("invoice.csv", content.encode(), content_type="text/csv")
+        payload["document_number"] = "A-112"
+        response = self.client.post(url, payload, format="multipart")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(response.data["unmatched_count"], 1)
+        self.assertIn("9.99", response.data["lines"][0]["error"])
+        self.assertFalse(Entrance.objects.filter(document_number="A-112").exists())
+
+        entrance = Entrance.objects.get(document_number="A-111")
+        turnover = entrance.turnovers_from_entrance.get()
+        self.assertEqual(turnover.material, material)
+        self.assertEqual(turnover.warehouse, warehouse)
+        self.assertEqual(float(turnover.quantity), 4.0)
+        self.assertEqual(float(turnover.sum), 20.0)
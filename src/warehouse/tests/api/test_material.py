@@ -1,5 +1,8 @@
 import json
 
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -10,6 +13,7 @@ from app.helpers.testing import get_test_user
 from core.tests.factory import EmployeeFactory
 from warehouse.constants import COMING
 from warehouse.helpers.get_queryset_materials_remains import get_queryset_materials_remains
+from warehouse.helpers.material_search import search_materials
 
 from ...api.serializers import MaterialAvailabilitySerializer
 from ...api.serializers import MaterialListSerializer
@@ -17,6 +21,7 @@ from ...api.serializers import MaterialRemainsCategorySerializer
 from ...api.serializers import MaterialRemainsSerializer
 from ...api.serializers import MaterialSerializer
 from ...models import Material
+from ...models import MaterialConsumption
 from ..factory import EntranceFactory
 from ..factory import MaterialCategoryFactory
 from ..factory import MaterialFactory
@@ -82,6 +87,38 @@ class MaterialApiTestCase(AuthorizationAPITestCase):
         }
         self.assertEqual(serializer_data, response.data)
 
+    def test_get_list_material_remains_query_count(self):
+        user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        warehouse1 = WarehouseFactory()
+        warehouse2 = WarehouseFactory(name="Склад 2")
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible)
+
+        def create_materials(names):
+            for name in names:
+                material = MaterialFactory(unit=unit, category=category, name=name)
+                TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse1, entrance=entrance)
+                TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse2, entrance=entrance)
+
+        url = reverse("material-remains-list")
+
+        create_materials(["Материал 1", "Материал 2"])
+        with CaptureQueriesContext(connection) as context_small:
+            response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(len(response.data["results"][0]["warehouses_availability"]), 2)
+
+        create_materials([f"Материал {number}" for number in range(3, 11)])
+        with CaptureQueriesContext(connection) as context_large:
+            response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(response.data["count"], 10)
+
+        self.assertEqual(len(context_small), len(context_large))
+
     def test_get_list_material_remains_category(self):
         user = get_test_user()
 
@@ -151,6 +188,54 @@ class MaterialApiTestCase(AuthorizationAPITestCase):
         serializer_data = MaterialAvailabilitySerializer(material).data
         self.assertEqual(serializer_data, response.data)
 
+    def test_get_availability_list(self):
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material1 = MaterialFactory(unit=unit, category=category)
+        material2 = MaterialFactory(unit=unit, category=category, name="Масло моторное TOYOTA 5w20")
+        material3 = MaterialFactory(unit=unit, category=category, name="Фильтр масляный")
+
+        user = get_test_user()
+        warehouse1 = WarehouseFactory()
+        warehouse2 = WarehouseFactory(name="Склад 2")
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(user=user, type=COMING, material=material1, warehouse=warehouse1, entrance=entrance)
+        TurnoverFactory(
+            user=user,
+            type=COMING,
+            material=material1,
+            warehouse=warehouse2,
+            entrance=entrance,
+            price=13.0,
+            quantity=1.0,
+            sum=13.0,
+        )
+        TurnoverFactory(user=user, type=COMING, material=material2, warehouse=warehouse2, entrance=entrance)
+        # Приход будущей датой не входит в остаток на сегодня
+        TurnoverFactory(
+            user=user, type=COMING, material=material2, warehouse=warehouse2, entrance=entrance, date="2099-01-01"
+        )
+
+        url = reverse("material-availability-list")
+        materials = [material3, material1, material2]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {"materials": ",".join(str(material.pk) for material in materials)})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # То же, что по одному материалу с availability_mode, в порядке запроса
+        serializer_data = [MaterialAvailabilitySerializer(material).data for material in materials]
+        self.assertEqual(serializer_data, response.data)
+
+        # Количество запросов не зависит от количества материалов
+        with CaptureQueriesContext(connection) as context_one:
+            response = self.client.get(url, {"materials": str(material1.pk)})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(context), len(context_one))
+
+        response = self.client.get(url, {"materials": "1,a"})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
     def test_update(self):
         unit1 = UnitFactory()
         category1 = MaterialCategoryFactory()
@@ -185,3 +270,84 @@ class MaterialApiTestCase(AuthorizationAPITestCase):
 
         with self.assertRaises(Material.DoesNotExist):
             Material.objects.get(pk=material.pk)
+
+    def test_get_list_search(self):
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material1 = MaterialFactory(unit=unit, category=category, name="Фильтр масляный КАМАЗ", compatbility=[])
+        material2 = MaterialFactory(unit=unit, category=category, name="Фильтр", compatbility=["ГАЗель NEXT"])
+        material3 = MaterialFactory(unit=unit, category=category, name="Свеча зажигания", compatbility=["Газель"])
+
+        url = reverse("material-list")
+
+        # Совпадение по наименованию и тегу совместимости, более похожие выше
+        response = self.client.get(url, {"general_search": "фильтр"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([material["pk"] for material in response.data], [material2.pk, material1.pk])
+
+        response = self.client.get(url, {"general_search": "газель"})
+        self.assertEqual([material["pk"] for material in response.data], [material3.pk, material2.pk])
+
+        # Спецсимволы регулярных выражений ищутся как текст
+        response = self.client.get(url, {"general_search": "(.*"})
+        self.assertEqual(response.data, [])
+
+    def test_get_reorder_list(self):
+        user = get_test_user()
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material1 = MaterialFactory(unit=unit, category=category)
+        material2 = MaterialFactory(name="Фильтр масляный", unit=unit, category=category)
+        warehouse = WarehouseFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        for material in (material1, material2):
+            TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance)
+
+        # 90 дней окна: 0.5 и 0.01 в день при остатке 2
+        MaterialConsumption.objects.create(material=material1, warehouse=warehouse, date_end="2022-03-01", quantity=45)
+        MaterialConsumption.objects.create(
+            material=material2, warehouse=warehouse, date_end="2022-03-01", quantity=0.9
+        )
+
+        url = reverse("material-reorder-list")
+        response = self.client.get(url, {"days": 14, "warehouse": warehouse.pk})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            json.loads(json.dumps(response.data, cls=DecimalEncoder)),
+            [
+                {
+                    "material": material1.pk,
+                    "material_name": material1.name,
+                    "unit_name": unit.name,
+                    "warehouse": warehouse.pk,
+                    "warehouse_name": warehouse.name,
+                    "remains": 2.0,
+                    "daily_quantity": 0.5,
+                    "days_of_cover": 4.0,
+                    "reorder_quantity": 5.0,
+                }
+            ],
+        )
+
+        response = self.client.get(url, {"days": 365})
+        self.assertEqual([row["material"] for row in response.data], [material1.pk, material2.pk])
+
+        response = self.client.get(url, {"days": "abc"})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class MaterialSearchIndexTestCase(TestCase):
+    def test_search_uses_trigram_indexes(self):
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        MaterialFactory(unit=unit, category=category, compatbility=["ГАЗель 42"])
+
+        with connection.cursor() as cursor:
+            # На нескольких строках планировщик выбрал бы полный просмотр, проверяется только применимость индексов
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_indexscan = off")
+
+        plan = search_materials(Material.objects.all(), "газель 42").explain()
+        self.assertIn("material_name_trgm", plan)
+        self.assertIn("material_compatbility_trgm", plan)
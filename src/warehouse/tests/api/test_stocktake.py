@@ -0,0 +1,246 @@
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+
+from app.helpers.testing import AuthorizationAPITestCase
+from app.helpers.testing import get_test_user
+from core.tests.factory import EmployeeFactory
+
+from ...constants import COMING
+from ...constants import EXPENSE
+from ...constants import STOCKTAKE_DRAFT
+from ...constants import STOCKTAKE_POSTED
+from ...helpers.turnover_bulk_create import bulk_create_turnovers
+from ...models import Material
+from ...models import MaterialBalance
+from ...models import Stocktake
+from ...models import StocktakeLine
+from ...models import Turnover
+from ...tests.factory import EntranceFactory
+from ...tests.factory import MaterialCategoryFactory
+from ...tests.factory import MaterialFactory
+from ...tests.factory import TurnoverFactory
+from ...tests.factory import UnitFactory
+from ...tests.factory import WarehouseFactory
+
+
+class StocktakeApiTestCase(AuthorizationAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        self.material1 = MaterialFactory(unit=unit, category=category)
+        self.material2 = MaterialFactory(unit=unit, category=category, name="Масло моторное TOYOTA 5w20")
+        self.material3 = MaterialFactory(unit=unit, category=category, name="Фильтр масляный")
+        self.material4 = MaterialFactory(unit=unit, category=category, name="Свеча зажигания")
+        self.warehouse = WarehouseFactory()
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=self.user, responsible=responsible)
+        for material in (self.material1, self.material2, self.material3):
+            TurnoverFactory(
+                user=self.user, type=COMING, material=material, warehouse=self.warehouse, entrance=entrance
+            )
+
+    def create_stocktake(self):
+        url = reverse("stocktake-list")
+        payload = {"warehouse": self.warehouse.pk, "date": "01.02.2022", "note": "Годовая"}
+        response = self.client.post(url, data=payload)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        return Stocktake.objects.get(pk=response.data["pk"])
+
+    def test_create(self):
+        stocktake = self.create_stocktake()
+
+        self.assertEqual(stocktake.status, STOCKTAKE_DRAFT)
+        self.assertEqual(
+            list(stocktake.lines.order_by("material_id").values_list("material_id", "expected_quantity")),
+            [(self.material1.pk, 2), (self.material2.pk, 2), (self.material3.pk, 2)],
+        )
+
+        url = reverse("stocktake-line-list", kwargs={"pk": stocktake.pk})
+        response = self.client.get(url, data={"is_counted": "false"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(response.data["count"], 3)
+
+    def test_count_and_post(self):
+        stocktake = self.create_stocktake()
+
+        url = reverse("stocktake-line-list", kwargs={"pk": stocktake.pk})
+        payload = {
+            "lines": [
+                {"material": self.material1.pk, "counted_quantity": 5},
+                {"material": self.material2.pk, "counted_quantity": 0.5},
+                {"material": self.material4.pk, "counted_quantity": 1, "price": 30},
+            ]
+        }
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(response.data["lines_count"], 3)
+
+        # Повторный подсчёт перезаписывает количество
+        payload = {"lines": [{"material": self.material1.pk, "counted_quantity": 3}]}
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        response = self.client.get(url, data={"is_counted": "true"})
+        self.assertEqual(response.data["count"], 3)
+
+        url = reverse("stocktake-post", kwargs={"pk": stocktake.pk})
+        response = self.client.post(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(response.data["status"], STOCKTAKE_POSTED)
+        self.assertEqual(response.data["turnovers_count"], 3)
+
+        turnovers = Turnover.objects.filter(is_correction=True).order_by("material_id")
+        self.assertEqual(
+            [
+                (turnover.material_id, turnover.type, float(turnover.quantity), float(turnover.sum))
+                for turnover in turnovers
+            ],
+            [
+                (self.material1.pk, COMING, 1.0, 10.0),
+                (self.material2.pk, EXPENSE, -1.5, -15.0),
+                (self.material4.pk, COMING, 1.0, 30.0),
+            ],
+        )
+        self.assertEqual(turnovers[0].note, f"Инвентаризация №{stocktake.pk}")
+
+        # Непосчитанный материал не корректируется
+        balances = MaterialBalance.objects.filter(warehouse=self.warehouse).order_by("material_id")
+        self.assertEqual(
+            [(balance.material_id, float(balance.quantity)) for balance in balances],
+            [(self.material1.pk, 3.0), (self.material2.pk, 0.5), (self.material3.pk, 2.0), (self.material4.pk, 1.0)],
+        )
+
+        # Повторно провести и удалить проведённую нельзя
+        response = self.client.post(url)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(Turnover.objects.filter(is_correction=True).count(), 3)
+
+        url = reverse("stocktake-detail", kwargs={"pk": stocktake.pk})
+        response = self.client.delete(url)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_post_without_price(self):
+        stocktake = self.create_stocktake()
+
+        url = reverse("stocktake-line-list", kwargs={"pk": stocktake.pk})
+        payload = {
+            "lines": [
+                {"material": self.material1.pk, "counted_quantity": 5},
+                {"material": self.material4.pk, "counted_quantity": 1},
+            ]
+        }
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        url = reverse("stocktake-post", kwargs={"pk": stocktake.pk})
+        response = self.client.post(url)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("price", response.data["errors"])
+        self.assertFalse(Turnover.objects.filter(is_correction=True).exists())
+
+        stocktake.refresh_from_db()
+        self.assertEqual(stocktake.status, STOCKTAKE_DRAFT)
+
+    def test_post_before_last_turnover(self):
+        stocktake = self.create_stocktake()
+        TurnoverFactory(
+            user=self.user,
+            type=COMING,
+            date="2022-02-10",
+            is_correction=True,
+            note="Корректировка",
+            material=self.material1,
+            warehouse=self.warehouse,
+        )
+
+        url = reverse("stocktake-line-list", kwargs={"pk": stocktake.pk})
+        payload = {"lines": [{"material": self.material1.pk, "counted_quantity": 5}]}
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # Остаток на дату инвентаризации отличается от текущего, корректировка датой инвентаризации была бы неверной
+        url = reverse("stocktake-post", kwargs={"pk": stocktake.pk})
+        response = self.client.post(url)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn("date", response.data["errors"])
+        self.assertEqual(Turnover.objects.filter(note__startswith="Инвентаризация").count(), 0)
+
+        stocktake.refresh_from_db()
+        self.assertEqual(stocktake.status, STOCKTAKE_DRAFT)
+
+    def test_post_queries_count(self):
+        materials = Material.objects.bulk_create(
+            [
+                Material(
+                    name=f"Материал {number}",
+                    unit=self.material1.unit,
+                    category=self.material1.category,
+                    compatbility=[],
+                )
+                for number in range(50)
+            ]
+        )
+
+        def post_stocktake(warehouse_name: str, materials: list) -> int:
+            warehouse = WarehouseFactory(name=warehouse_name)
+            bulk_create_turnovers(
+                [
+                    Turnover(
+                        user=self.user,
+                        type=COMING,
+                        date="2022-01-01",
+                        is_correction=True,
+                        note="Начальный остаток",
+                        material=material,
+                        warehouse=warehouse,
+                        price=10,
+                        quantity=10,
+                        sum=100,
+                    )
+                    for material in materials
+                ]
+            )
+            response = self.client.post(
+                reverse("stocktake-list"), data={"warehouse": warehouse.pk, "date": "01.02.2022"}
+            )
+            pk = response.data["pk"]
+
+            payload = {"lines": [{"material": material.pk, "counted_quantity": 5} for material in materials]}
+            url = reverse("stocktake-line-list", kwargs={"pk": pk})
+            response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse("stocktake-post", kwargs={"pk": pk}))
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(response.data["turnovers_count"], len(materials))
+            return len(context)
+
+        # Число запросов проведения не зависит от количества строк
+        self.assertEqual(post_stocktake("Склад 2", materials[:5]), post_stocktake("Склад 3", materials))
+
+    def test_count_unknown_material(self):
+        stocktake = self.create_stocktake()
+
+        url = reverse("stocktake-line-list", kwargs={"pk": stocktake.pk})
+        payload = {"lines": [{"material": 0, "counted_quantity": 1}]}
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(StocktakeLine.objects.filter(counted_quantity__isnull=False).count(), 0)
+
+    def test_delete(self):
+        stocktake = self.create_stocktake()
+
+        url = reverse("stocktake-detail", kwargs={"pk": stocktake.pk})
+        response = self.client.delete(url)
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(StocktakeLine.objects.exists())
@@ -1,9 +1,22 @@
+import csv
+import json
+from datetime import datetime
+from io import BytesIO
+from unittest.mock import patch
+
+from django.db.models import F
 from django.urls import reverse
 
+from openpyxl import load_workbook
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
 from app.helpers.testing import AuthorizationAPITestCase
 from app.helpers.testing import get_test_user
+from app.pagination import BasePagination
+from app.pagination import KeysetPagination
 from core.tests.factory import CarFactory
 from core.tests.factory import EmployeeFactory
 from orders.constants import COMPLETED
@@ -16,6 +29,7 @@ from ...api.serializers import TurnoverMaterialReadSerializer
 from ...api.serializers import TurnoverSerializer
 from ...constants import COMING
 from ...constants import EXPENSE
+from ...models import MaterialBalance
 from ...models import Turnover
 from ...tests.factory import EntranceFactory
 from ...tests.factory import MaterialCategoryFactory
@@ -304,6 +318,114 @@ class TurnoverApiTestCase(AuthorizationAPITestCase):
 
         self.assertEqual(serializer_data, response_warehouse_filter.data)
 
+    def test_get_turnover_material_list_cursor(self):
+        user = get_test_user()
+
+        material = MaterialFactory(unit=UnitFactory(), category=MaterialCategoryFactory())
+        warehouse = WarehouseFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        for date, price in (("2022-01-01", 10.0), ("2022-01-02", 12.0), ("2022-01-02", 11.0), ("2022-01-03", 12.0)):
+            TurnoverFactory(
+                user=user,
+                type=COMING,
+                date=date,
+                material=material,
+                warehouse=warehouse,
+                entrance=entrance,
+                price=price,
+                sum=price * 2,
+            )
+        other_material = MaterialFactory(name="Другой", unit=material.unit, category=material.category)
+        TurnoverFactory(user=user, type=COMING, material=other_material, warehouse=warehouse, entrance=entrance)
+
+        url = reverse("turnover-material-list")
+
+        def get_all_pages(params):
+            pages = []
+            params = {"material_pk": material.pk, "pagination": "cursor", **params}
+            with patch.object(BasePagination, "page_size", 3):
+                while True:
+                    response = self.client.get(url, params)
+                    self.assertEqual(status.HTTP_200_OK, response.status_code)
+                    self.assertNotIn("count", response.data)
+                    pages.append([turnover["pk"] for turnover in response.data["results"]])
+                    if not response.data["cursor"]:
+                        return pages
+                    params["cursor"] = response.data["cursor"]
+
+        queryset = Turnover.objects.filter(material=material)
+        expected = list(queryset.order_by("-date", "-pk").values_list("pk", flat=True))
+        self.assertEqual([expected[:3], expected[3:]], get_all_pages({}))
+
+        expected = list(queryset.order_by("price", "pk").values_list("pk", flat=True))
+        self.assertEqual([expected[:3], expected[3:]], get_all_pages({"sortField": "price", "sortOrder": "ascend"}))
+
+        pagination = KeysetPagination(3)
+        for cursor in ("bad", pagination.encode_cursor(["not-a-date", 1]), pagination.encode_cursor([{}, []])):
+            response = self.client.get(url, {"material_pk": material.pk, "pagination": "cursor", "cursor": cursor})
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+        # Сортировка выражением не поддерживается курсором - ошибка запроса (400), а не сервера
+        request = Request(APIRequestFactory().get(url, {"pagination": "cursor"}))
+        with self.assertRaises(ValidationError):
+            BasePagination().paginate_queryset(queryset.order_by(F("date").desc()), request)
+
+    def test_export(self):
+        user = get_test_user()
+
+        category = MaterialCategoryFactory()
+        material = MaterialFactory(unit=UnitFactory(), category=category, article_number="A-1")
+        other_category = MaterialCategoryFactory(name="Другая категория")
+        other_material = MaterialFactory(name="Другой", unit=material.unit, category=other_category)
+        warehouse = WarehouseFactory()
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible, document_number="42", provider="Поставщик")
+        turnover1 = TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance)
+        turnover2 = TurnoverFactory(
+            user=user,
+            type=EXPENSE,
+            date="2022-01-05",
+            is_correction=True,
+            note="Списание",
+            material=material,
+            warehouse=warehouse,
+            quantity=1.0,
+            sum=10.0,
+        )
+        TurnoverFactory(user=user, type=COMING, material=other_material, warehouse=warehouse, entrance=entrance)
+        TurnoverFactory(
+            user=user, type=COMING, date="2022-02-01", material=material, warehouse=warehouse, entrance=entrance
+        )
+
+        url = reverse("turnover-export")
+        params = {"date_begin": "01.01.2022", "date_end": "31.01.2022", "category": category.pk}
+
+        response = self.client.get(url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        rows = list(csv.reader(content.splitlines(), delimiter=";"))
+        self.assertEqual(rows[0][:3], ["№", "Дата", "Тип"])
+        self.assertEqual(
+            rows[1],
+            [str(turnover1.pk), "01.01.2022", "Приход", "", "A-1", material.name, category.name, material.unit.name]
+            + [warehouse.name, "2.00", "10.00", "20.00", "", "42", "Поставщик", ""],
+        )
+        self.assertEqual([row[0] for row in rows[1:]], [str(turnover1.pk), str(turnover2.pk)])
+        self.assertEqual([rows[2][3], rows[2][-1]], ["Да", "Списание"])
+        self.assertEqual(rows[2][9:12], ["-1.00", "10.00", "-10.00"])
+
+        response = self.client.get(url, {**params, "turnover_type": EXPENSE, "file_format": "xlsx"})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        ws = load_workbook(BytesIO(b"".join(response.streaming_content))).active
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][:3], (turnover2.pk, datetime(2022, 1, 5), "Расход"))
+
+        response = self.client.get(url, {"file_format": "pdf"})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
     def test_moving_material(self):
         user = get_test_user()
 
@@ -359,5 +481,77 @@ class TurnoverApiTestCase(AuthorizationAPITestCase):
 
         url = reverse("turnover-moving-material")
         response = self.client.post(url, data=payload)
-        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
         self.assertNotEqual(Turnover.objects.all().count(), 3)
+
+    def test_moving_materials(self):
+        user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material1 = MaterialFactory(unit=unit, category=category)
+        material2 = MaterialFactory(unit=unit, category=category, name="Масло моторное TOYOTA 5w20")
+        warehouse = WarehouseFactory()
+        warehouse2 = WarehouseFactory(name="Склад 2")
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(user=user, type=COMING, material=material1, warehouse=warehouse, entrance=entrance)
+        TurnoverFactory(user=user, type=COMING, material=material2, warehouse=warehouse, entrance=entrance)
+
+        payload = {
+            "date": "01.01.2022",
+            "warehouse_outgoing": warehouse.pk,
+            "warehouse_incoming": warehouse2.pk,
+            "materials": [
+                {"material": material1.pk, "price": 10.00, "quantity": 1.0, "sum": 10.00},
+                {"material": material2.pk, "price": 10.00, "quantity": 2.0, "sum": 20.00},
+            ],
+        }
+
+        url = reverse("turnover-moving-materials")
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(Turnover.objects.all().count(), 6)
+
+        balances = MaterialBalance.objects.order_by("material_id", "warehouse_id")
+        self.assertEqual(
+            [(balance.material_id, balance.warehouse_id, float(balance.quantity)) for balance in balances],
+            [
+                (material1.pk, warehouse.pk, 1.0),
+                (material1.pk, warehouse2.pk, 1.0),
+                (material2.pk, warehouse.pk, 0.0),
+                (material2.pk, warehouse2.pk, 2.0),
+            ],
+        )
+
+    def test_moving_materials_error(self):
+        user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        material = MaterialFactory(unit=unit, category=category)
+        warehouse = WarehouseFactory()
+        warehouse2 = WarehouseFactory(name="Склад 2")
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse, entrance=entrance)
+
+        # По отдельности строки проходят, в сумме остатка не хватает
+        payload = {
+            "date": "01.01.2022",
+            "warehouse_outgoing": warehouse.pk,
+            "warehouse_incoming": warehouse2.pk,
+            "materials": [
+                {"material": material.pk, "price": 10.00, "quantity": 1.5, "sum": 15.00},
+                {"material": material.pk, "price": 10.00, "quantity": 1.0, "sum": 10.00},
+            ],
+        }
+
+        url = reverse("turnover-moving-materials")
+        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        self.assertEqual(Turnover.objects.all().count(), 1)
@@ -1,12 +1,22 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 
 from app.helpers.testing import AuthorizationAPITestCase
+from app.helpers.testing import get_test_user
+from core.tests.factory import EmployeeFactory
 
 from ...api.serializers import WarehouseListSerializer
 from ...api.serializers import WarehouseSerializer
+from ...constants import COMING
 from ...models import Warehouse
+from ..factory import EntranceFactory
+from ..factory import MaterialCategoryFactory
+from ..factory import MaterialFactory
+from ..factory import TurnoverFactory
+from ..factory import UnitFactory
 from ..factory import WarehouseFactory
 
 
@@ -23,6 +33,31 @@ class WarehouseApiTestCase(AuthorizationAPITestCase):
         serializer_data = WarehouseListSerializer(queryset, many=True).data
         self.assertEqual(serializer_data, response.data)
 
+    def test_get_list_delete_forbidden(self):
+        user = get_test_user()
+        material = MaterialFactory(unit=UnitFactory(), category=MaterialCategoryFactory())
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=user, responsible=responsible)
+        warehouse1 = WarehouseFactory()
+        WarehouseFactory(name="Склад 2")
+        TurnoverFactory(user=user, type=COMING, material=material, warehouse=warehouse1, entrance=entrance)
+
+        url = reverse("warehouse-list")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(
+            {warehouse["name"]: warehouse["delete_forbidden"] for warehouse in response.data},
+            {"Главный склад": True, "Склад 2": False},
+        )
+
+        # delete_forbidden считается в запросе списка, количество запросов не зависит от количества складов
+        for number in range(3, 10):
+            WarehouseFactory(name=f"Склад {number}")
+        with CaptureQueriesContext(connection) as context_more:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 9)
+        self.assertEqual(len(context), len(context_more))
+
     def test_create(self):
         payload = {"name": "Главный склад"}
 
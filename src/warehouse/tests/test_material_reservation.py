@@ -0,0 +1,145 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from app.helpers.testing import THREADS_COUNT
+from app.helpers.testing import get_test_user
+from app.helpers.testing import run_concurrently
+from core.tests.factory import EmployeeFactory
+
+from ..constants import COMING
+from ..constants import EXPENSE
+from ..helpers.material_balance import get_material_balance_mismatches
+from ..helpers.material_reservation import InsufficientStockError
+from ..helpers.turnover_moving_material import turnover_moving_materials
+from ..models import MaterialBalance
+from ..models import Turnover
+from .factory import EntranceFactory
+from .factory import MaterialCategoryFactory
+from .factory import MaterialFactory
+from .factory import TurnoverFactory
+from .factory import UnitFactory
+from .factory import WarehouseFactory
+
+
+class MaterialReservationTestCase(TransactionTestCase):
+    """Параллельные списания одного остатка: списывается не больше, чем есть, остаток не уходит в минус"""
+
+    def setUp(self):
+        self.user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        self.material1 = MaterialFactory(unit=unit, category=category)
+        self.material2 = MaterialFactory(unit=unit, category=category, name="Масло моторное TOYOTA 5w20")
+        self.warehouse = WarehouseFactory()
+        self.warehouse2 = WarehouseFactory(name="Склад 2")
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=self.user, responsible=responsible)
+        for material in (self.material1, self.material2):
+            TurnoverFactory(
+                user=self.user,
+                type=COMING,
+                material=material,
+                warehouse=self.warehouse,
+                entrance=entrance,
+                quantity=5,
+                sum=50,
+            )
+
+    def assert_balances(self, quantities: dict):
+        balances = MaterialBalance.objects.filter(warehouse=self.warehouse).order_by("material_id")
+        self.assertEqual({balance.material_id: balance.quantity for balance in balances}, quantities)
+        self.assertEqual(get_material_balance_mismatches(), [])
+
+    def test_concurrent_moving(self):
+        def move(number):
+            materials = [self.material1.pk, self.material2.pk]
+            # Половина потоков передаёт материалы в обратном порядке: блокировки всё равно берутся в одном
+            if number % 2:
+                materials.reverse()
+
+            return turnover_moving_materials(
+                {
+                    "date": date(2022, 1, 2),
+                    "warehouse_outgoing": self.warehouse.pk,
+                    "warehouse_incoming": self.warehouse2.pk,
+                    "materials": [
+                        {"material": material_pk, "price": 10, "quantity": 1, "sum": 10} for material_pk in materials
+                    ],
+                },
+                self.user,
+            )
+
+        results = run_concurrently(move)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(len(errors), THREADS_COUNT - 5)
+        self.assertTrue(all(isinstance(error, InsufficientStockError) for error in errors), errors)
+        self.assert_balances({self.material1.pk: Decimal("0.00"), self.material2.pk: Decimal("0.00")})
+
+    def test_concurrent_opposite_moving(self):
+        entrance = EntranceFactory(user=self.user, responsible=EmployeeFactory(number_in_kadry=3))
+        TurnoverFactory(
+            user=self.user,
+            type=COMING,
+            material=self.material1,
+            warehouse=self.warehouse2,
+            entrance=entrance,
+            quantity=5,
+            sum=50,
+        )
+
+        def move(number):
+            # Встречные перемещения: остатки обоих складов блокируются в одном порядке
+            warehouses = [self.warehouse.pk, self.warehouse2.pk]
+            if number % 2:
+                warehouses.reverse()
+
+            return turnover_moving_materials(
+                {
+                    "date": date(2022, 1, 2),
+                    "warehouse_outgoing": warehouses[0],
+                    "warehouse_incoming": warehouses[1],
+                    "materials": [{"material": self.material1.pk, "price": 10, "quantity": 1, "sum": 10}],
+                },
+                self.user,
+            )
+
+        results = run_concurrently(move)
+
+        # Без взаимоблокировок: перемещение выполняется или не проходит по остатку
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertTrue(all(isinstance(error, InsufficientStockError) for error in errors), errors)
+        balances = MaterialBalance.objects.filter(material=self.material1).values_list("quantity", flat=True)
+        self.assertTrue(all(quantity >= 0 for quantity in balances))
+        self.assertEqual(sum(balances), Decimal("10.00"))
+        self.assertEqual(get_material_balance_mismatches(), [])
+
+    def test_concurrent_turnover_save(self):
+        def expense(number):
+            with transaction.atomic():
+                Turnover(
+                    user=self.user,
+                    type=EXPENSE,
+                    date=date(2022, 1, 2),
+                    is_correction=True,
+                    note="Списание",
+                    material=self.material1,
+                    warehouse=self.warehouse,
+                    price=10,
+                    quantity=2,
+                    sum=20,
+                ).save()
+            return True
+
+        results = run_concurrently(expense)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(results.count(True), 2)
+        self.assertTrue(all(isinstance(error, InsufficientStockError) for error in errors), errors)
+        self.assert_balances({self.material1.pk: Decimal("1.00"), self.material2.pk: Decimal("5.00")})
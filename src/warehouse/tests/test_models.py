@@ -1,11 +1,31 @@
+import re
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.models import PROTECT
 from django.test import TestCase
 
 from app.helpers.testing import get_test_user
+from core.tests.factory import CarFactory
 from core.tests.factory import EmployeeFactory
+from orders.tests.factory import OrderFactory
+from orders.tests.factory import PostFactory
 
 from ..constants import COMING
+from ..constants import EXPENSE
 from ..constants import TURNOVER_TYPE
+from ..helpers.material_balance import get_material_balance_mismatches
+from ..helpers.material_consumption import refresh_material_consumption
+from ..helpers.material_snapshot import close_material_periods
+from ..helpers.material_utils import get_last_price
+from ..helpers.material_utils import get_material_prices
+from ..helpers.material_utils import get_material_remains
+from ..models import MaterialBalance
+from ..models import MaterialBalanceSnapshot
+from ..models import MaterialConsumption
+from ..models import MaterialLastPrice
 from .factory import EntranceFactory
 from .factory import MaterialCategoryFactory
 from .factory import MaterialFactory
@@ -188,3 +208,268 @@ class TurnoverModelTestCase(TestCase):
 
         entrance_blank = self.turnover._meta.get_field("entrance").blank
         self.assertEqual(entrance_blank, True)
+
+    def test_explain_hot_queries_command(self):
+        out = StringIO()
+        call_command("explain_hot_queries", "--no-seqscan", verbosity=2, stdout=out)
+        self.assertIn("последовательного чтения нет", out.getvalue())
+        self.assertIn("get_report_materials_queryset: OK", out.getvalue())
+        # В итоге число выполненных и проверенных запросов, а не функций
+        self.assertEqual(
+            out.getvalue().count(": OK\n"), int(re.search(r"Проверено запросов: (\d+)", out.getvalue())[1])
+        )
+
+
+class MaterialBalanceModelTestCase(TestCase):
+    def setUp(self):
+        self.user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        self.material = MaterialFactory(unit=unit, category=category)
+        self.warehouse = WarehouseFactory()
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        self.entrance = EntranceFactory(user=self.user, responsible=responsible)
+
+    def test_update_on_turnover_save_and_delete(self):
+        TurnoverFactory(
+            user=self.user, type=COMING, material=self.material, warehouse=self.warehouse, entrance=self.entrance
+        )
+        correction = TurnoverFactory(
+            user=self.user,
+            type=EXPENSE,
+            is_correction=True,
+            note="Списание",
+            material=self.material,
+            warehouse=self.warehouse,
+            quantity=0.5,
+            sum=5.0,
+        )
+
+        balance = MaterialBalance.objects.get(material=self.material, warehouse=self.warehouse)
+        self.assertEqual(float(balance.quantity), 1.5)
+        self.assertEqual(float(balance.sum), 15.0)
+
+        correction.delete()
+
+        balance.refresh_from_db()
+        self.assertEqual(float(balance.quantity), 2.0)
+        self.assertEqual(float(balance.sum), 20.0)
+
+    def test_rebuild_command(self):
+        TurnoverFactory(
+            user=self.user, type=COMING, material=self.material, warehouse=self.warehouse, entrance=self.entrance
+        )
+        MaterialBalance.objects.all().update(quantity=0, sum=0)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_material_balances", "--verify", stdout=StringIO())
+
+        call_command("rebuild_material_balances", stdout=StringIO())
+
+        balance = MaterialBalance.objects.get(material=self.material, warehouse=self.warehouse)
+        self.assertEqual(float(balance.quantity), 2.0)
+        self.assertEqual(float(balance.sum), 20.0)
+
+
+class MaterialBalanceSnapshotModelTestCase(TestCase):
+    def setUp(self):
+        self.user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        self.material = MaterialFactory(unit=unit, category=category)
+        self.warehouse = WarehouseFactory()
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        self.entrance = EntranceFactory(user=self.user, responsible=responsible)
+
+        TurnoverFactory(
+            user=self.user, type=COMING, material=self.material, warehouse=self.warehouse, entrance=self.entrance
+        )
+        TurnoverFactory(
+            user=self.user,
+            type=COMING,
+            date="2022-03-10",
+            material=self.material,
+            warehouse=self.warehouse,
+            entrance=self.entrance,
+        )
+
+    def test_close_periods(self):
+        call_command("close_material_periods", stdout=StringIO())
+
+        snapshots = MaterialBalanceSnapshot.objects.filter(material=self.material, warehouse=self.warehouse)
+        self.assertEqual(
+            [(snapshot.period, float(snapshot.quantity)) for snapshot in snapshots],
+            [(date(2022, 3, 31), 4.0), (date(2022, 1, 31), 2.0)],
+        )
+
+        self.assertEqual(float(get_material_remains(self.material.pk, self.warehouse.pk, date(2022, 2, 15))), 2.0)
+        self.assertEqual(float(get_material_remains(self.material.pk, None, date(2022, 4, 1))), 4.0)
+
+    def test_backdated_turnover(self):
+        call_command("close_material_periods", stdout=StringIO())
+
+        TurnoverFactory(
+            user=self.user,
+            type=EXPENSE,
+            date="2022-02-01",
+            is_correction=True,
+            note="Списание",
+            material=self.material,
+            warehouse=self.warehouse,
+            quantity=0.5,
+            sum=5.0,
+        )
+
+        snapshots = MaterialBalanceSnapshot.objects.filter(material=self.material, warehouse=self.warehouse)
+        self.assertEqual([float(snapshot.quantity) for snapshot in snapshots], [3.5, 2.0])
+        self.assertEqual(float(get_material_remains(self.material.pk, self.warehouse.pk, date(2022, 2, 15))), 1.5)
+        self.assertEqual(float(get_material_remains(self.material.pk, self.warehouse.pk, date(2022, 3, 31))), 3.5)
+
+    def test_backdated_turnover_after_last_snapshot(self):
+        # У второго материала последний снимок - январь, а закрыто по март (март - у первого материала)
+        material = MaterialFactory(unit=self.material.unit, category=self.material.category, name="Фильтр масляный")
+        TurnoverFactory(
+            user=self.user, type=COMING, material=material, warehouse=self.warehouse, entrance=self.entrance
+        )
+        close_material_periods(date(2022, 4, 1))
+
+        for date_ in ("2022-02-15", "2022-04-10"):
+            TurnoverFactory(
+                user=self.user,
+                type=COMING,
+                date=date_,
+                material=material,
+                warehouse=self.warehouse,
+                entrance=self.entrance,
+            )
+        close_material_periods(date(2022, 5, 1))
+
+        snapshots = MaterialBalanceSnapshot.objects.filter(material=material, warehouse=self.warehouse)
+        self.assertEqual(
+            [(snapshot.period, float(snapshot.quantity)) for snapshot in snapshots],
+            [(date(2022, 4, 30), 6.0), (date(2022, 2, 28), 4.0), (date(2022, 1, 31), 2.0)],
+        )
+        self.assertEqual(float(get_material_remains(material.pk, self.warehouse.pk, date(2022, 3, 31))), 4.0)
+        self.assertEqual(float(get_material_remains(material.pk, self.warehouse.pk, date(2022, 4, 30))), 6.0)
+        self.assertEqual(get_material_balance_mismatches(), [])
+
+
+class MaterialLastPriceModelTestCase(TestCase):
+    def setUp(self):
+        self.user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        self.material = MaterialFactory(unit=unit, category=category)
+        self.warehouse1 = WarehouseFactory()
+        self.warehouse2 = WarehouseFactory(name="Склад 2")
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        self.entrance = EntranceFactory(user=self.user, responsible=responsible)
+
+    def test_update_on_entrance_turnovers(self):
+        TurnoverFactory(
+            user=self.user, type=COMING, material=self.material, warehouse=self.warehouse1, entrance=self.entrance
+        )
+        last_turnover = TurnoverFactory(
+            user=self.user,
+            type=COMING,
+            date="2022-02-01",
+            material=self.material,
+            warehouse=self.warehouse2,
+            entrance=self.entrance,
+            price=15.0,
+            quantity=2.0,
+            sum=30.0,
+        )
+
+        self.assertEqual(MaterialLastPrice.objects.filter(material=self.material).count(), 3)
+        self.assertEqual(float(get_last_price(self.material.pk, self.warehouse1.pk)), 10.0)
+        self.assertEqual(float(get_last_price(self.material.pk, self.warehouse2.pk)), 15.0)
+        self.assertEqual(float(get_material_prices(self.material.pk)["last_price"]), 15.0)
+
+        last_turnover.delete()
+
+        self.assertEqual(MaterialLastPrice.objects.filter(material=self.material).count(), 2)
+        self.assertEqual(get_last_price(self.material.pk, self.warehouse2.pk), 0.00)
+        self.assertEqual(float(get_material_prices(self.material.pk)["last_price"]), 10.0)
+
+
+class MaterialConsumptionModelTestCase(TestCase):
+    def setUp(self):
+        self.user = get_test_user()
+
+        unit = UnitFactory()
+        category = MaterialCategoryFactory()
+        self.material = MaterialFactory(unit=unit, category=category)
+        self.warehouse = WarehouseFactory()
+
+        responsible = EmployeeFactory(number_in_kadry=2, type=3, position="Начальник")
+        entrance = EntranceFactory(user=self.user, responsible=responsible)
+        TurnoverFactory(
+            user=self.user,
+            type=COMING,
+            material=self.material,
+            warehouse=self.warehouse,
+            entrance=entrance,
+            quantity=100.0,
+            sum=1000.0,
+        )
+
+        driver = EmployeeFactory(type=1, position="Водитель")
+        self.order = OrderFactory(
+            user=self.user, post=PostFactory(), car=CarFactory(), driver=driver, responsible=responsible
+        )
+        for date_, quantity in (("2022-01-10", 9.0), ("2022-03-01", 18.0)):
+            self.add_expense(date_, quantity)
+
+    def add_expense(self, date_, quantity):
+        return TurnoverFactory(
+            user=self.user,
+            type=EXPENSE,
+            date=date_,
+            material=self.material,
+            warehouse=self.warehouse,
+            order=self.order,
+            quantity=quantity,
+            sum=quantity * 10,
+        )
+
+    def get_consumption(self):
+        consumption = MaterialConsumption.objects.get(material=self.material, warehouse=self.warehouse)
+        return consumption.date_end, float(consumption.quantity)
+
+    def test_refresh(self):
+        # Списаний за последние 90 дней нет
+        call_command("refresh_material_consumption", stdout=StringIO())
+        self.assertFalse(MaterialConsumption.objects.exists())
+
+        refresh_material_consumption(today=date(2022, 3, 2), rebuild=True)
+        self.assertEqual(self.get_consumption(), (date(2022, 3, 1), 27.0))
+
+        # Списание 10.01 ещё в окне 90 дней по 09.04
+        refresh_material_consumption(today=date(2022, 4, 10))
+        self.assertEqual(self.get_consumption(), (date(2022, 4, 9), 27.0))
+
+        refresh_material_consumption(today=date(2022, 4, 12))
+        self.assertEqual(self.get_consumption(), (date(2022, 4, 11), 18.0))
+
+        refresh_material_consumption(today=date(2022, 4, 12), rebuild=True)
+        self.assertEqual(self.get_consumption(), (date(2022, 4, 11), 18.0))
+
+    def test_backdated_expense(self):
+        refresh_material_consumption(today=date(2022, 3, 2))
+
+        turnover = self.add_expense("2022-02-01", 3.0)
+        self.assertEqual(self.get_consumption(), (date(2022, 3, 1), 30.0))
+
+        # Списание после окна учтётся при следующем сдвиге окна
+        self.add_expense("2022-03-05", 1.0)
+        self.assertEqual(self.get_consumption(), (date(2022, 3, 1), 30.0))
+
+        turnover.delete()
+        self.assertEqual(self.get_consumption(), (date(2022, 3, 1), 27.0))
@@ -1,17 +1,26 @@
 from django.urls import path
 
 from .api.views import EntranceDetailView
+from .api.views import EntranceImportView
 from .api.views import EntranceListView
+from .api.views import MaterialAvailabilityListView
 from .api.views import MaterialCategoryDetailView
 from .api.views import MaterialCategoryListView
 from .api.views import MaterialDetailView
 from .api.views import MaterialListView
 from .api.views import MaterialRemainsCategoryListView
 from .api.views import MaterialRemainsListView
+from .api.views import MaterialReorderListView
 from .api.views import ProviderListView
+from .api.views import StocktakeDetailView
+from .api.views import StocktakeLineListView
+from .api.views import StocktakeListView
+from .api.views import StocktakePostView
 from .api.views import TurnoverDetailView
+from .api.views import TurnoverExportView
 from .api.views import TurnoverListView
 from .api.views import TurnoverMaterialListView
+from .api.views import TurnoverMovingMaterialsView
 from .api.views import TurnoverMovingMaterialView
 from .api.views import UnitDetailView
 from .api.views import UnitListView
@@ -28,12 +37,21 @@ urlpatterns = [
     path("api/warehouse/material/", MaterialListView.as_view(), name="material-list"),
     path("api/warehouse/material/remains/", MaterialRemainsListView.as_view(), name="material-remains-list"),
     path("api/warehouse/material/remains_category/", MaterialRemainsCategoryListView.as_view(), name="material-remains-category-list"),
+    path("api/warehouse/material/reorder/", MaterialReorderListView.as_view(), name="material-reorder-list"),
+    path("api/warehouse/material/availability/", MaterialAvailabilityListView.as_view(), name="material-availability-list"),
     path("api/warehouse/material/<int:pk>", MaterialDetailView.as_view(), name="material-detail"),
     path("api/warehouse/entrance/", EntranceListView.as_view(), name="entrance-list"),
     path("api/warehouse/entrance/<int:pk>", EntranceDetailView.as_view(), name="entrance-detail"),
+    path("api/warehouse/entrance/import/", EntranceImportView.as_view(), name="entrance-import"),
     path("api/warehouse/entrance/providers/", ProviderListView.as_view(), name="entrance-provider-list"),
+    path("api/warehouse/stocktake/", StocktakeListView.as_view(), name="stocktake-list"),
+    path("api/warehouse/stocktake/<int:pk>", StocktakeDetailView.as_view(), name="stocktake-detail"),
+    path("api/warehouse/stocktake/<int:pk>/lines/", StocktakeLineListView.as_view(), name="stocktake-line-list"),
+    path("api/warehouse/stocktake/<int:pk>/post/", StocktakePostView.as_view(), name="stocktake-post"),
     path("api/warehouse/turnover/", TurnoverListView.as_view(), name="turnover-list"),
     path("api/warehouse/turnover/<int:pk>", TurnoverDetailView.as_view(), name="turnover-detail"),
     path("api/warehouse/turnover/material/", TurnoverMaterialListView.as_view(), name="turnover-material-list"),
+    path("api/warehouse/turnover/export/", TurnoverExportView.as_view(), name="turnover-export"),
     path("api/warehouse/turnover/moving_material/", TurnoverMovingMaterialView.as_view(), name="turnover-moving-material"),
+    path("api/warehouse/turnover/moving_materials/", TurnoverMovingMaterialsView.as_view(), name="turnover-moving-materials"),
 ]